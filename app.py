@@ -1,41 +1,46 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (Flask, Blueprint, current_app, render_template, request, redirect, url_for,
+                   flash, session, jsonify, Response, stream_with_context, make_response)
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import time
 import sqlite3
 
-def check_and_create_tables():
-    """Проверяет и создает таблицы при необходимости"""
-    with app.app_context():
-        inspector = db.inspect(db.engine)
-        existing_tables = inspector.get_table_names()
-        
-        required_tables = ['users', 'categories', 'products']
-        
-        # Если отсутствуют какие-то таблицы
-        if not all(table in existing_tables for table in required_tables):
-            print("Создание недостающих таблиц...")
-            db.create_all()
-            
-            # Добавляем тестовые данные только если таблица users пуста
-            if 'users' in existing_tables and not User.query.first():
-                add_test_data()
-                print("✓ Тестовые данные добавлены")
-            elif 'users' not in existing_tables:
-                add_test_data()
-                print("✓ Таблицы и тестовые данные созданы")
-        else:
-            print("✓ Все таблицы существуют")
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'warehouse-secret-key-2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///warehouse_new.db'  # НОВОЕ ИМЯ ФАЙЛА
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+from search_index import (register_search_index, search_index_available,
+                          rebuild_search_index, fts_filter, MIN_QUERY_LENGTH)
+from pagination import paginate, page_size, normalize_sort, InvalidCursor
+import instrumentation
+import metrics
+from slow_queries import slow_query_log, full_scan_report, read_records
+from stats import catalog_stats
+from view_counter import view_counter
+from export import iter_product_batches, export_chunks, FORMATS as EXPORT_FORMATS
+import click
+from catalog_version import current_versions, bump_version, make_etag, STAMP_ID, VIEWS_STAMP_ID
+from category_cache import category_cache
+from config import Config
+from bulk_import import import_products, detect_format, UnreadableFile, FORMATS as IMPORT_FORMATS
+import io
+from passwords import password_hasher, HashingBusy
+from principal_cache import principal_cache, register_auth_stamp
+import db_tuning
+import migrations
+from synthetic_data import generate_catalog, is_empty
+import read_replica
+from read_replica import (RoutingSession, replica_reads, refresh_replica, refresh_periodically,
+                          REPLICA_BIND)
+from autocomplete import autocomplete_index, register_change_log
+from batch_update import apply_batch
+from optimistic import VersionConflict, parse_version, update_versioned
+from stock import (KINDS as STOCK_KINDS, InsufficientStock, signed_delta, move_stock, take_snapshot,
+                   stock_level, register_opening_balance)
+
+# Чтения помеченных представлений могут идти в реплику (см. read_replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+bp = Blueprint('main', __name__, cli_group=None)
 
 
 # Модели
@@ -59,6 +64,19 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    # Индексы под сортировки списка товаров (pagination.SORT_OPTIONS), в том
+    # числе внутри категории. id добавлять не нужно: SQLite хранит rowid в
+    # каждом индексе, он же доуточняет порядок.
+    __table_args__ = (
+        db.Index('ix_products_views_count', 'views_count'),
+        db.Index('ix_products_price', 'price'),
+        db.Index('ix_products_created_at', 'created_at'),
+        db.Index('ix_products_name', 'name'),
+        db.Index('ix_products_category_views_count', 'category_id', 'views_count'),
+        db.Index('ix_products_category_price', 'category_id', 'price'),
+        db.Index('ix_products_category_created_at', 'category_id', 'created_at'),
+        db.Index('ix_products_category_name', 'category_id', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -69,6 +87,51 @@ class Product(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     views_count = db.Column(db.Integer, default=0)
+    # Версия карточки товара для оптимистичной блокировки (см. optimistic.py).
+    # Движения остатка и просмотры ее не меняют: они применяются как приращения
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+
+class StockMovement(db.Model):
+    """Журнал движения товаров (см. stock.py)"""
+    __tablename__ = 'stock_movements'
+    __table_args__ = (
+        db.Index('ix_stock_movements_product', 'product_id', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # receive, ship, adjust
+    delta = db.Column(db.Integer, nullable=False)
+    quantity_after = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(200))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class StockSnapshot(db.Model):
+    """Остаток товара на момент снимка и последнее учтенное движение"""
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (
+        db.Index('ix_stock_snapshots_product', 'product_id', 'movement_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+register_search_index(Product.__table__)
+register_auth_stamp(User.__table__)
+register_change_log(Product.__table__)
+register_opening_balance(Product, StockMovement.__table__)
 
 
 # Декораторы
@@ -77,7 +140,7 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Для доступа необходимо войти в систему', 'warning')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
 
     return decorated_function
@@ -88,17 +151,65 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Для доступа необходимо войти в систему', 'warning')
-            return redirect(url_for('login'))
-        # Используем новую версию запроса без .get()
-        user = db.session.get(User, session['user_id'])
+            return redirect(url_for('main.login'))
+        # Права берутся из кэша principal: вместо строки пользователя читается версия учетных записей
+        user = principal_cache.get(session['user_id'])
         if not user or not user.is_admin:
             flash('Требуются права администратора', 'danger')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         return f(*args, **kwargs)
 
     return decorated_function
 
 
+def catalog_conditional(views_shown):
+    """Отвечает 304, если каталог не менялся с прошлого запроса клиента
+
+    views_shown() — показывает ли ответ просмотры или сортирует по ним:
+    тогда ETag зависит и от версии просмотров, которую увеличивает сброс
+    счетчиков (см. view_counter.py).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Страница с непоказанными сообщениями всегда рендерится заново
+            if '_flashes' in session:
+                return f(*args, **kwargs)
+
+            stamp_ids = (STAMP_ID, VIEWS_STAMP_ID) if views_shown() else (STAMP_ID,)
+            versions, updated_at = current_versions(db.session, CatalogVersion, stamp_ids)
+            etag = make_etag(versions, request.full_path,
+                             session.get('user_id'), session.get('is_admin', False))
+            last_modified = updated_at.replace(microsecond=0) if updated_at else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (last_modified is not None and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since.replace(tzinfo=None))
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return decorated_function
+    return decorator
+
+
+def sorted_by_views():
+    return normalize_sort(request.args.get('sort')) == 'views_count'
+
+
 def create_database():
     """Создает новую базу данных гарантированно"""
     print("=" * 60)
@@ -117,7 +228,7 @@ def create_database():
     # Создаем все таблицы
     try:
         with app.app_context():
-            db.create_all()
+            migrations.migrate(db.engine, db.metadata)
             print("✓ Таблицы созданы успешно")
 
             # Добавляем тестовые данные
@@ -141,14 +252,14 @@ def add_test_data():
     admin = User(
         username='admin',
         email='admin@warehouse.com',
-        password_hash=generate_password_hash('admin123'),
+        password_hash=password_hasher.hash('admin123'),
         is_admin=True
     )
 
     user = User(
         username='user',
         email='user@warehouse.com',
-        password_hash=generate_password_hash('user123'),
+        password_hash=password_hasher.hash('user123'),
         is_admin=False
     )
 
@@ -215,13 +326,21 @@ def add_test_data():
     db.session.commit()
 
 
+def prepare_database(seed=False, log=print):
+    """Приводит схему к последней версии; при seed добавляет тестовые данные в пустую базу"""
+    migrations.migrate(db.engine, db.metadata, log=log)
+    if seed:
+        add_test_data()
+        log("✓ Тестовые данные добавлены")
+
+
 # Маршруты
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -231,17 +350,23 @@ def register():
         # Проверка существования пользователя
         if User.query.filter_by(username=username).first():
             flash('Имя пользователя уже занято', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         if User.query.filter_by(email=email).first():
             flash('Email уже используется', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
+
+        try:
+            password_hash = password_hasher.hash(password)
+        except HashingBusy:
+            flash('Сервер перегружен, попробуйте позже', 'warning')
+            return render_template('register.html'), 503
 
         # Создаем пользователя
         user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password),
+            password_hash=password_hash,
             is_admin=False
         )
 
@@ -249,12 +374,12 @@ def register():
         db.session.commit()
 
         flash('Регистрация успешна! Войдите в систему.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -263,105 +388,134 @@ def login():
         # Ищем пользователя
         user = User.query.filter_by(username=username).first()
 
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password_hash, password)
+        except HashingBusy:
+            flash('Сервер перегружен, попробуйте позже', 'warning')
+            return render_template('login.html'), 503
+
+        if valid:
+            # Хэш со старыми параметрами заменяем, пока пароль известен
+            if password_hasher.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = password_hasher.hash(password)
+                    db.session.commit()
+                except HashingBusy:
+                    pass  # перехэшируем при следующем входе
+
             session['user_id'] = user.id
             session['username'] = user.username
             session['is_admin'] = user.is_admin
             flash('Вход выполнен успешно!', 'success')
-            return redirect(url_for('search'))
+            return redirect(url_for('main.search'))
         else:
             flash('Неверное имя пользователя или пароль', 'danger')
 
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
     flash('Вы вышли из системы', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/search')
+@bp.route('/search')
 @login_required
+@replica_reads
+# Карточки в результатах показывают число просмотров при любой сортировке
+@catalog_conditional(views_shown=lambda: True)
 def search():
     query = request.args.get('q', '')
     category_id = request.args.get('category', '')
     sort_by = request.args.get('sort', 'views_count')
+    mode = request.args.get('mode', current_app.config['SEARCH_MODE'])
 
-    # Базовый запрос
-    products_query = Product.query
+    # Базовый запрос (категории загружаются тем же запросом)
+    products_query = Product.query.options(joinedload(Product.category))
 
     # Фильтрация
     if query:
-        products_query = products_query.filter(
-            Product.name.contains(query) |
-            Product.description.contains(query) |
-            Product.sku.contains(query)
-        )
+        if (mode == 'fts' and len(query) >= MIN_QUERY_LENGTH
+                and search_index_available(db.engine)):
+            products_query = products_query.filter(fts_filter(Product.id, query))
+        else:
+            products_query = products_query.filter(
+                Product.name.contains(query) |
+                Product.description.contains(query) |
+                Product.sku.contains(query)
+            )
 
     if category_id:
         products_query = products_query.filter_by(category_id=category_id)
 
-    # Сортировка
-    if sort_by == 'name':
-        products_query = products_query.order_by(Product.name)
-    elif sort_by == 'price_asc':
-        products_query = products_query.order_by(Product.price)
-    elif sort_by == 'price_desc':
-        products_query = products_query.order_by(Product.price.desc())
-    elif sort_by == 'date':
-        products_query = products_query.order_by(Product.created_at.desc())
-    else:  # views_count
-        products_query = products_query.order_by(Product.views_count.desc())
-
-    products = products_query.all()
-    categories = Category.query.all()
+    # Сортировка и пагинация
+    per_page = page_size(request.args.get('per_page'),
+                         current_app.config['PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+    try:
+        page = paginate(products_query, Product, sort_by,
+                        cursor=request.args.get('cursor'), limit=per_page)
+    except InvalidCursor:
+        flash('Ссылка на страницу устарела, показана первая страница', 'warning')
+        page = paginate(products_query, Product, sort_by, limit=per_page)
+
+    categories = category_cache.all()
 
     return render_template('search.html',
-                           products=products,
+                           products=page.items,
+                           page=page,
+                           per_page=per_page,
                            categories=categories,
                            query=query,
                            category_id=category_id,
                            sort_by=sort_by)
 
 
-@app.route('/product/<int:product_id>')
+@bp.route('/product/<int:product_id>')
 @login_required
+@replica_reads
 def product_detail(product_id):
     product = db.session.get(Product, product_id)
     if not product:
         flash('Товар не найден', 'danger')
-        return redirect(url_for('search'))
+        return redirect(url_for('main.search'))
 
-    # Увеличиваем счетчик просмотров
-    product.views_count += 1
-    db.session.commit()
+    # Просмотр копится в буфере и пишется в БД пакетом
+    view_counter.increment(product.id)
+    views_count = (product.views_count or 0) + view_counter.pending(product.id)
 
-    return render_template('product_detail.html', product=product)
+    return render_template('product_detail.html', product=product, views_count=views_count)
 
 
-@app.route('/admin')
+@bp.route('/admin')
 @admin_required
+@replica_reads
 def admin():
-    products = Product.query.all()
-    categories = Category.query.all()
-
-    # Статистика
-    stats = {
-        'total_products': len(products),
-        'total_quantity': sum(p.quantity for p in products),
-        'total_value': sum(p.price * p.quantity for p in products),
-        'total_views': sum(p.views_count for p in products)
-    }
+    sort_by = request.args.get('sort', 'date')
+    per_page = page_size(request.args.get('per_page'),
+                         current_app.config['PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+    products_query = Product.query.options(joinedload(Product.category))
+    try:
+        page = paginate(products_query, Product, sort_by,
+                        cursor=request.args.get('cursor'), limit=per_page)
+    except InvalidCursor:
+        page = paginate(products_query, Product, sort_by, limit=per_page)
+    categories = category_cache.all()
+
+    # Статистика считается в БД, без загрузки всего каталога
+    stats = catalog_stats(db.session, Product)
 
     return render_template('admin.html',
-                           products=products,
+                           products=page.items,
+                           page=page,
+                           per_page=per_page,
+                           sort_by=normalize_sort(sort_by),
                            categories=categories,
                            stats=stats)
 
 
-@app.route('/admin/product/add', methods=['GET', 'POST'])
+@bp.route('/admin/product/add', methods=['GET', 'POST'])
 @admin_required
 def add_product():
     if request.method == 'POST':
@@ -374,107 +528,513 @@ def add_product():
             price = float(request.form['price'])
             category_id = request.form.get('category_id')
 
+            if quantity < 0:
+                flash('Количество не может быть отрицательным', 'danger')
+                return redirect(url_for('main.add_product'))
+
             # Проверка SKU
             if Product.query.filter_by(sku=sku).first():
                 flash('Артикул должен быть уникальным', 'danger')
-                return redirect(url_for('add_product'))
+                return redirect(url_for('main.add_product'))
 
             product = Product(
                 name=name,
                 description=description,
                 detailed_specs=detailed_specs,
                 sku=sku,
-                quantity=quantity,
+                quantity=0,
                 price=price,
                 category_id=category_id if category_id else None
             )
 
             db.session.add(product)
+            db.session.flush()
+            # Начальный остаток — первый приход в журнале движения
+            if quantity:
+                move_stock(db.session, Product, StockMovement, product.id, 'receive', quantity,
+                           reason='Новый товар', user_id=session['user_id'])
+            bump_version(db.session, CatalogVersion)
             db.session.commit()
 
             flash('Товар успешно добавлен', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
 
         except Exception as e:
+            db.session.rollback()
             flash(f'Ошибка: {str(e)}', 'danger')
 
-    categories = Category.query.all()
+    categories = category_cache.all()
     return render_template('add_product.html', categories=categories)
 
 
-@app.route('/admin/product/edit/<int:id>', methods=['GET', 'POST'])
+@bp.route('/admin/product/edit/<int:id>', methods=['GET', 'POST'])
 @admin_required
 def edit_product(id):
     product = db.session.get(Product, id)
     if not product:
         flash('Товар не найден', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
 
+    status = 200
     if request.method == 'POST':
         try:
-            product.name = request.form['name']
-            product.description = request.form['description']
-            product.detailed_specs = request.form.get('detailed_specs', '')
-            product.sku = request.form['sku']
-            product.quantity = int(request.form['quantity'])
-            product.price = float(request.form['price'])
-            product.category_id = request.form.get('category_id')
+            values = {
+                'name': request.form['name'],
+                'description': request.form['description'],
+                'detailed_specs': request.form.get('detailed_specs', ''),
+                'sku': request.form['sku'],
+                'price': float(request.form['price']),
+                'category_id': request.form.get('category_id') or None,
+            }
+            # Версия, с которой открыта форма; старые формы без нее сравниваются с текущей
+            version = parse_version(request.form.get('version', product.version))
+            quantity = int(request.form['quantity'])
+            shown = int(request.form.get('shown_quantity', product.quantity or 0))
+
+            update_versioned(db.session, Product, product.id, version, values)
+            # Остаток меняется на разницу с показанным в форме значением, а не
+            # перезаписывается: движения, прошедшие пока форма была открыта, сохраняются
+            if quantity != shown:
+                move_stock(db.session, Product, StockMovement, product.id, 'adjust',
+                           quantity - shown, reason='Правка товара', user_id=session['user_id'])
 
+            bump_version(db.session, CatalogVersion)
             db.session.commit()
             flash('Товар обновлен', 'success')
-            return redirect(url_for('admin'))
-
+            return redirect(url_for('main.admin'))
+
+        except VersionConflict:
+            db.session.rollback()
+            flash('Товар успел изменить другой пользователь. Проверьте текущие данные '
+                  'и сохраните изменения снова', 'warning')
+            status = 409
+        except InsufficientStock as e:
+            db.session.rollback()
+            flash(f'Недостаточно товара на складе: доступно {e.available}', 'danger')
         except Exception as e:
+            db.session.rollback()
             flash(f'Ошибка: {str(e)}', 'danger')
 
-    categories = Category.query.all()
-    return render_template('edit_product.html', product=product, categories=categories)
+    categories = category_cache.all()
+    return render_template('edit_product.html', product=product, categories=categories), status
 
 
-@app.route('/admin/product/delete/<int:id>')
+@bp.route('/admin/product/delete/<int:id>')
 @admin_required
 def delete_product(id):
     product = db.session.get(Product, id)
     if not product:
         flash('Товар не найден', 'danger')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
 
     name = product.name
     db.session.delete(product)
+    bump_version(db.session, CatalogVersion)
     db.session.commit()
 
     flash(f'Товар "{name}" удален', 'success')
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
+
+
+@bp.route('/admin/products/import', methods=['POST'])
+@admin_required
+def import_products_view():
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'file is required'}), 400
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': 'unsupported format'}), 400
+
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        report = import_products(db.engine, Product.__table__, Category.__table__,
+                                 StockMovement.__table__, lines, fmt=fmt,
+                                 batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                                 user_id=session['user_id'])
+    except UnreadableFile as e:
+        report, error = e.report, str(e)
+    else:
+        error = None
+    if report.created or report.updated:
+        bump_version(db.session, CatalogVersion)
+        db.session.commit()
+    if error:
+        return jsonify({'error': error, **report.as_dict()}), 400
+    return jsonify(report.as_dict())
 
 
 # API
-@app.route('/api/products')
+@bp.route('/api/products')
 @login_required
+@replica_reads
+@catalog_conditional(views_shown=sorted_by_views)
 def api_products():
-    products = Product.query.all()
-    return jsonify([{
+    sort_by = normalize_sort(request.args.get('sort'))
+    per_page = page_size(request.args.get('per_page'),
+                         current_app.config['PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+    try:
+        page = paginate(Product.query.options(joinedload(Product.category)), Product, sort_by,
+                        cursor=request.args.get('cursor'), limit=per_page)
+    except InvalidCursor:
+        return jsonify({'error': 'invalid cursor'}), 400
+
+    response = jsonify([{
         'id': p.id,
         'name': p.name,
         'sku': p.sku,
         'quantity': p.quantity,
         'price': p.price,
+        'version': p.version,
         'category': p.category.name if p.category else 'Без категории'
-    } for p in products])
+    } for p in page.items])
+
+    # Курсоры соседних страниц передаются в заголовке Link (RFC 8288)
+    links = []
+    for rel, cursor in (('next', page.next_cursor), ('prev', page.prev_cursor)):
+        if cursor:
+            url = url_for('main.api_products', sort=sort_by, per_page=per_page,
+                          cursor=cursor, _external=True)
+            links.append(f'<{url}>; rel="{rel}"')
+    if links:
+        response.headers['Link'] = ', '.join(links)
+    return response
+
+
+@bp.route('/api/products/autocomplete')
+@login_required
+def api_products_autocomplete():
+    # Ответ строится по индексу в памяти процесса, без запроса LIKE к products
+    limit = page_size(request.args.get('limit'), current_app.config['AUTOCOMPLETE_LIMIT'],
+                      current_app.config['AUTOCOMPLETE_MAX_LIMIT'])
+    suggestions = autocomplete_index.complete(request.args.get('q', ''), limit)
+    return jsonify([suggestion._asdict() for suggestion in suggestions])
+
+
+@bp.route('/api/products/export')
+@login_required
+@replica_reads
+def api_products_export():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'unsupported format'}), 400
+
+    batches = iter_product_batches(db.session, Product, Category,
+                                   batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+    response = Response(stream_with_context(export_chunks(fmt, batches)),
+                        mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=products.{fmt}'
+    return response
+
+
+# Поля карточки товара, которые меняются через API (остаток — через движения)
+PRODUCT_FIELDS = ('name', 'description', 'detailed_specs', 'sku', 'price', 'category_id')
+
+
+def product_changes(data, category_ids):
+    """Проверяет изменения карточки товара из JSON; ValueError при ошибке"""
+    values = {}
+    for key, value in data.items():
+        if key == 'version':
+            continue
+        if key == 'quantity':
+            raise ValueError('quantity is changed through stock movements')
+        if key not in PRODUCT_FIELDS:
+            raise ValueError(f'unknown field: {key}')
+        if key in ('name', 'sku'):
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f'{key} must be a non-empty string')
+            value = value.strip()
+        elif key in ('description', 'detailed_specs'):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f'{key} must be a string')
+        elif key == 'price':
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError('price must be a non-negative number')
+            value = float(value)
+        elif key == 'category_id':
+            if value is not None and (isinstance(value, bool) or value not in category_ids):
+                raise ValueError('category not found')
+        values[key] = value
+    return values
+
+
+def product_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'detailed_specs': product.detailed_specs,
+        'sku': product.sku,
+        'quantity': product.quantity,
+        'price': product.price,
+        'category_id': product.category_id,
+        'version': product.version,
+    }
+
+
+@bp.route('/api/products/<int:product_id>', methods=['PATCH'])
+@admin_required
+def api_update_product(product_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object expected'}), 400
+    # Версия обязательна: без нее клиент мог бы затереть чужие изменения
+    if 'version' not in data:
+        return jsonify({'error': 'version is required'}), 428
+    try:
+        version = parse_version(data['version'])
+        values = product_changes(data, {c.id for c in category_cache.all()})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        new_version = update_versioned(db.session, Product, product_id, version, values)
+        if new_version is None:
+            return jsonify({'error': 'product not found'}), 404
+        bump_version(db.session, CatalogVersion)
+        db.session.commit()
+    except VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': 'version conflict', 'version': e.current}), 409
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'sku must be unique'}), 400
+
+    return jsonify(product_json(db.session.get(Product, product_id)))
+
+
+@bp.route('/api/products/batch', methods=['POST'])
+@admin_required
+def api_products_batch():
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({'error': 'JSON array of items expected'}), 400
+    max_items = current_app.config['BATCH_UPDATE_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'too many items, at most {max_items} per batch'}), 413
+
+    # Версия каталога пишется первой: с этого момента SQLite держит блокировку
+    # записи, и пакет видит данные, которые никто не изменит до коммита
+    bump_version(db.session, CatalogVersion)
+    report = apply_batch(db.session, Product.__table__, StockMovement.__table__, items,
+                         user_id=session['user_id'])
+    if report.updated:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return jsonify(report.as_dict())
+
+
+def movement_json(movement):
+    return {
+        'id': movement.id,
+        'product_id': movement.product_id,
+        'kind': movement.kind,
+        'delta': movement.delta,
+        'quantity_after': movement.quantity_after,
+        'reason': movement.reason,
+        'user_id': movement.user_id,
+        'created_at': movement.created_at.isoformat() if movement.created_at else None,
+    }
+
+
+@bp.route('/api/products/<int:product_id>/stock')
+@login_required
+def api_product_stock(product_id):
+    product = db.session.get(Product, product_id)
+    if not product:
+        return jsonify({'error': 'product not found'}), 404
+
+    # ?at=<ISO-дата> — остаток по журналу на эту дату (от ближайшего снимка)
+    at = request.args.get('at')
+    if at:
+        try:
+            at = datetime.fromisoformat(at)
+        except ValueError:
+            return jsonify({'error': 'invalid date'}), 400
+        if at.tzinfo:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        return jsonify({
+            'product_id': product.id,
+            'at': at.isoformat(),
+            'quantity': stock_level(db.session, StockMovement, StockSnapshot, product.id, at),
+        })
+
+    limit = page_size(request.args.get('limit'),
+                      current_app.config['PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+    movements = (StockMovement.query.filter_by(product_id=product.id)
+                 .order_by(StockMovement.id.desc()).limit(limit).all())
+    return jsonify({
+        'product_id': product.id,
+        'quantity': product.quantity or 0,
+        'movements': [movement_json(m) for m in movements],
+    })
+
+
+@bp.route('/api/products/<int:product_id>/stock/<kind>', methods=['POST'])
+@admin_required
+def api_move_stock(product_id, kind):
+    if kind not in STOCK_KINDS:
+        return jsonify({'error': 'unknown movement kind'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        delta = signed_delta(kind, data.get('quantity'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    reason = str(data['reason'])[:200] if data.get('reason') else None
+
+    try:
+        movement = move_stock(db.session, Product, StockMovement, product_id, kind, delta,
+                              reason=reason, user_id=session['user_id'])
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'error': 'insufficient stock', 'available': e.available}), 409
+    if movement is None:
+        return jsonify({'error': 'product not found'}), 404
+
+    bump_version(db.session, CatalogVersion)
+    db.session.commit()
+    return jsonify(movement_json(movement)), 201
+
+
+# Команды CLI
+@bp.cli.command('init-db')
+@click.option('--seed', is_flag=True, help='Добавить тестовые данные, если пользователей нет')
+def init_db_command(seed):
+    """Создает схему БД или обновляет ее до последней версии"""
+    prepare_database(seed=seed)
+
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Применяет недостающие миграции схемы"""
+    migrations.migrate(db.engine, db.metadata)
+
+
+@bp.cli.command('refresh-replica')
+@click.option('--every', 'interval', type=float, default=None,
+              help='Обновлять каждые N секунд, пока процесс не остановят')
+def refresh_replica_command(interval):
+    """Обновляет снимок основной базы, из которого читают представления"""
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('Реплика не настроена, задайте DATABASE_REPLICA_URL')
+    if interval:
+        print(f"✓ Реплика обновляется каждые {interval:g} с")
+        refresh_periodically(db.engines[None], db.engines[REPLICA_BIND], interval)
+        return
+    seconds = refresh_replica(db.engines[None], db.engines[REPLICA_BIND])
+    print(f"✓ Реплика обновлена за {seconds:.2f} с")
+
+
+@bp.cli.command('stock-snapshot')
+def stock_snapshot_command():
+    """Записывает снимок остатков всех товаров (запускать периодически)"""
+    count = take_snapshot(db.session, Product, StockMovement, StockSnapshot)
+    db.session.commit()
+    print(f"✓ Снимок остатков: {count} товар(ов)")
+
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Создает и перестраивает полнотекстовый индекс товаров"""
+    count = rebuild_search_index(db.engine)
+    print(f"✓ Поисковый индекс перестроен: {count} товар(ов)")
+
+
+@bp.cli.command('export-products')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+def export_products_command(fmt, output):
+    """Выгружает каталог товаров в NDJSON или CSV"""
+    batches = iter_product_batches(db.session, Product, Category,
+                                   batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+    for chunk in export_chunks(fmt, batches):
+        output.write(chunk)
+
+
+@bp.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None)
+@click.option('--batch-size', type=int, default=None)
+def import_products_command(path, fmt, batch_size):
+    """Импортирует товары из CSV или NDJSON (upsert по артикулу)"""
+    fmt = fmt or detect_format(path)
+    error = None
+    with open(path, encoding='utf-8-sig', newline='') as lines:
+        try:
+            report = import_products(db.engine, Product.__table__, Category.__table__,
+                                     StockMovement.__table__, lines, fmt=fmt,
+                                     batch_size=batch_size or current_app.config['IMPORT_BATCH_SIZE'])
+        except UnreadableFile as e:
+            report, error = e.report, str(e)
+    if report.created or report.updated:
+        bump_version(db.session, CatalogVersion)
+        db.session.commit()
+    if error:
+        raise click.ClickException(f'{error} (записано до ошибки: {report.created + report.updated})')
+
+    print(f"✓ Создано: {report.created}, обновлено: {report.updated}, ошибок: {report.failed}")
+    for error in report.errors:
+        print(f"  ✗ строка {error['line']} ({error['sku'] or '—'}): {error['error']}")
+
+
+@bp.cli.command('generate-data')
+@click.option('--products', type=int, default=10000, show_default=True)
+@click.option('--users', type=int, default=100, show_default=True)
+@click.option('--categories', type=int, default=20, show_default=True)
+@click.option('--seed', type=int, default=42, show_default=True, help='Одинаковый seed дает одинаковые данные')
+@click.option('--replace', is_flag=True, help='Очистить пользователей, категории, товары и журнал остатков перед генерацией')
+def generate_data_command(products, users, categories, seed, replace):
+    """Заполняет базу синтетическим каталогом для нагрузочных тестов"""
+    tables = (User.__table__, Category.__table__, Product.__table__,
+              StockMovement.__table__, StockSnapshot.__table__)
+    if not replace and not is_empty(db.engine, *tables):
+        raise click.ClickException('База не пуста, используйте --replace')
+
+    started = time.perf_counter()
+    counts = generate_catalog(db.engine, *tables, users=users, categories=categories,
+                              products=products, seed=seed, hash_password=password_hasher.hash,
+                              replace=replace)
+    bump_version(db.session, CatalogVersion)
+    db.session.commit()
+    print(f"✓ Пользователей: {counts['users']}, категорий: {counts['categories']}, "
+          f"товаров: {counts['products']} (seed {seed}) за {time.perf_counter() - started:.1f} с")
+
+
+@bp.cli.command('slow-query-report')
+@click.option('--file', 'path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='NDJSON-журнал медленных запросов (по умолчанию SLOW_QUERY_LOG_FILE)')
+def slow_query_report_command(path):
+    """Полные просмотры таблиц в медленных запросах по маршрутам"""
+    path = path or current_app.config['SLOW_QUERY_LOG_FILE']
+    if not path or not os.path.exists(path):
+        raise click.ClickException('Журнал медленных запросов не найден, укажите --file')
+    records = read_records(path)
+    report = full_scan_report(records)
+
+    print(f"Медленных запросов: {len(records)}, с полным просмотром таблиц: "
+          f"{sum(entry['count'] for entry in report)}")
+    for entry in report:
+        print(f"  {entry['route'] or '—':<28} {entry['table']:<20} "
+              f"{entry['count']:>6} раз, до {entry['max_ms']} мс")
+        print(f"      {' '.join(entry['statement'].split())[:200]}")
 
 
 # Обработчики ошибок
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return render_template('500.html'), 500
 
 
 # Контекстный процессор
-@app.context_processor
+@bp.app_context_processor
 def inject_user():
     return {
         'current_user': {
@@ -485,7 +1045,49 @@ def inject_user():
         }
     }
 
-check_and_create_tables()
+def create_app(config=None):
+    """Создает приложение; база данных при этом не открывается"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'warehouse-secret-key-2024'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL', 'sqlite:///warehouse_new.db')  # НОВОЕ ИМЯ ФАЙЛА
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Режим поиска по умолчанию: 'fts' (полнотекстовый индекс) или 'like'
+    app.config['SEARCH_MODE'] = os.environ.get('SEARCH_MODE', 'fts')
+    # Пагинация списков товаров
+    app.config['PAGE_SIZE'] = 50
+    app.config['MAX_PAGE_SIZE'] = 200
+    # Размер пачки при потоковой выгрузке каталога
+    app.config['EXPORT_BATCH_SIZE'] = 1000
+    # Размер пачки (транзакции) при массовом импорте товаров
+    app.config['IMPORT_BATCH_SIZE'] = 1000
+    # Наибольшее число позиций в одном запросе пакетного обновления
+    app.config['BATCH_UPDATE_MAX_ITEMS'] = 10000
+    if config:
+        app.config.update(config)
+    # Движок реплики для чтения (DATABASE_REPLICA_URL), если она задана
+    read_replica.configure(app)
+    # WAL, PRAGMA и пул соединений SQLite (см. config.py)
+    db_tuning.configure(app, Config)
+
+    db.init_app(app)
+    db_tuning.init_app(app, db)
+    read_replica.init_app(app, db)
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    slow_query_log.init_app(app)
+    password_hasher.init_app(app)
+    view_counter.init_app(app, db, Product.__table__, CatalogVersion)
+    category_cache.init_app(app, db, Category, CatalogVersion)
+    principal_cache.init_app(app, db, User)
+    autocomplete_index.init_app(app, db, Product)
+
+    app.register_blueprint(bp)
+    return app
+
+
+app = create_app()
+
 if __name__ == '__main__':
     # Гарантированно создаем новую БД
     success = create_database()
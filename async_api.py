@@ -0,0 +1,213 @@
+"""
+Асинхронный JSON API каталога (ASGI)
+
+Те же модели и та же база, что у Flask-приложения, но запросы к SQLite
+идут через асинхронный драйвер aiosqlite. Медленный клиент или долгий
+запрос не занимают процесс целиком: один процесс обслуживает много
+соединений одновременно. Запуск:
+
+    uvicorn async_api:app --port 8001
+
+Авторизация — общей cookie сессии Flask (сначала вход через /login).
+"""
+import contextlib
+
+from itsdangerous import BadSignature
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from app import app as flask_app, db, Product, Category, CatalogVersion
+from catalog_version import make_etag, STAMP_ID, VIEWS_STAMP_ID
+from db_tuning import install_sqlite_pragmas, sqlite_engine_options
+from pagination import keyset_query, build_page, normalize_sort, page_size, InvalidCursor
+
+
+def async_database_url(app):
+    """URL базы Flask-приложения с асинхронным драйвером"""
+    with app.app_context():
+        url = db.engine.url  # путь уже приведен к instance/ самим Flask-SQLAlchemy
+    if url.get_backend_name() == 'sqlite':
+        url = url.set(drivername='sqlite+aiosqlite')
+    return url
+
+
+def create_engine_for(app):
+    url = async_database_url(app)
+    options = {}
+    if url.get_backend_name() == 'sqlite':
+        options = sqlite_engine_options(url.render_as_string(hide_password=False), app.config)
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == 'sqlite':
+        install_sqlite_pragmas(engine.sync_engine, app.config)
+    return engine
+
+
+class AsyncCatalogAPI:
+    """Маршруты /api/async/* поверх асинхронной сессии SQLAlchemy"""
+
+    def __init__(self, app):
+        self.flask_app = app
+        self.engine = create_engine_for(app)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.serializer = app.session_interface.get_signing_serializer(app)
+
+    def current_user(self, request):
+        """Данные сессии Flask из cookie; пустой dict, если входа не было"""
+        cookie = request.cookies.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return {}
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return self.serializer.loads(cookie, max_age=max_age)
+        except BadSignature:
+            return {}
+
+    async def conditional(self, session, request, user, render, views_shown=False):
+        """Ответ с ETag версии каталога; 304, если клиент уже видел эту версию
+
+        При views_shown (сортировка по просмотрам) ETag зависит и от версии
+        просмотров, см. catalog_version.py.
+        """
+        stamp_ids = (STAMP_ID, VIEWS_STAMP_ID) if views_shown else (STAMP_ID,)
+        rows = dict((await session.execute(
+            select(CatalogVersion.id, CatalogVersion.version).where(CatalogVersion.id.in_(stamp_ids))
+        )).all())
+        full_path = f'{request.url.path}?{request.url.query}'
+        etag = make_etag(tuple(rows.get(i, 0) for i in stamp_ids), full_path,
+                         user.get('user_id'), user.get('is_admin', False))
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('if-none-match', '')
+        if f'"{etag}"' in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status_code=304, headers=headers)
+        response = await render()
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
+
+    async def products(self, request):
+        user = self.current_user(request)
+        if 'user_id' not in user:
+            return JSONResponse({'error': 'login required'}, status_code=401)
+
+        config = self.flask_app.config
+        sort_by = normalize_sort(request.query_params.get('sort'))
+        per_page = page_size(request.query_params.get('per_page'),
+                             config['PAGE_SIZE'], config['MAX_PAGE_SIZE'])
+        category_id = request.query_params.get('category')
+
+        async def render():
+            query = select(Product).options(joinedload(Product.category))
+            if category_id:
+                query = query.filter(Product.category_id == category_id)
+            try:
+                queries, state = keyset_query(query, Product, sort_by,
+                                              cursor=request.query_params.get('cursor'),
+                                              limit=per_page)
+            except InvalidCursor:
+                return JSONResponse({'error': 'invalid cursor'}, status_code=400)
+            rows = []
+            for segment in queries:
+                result = await session.execute(segment.limit(per_page + 1 - len(rows)))
+                rows.extend(result.scalars().all())
+                if len(rows) > per_page:
+                    break
+            page = build_page(rows, state)
+
+            response = JSONResponse([{
+                'id': p.id,
+                'name': p.name,
+                'sku': p.sku,
+                'quantity': p.quantity,
+                'price': p.price,
+                'version': p.version,
+                'category': p.category.name if p.category else 'Без категории'
+            } for p in page.items])
+
+            links = []
+            for rel, cursor in (('next', page.next_cursor), ('prev', page.prev_cursor)):
+                if cursor:
+                    params = {'sort': sort_by, 'per_page': per_page, 'cursor': cursor}
+                    if category_id:
+                        params['category'] = category_id
+                    url = request.url_for('products').include_query_params(**params)
+                    links.append(f'<{url}>; rel="{rel}"')
+            if links:
+                response.headers['Link'] = ', '.join(links)
+            return response
+
+        async with self.sessions() as session:
+            return await self.conditional(session, request, user, render,
+                                          views_shown=sort_by == 'views_count')
+
+    async def product(self, request):
+        if 'user_id' not in self.current_user(request):
+            return JSONResponse({'error': 'login required'}, status_code=401)
+
+        async with self.sessions() as session:
+            p = (await session.execute(
+                select(Product).options(joinedload(Product.category))
+                .where(Product.id == request.path_params['product_id'])
+            )).scalar_one_or_none()
+        if p is None:
+            return JSONResponse({'error': 'product not found'}, status_code=404)
+        return JSONResponse({
+            'id': p.id,
+            'name': p.name,
+            'description': p.description,
+            'detailed_specs': p.detailed_specs,
+            'sku': p.sku,
+            'quantity': p.quantity,
+            'price': p.price,
+            'views_count': p.views_count or 0,
+            'version': p.version,
+            'created_at': p.created_at.isoformat() if p.created_at else None,
+            'category': p.category.name if p.category else 'Без категории'
+        })
+
+    async def categories(self, request):
+        if 'user_id' not in self.current_user(request):
+            return JSONResponse({'error': 'login required'}, status_code=401)
+
+        counts = (select(Product.category_id, func.count().label('product_count'))
+                  .group_by(Product.category_id).subquery())
+        async with self.sessions() as session:
+            rows = (await session.execute(
+                select(Category.id, Category.name, Category.description,
+                       func.coalesce(counts.c.product_count, 0))
+                .outerjoin(counts, counts.c.category_id == Category.id)
+                .order_by(Category.id)
+            )).all()
+        return JSONResponse([{
+            'id': row[0],
+            'name': row[1],
+            'description': row[2],
+            'product_count': row[3],
+        } for row in rows])
+
+    def routes(self):
+        return [
+            Route('/api/async/products', self.products, name='products'),
+            Route('/api/async/products/{product_id:int}', self.product, name='product'),
+            Route('/api/async/categories', self.categories, name='categories'),
+        ]
+
+
+def create_asgi_app(app=None):
+    api = AsyncCatalogAPI(app or flask_app)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(asgi_app):
+        yield
+        await api.engine.dispose()
+
+    asgi_app = Starlette(routes=api.routes(), lifespan=lifespan)
+    asgi_app.state.api = api
+    return asgi_app
+
+
+app = create_asgi_app()
@@ -0,0 +1,253 @@
+"""
+Подсказки для строки поиска по началу названия или артикула
+
+Индекс — отсортированный список ключей (строка, id товара) в памяти
+процесса. Ключи — артикул и каждое слово названия до конца строки,
+в нижнем регистре. Совпадения по префиксу находятся двумя bisect,
+из них выбираются самые просматриваемые товары; ответы на частые
+короткие префиксы запоминаются до следующего обновления индекса.
+
+Что менять в индексе, подсказывает журнал product_changes: триггеры
+SQLite записывают в него id товара при добавлении, удалении и смене
+названия или артикула — из любого процесса. Остатки, цены и просмотры
+журнал не трогают. Не чаще раза в AUTOCOMPLETE_CHECK_INTERVAL секунд
+индекс сверяет номер последней записи журнала и читает из products
+только перечисленные в новых записях товары. Журнал хранит последние
+CHANGE_LOG_SIZE записей; если процесс отстал сильнее, индекс строится
+заново. Просмотры (id и views_count) перечитываются раз в
+AUTOCOMPLETE_REFRESH_INTERVAL секунд. В базах кроме SQLite журнала нет,
+и с тем же интервалом индекс строится заново целиком.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import DDL, bindparam, event, func, select, text
+
+Suggestion = namedtuple('Suggestion', ['id', 'name', 'sku', 'views_count'])
+
+MAX_KEY_LENGTH = 64
+MAX_MEMO_SIZE = 10000
+# Ограничение SQLite на число параметров запроса — с запасом
+LOOKUP_CHUNK = 500
+_WORD = re.compile(r'\w+')
+_END = '\U0010ffff'
+
+CHANGES_TABLE = 'product_changes'
+CHANGE_LOG_SIZE = 10000
+
+_log_change = (
+    "INSERT INTO {table} (product_id) VALUES ({id}); "
+    "DELETE FROM {table} WHERE seq <= (SELECT max(seq) FROM {table}) - {size}; "
+)
+
+CREATE_STATEMENTS = [
+    f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "product_id INTEGER NOT NULL)",
+
+    f"CREATE TRIGGER IF NOT EXISTS {CHANGES_TABLE}_ai AFTER INSERT ON products BEGIN "
+    + _log_change.format(table=CHANGES_TABLE, id='new.id', size=CHANGE_LOG_SIZE)
+    + "END",
+
+    f"CREATE TRIGGER IF NOT EXISTS {CHANGES_TABLE}_ad AFTER DELETE ON products BEGIN "
+    + _log_change.format(table=CHANGES_TABLE, id='old.id', size=CHANGE_LOG_SIZE)
+    + "END",
+
+    # Upsert импорта переписывает название тем же значением — такие строки не нужны
+    f"CREATE TRIGGER IF NOT EXISTS {CHANGES_TABLE}_au AFTER UPDATE OF name, sku ON products "
+    "WHEN old.name IS NOT new.name OR old.sku IS NOT new.sku BEGIN "
+    + _log_change.format(table=CHANGES_TABLE, id='new.id', size=CHANGE_LOG_SIZE)
+    + "END",
+]
+
+DROP_STATEMENT = f"DROP TABLE IF EXISTS {CHANGES_TABLE}"
+
+
+def register_change_log(products_table):
+    """Создает журнал и триггеры вместе с таблицей товаров (только SQLite)"""
+    for statement in CREATE_STATEMENTS:
+        event.listen(products_table, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(products_table, 'before_drop',
+                 DDL(DROP_STATEMENT).execute_if(dialect='sqlite'))
+
+
+def create_change_log(conn):
+    """Создает журнал и триггеры в существующей базе"""
+    for statement in CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())[:MAX_KEY_LENGTH]
+
+
+def index_keys(product):
+    """Ключи товара: артикул и название с начала каждого слова"""
+    keys = set()
+    name = normalize(product.name)
+    for word in _WORD.finditer(name):
+        keys.add((name[word.start():], product.id))
+    sku = normalize(product.sku)
+    if sku:
+        keys.add((sku, product.id))
+    return keys
+
+
+class _State:
+    """Снимок индекса; при обновлении подменяется целиком вместе с запомненными ответами"""
+
+    def __init__(self, keys, products, seq):
+        self.keys = keys
+        self.products = products
+        self.seq = seq  # последняя учтенная запись product_changes
+        # Параллельные keys списки: срезы диапазона сравниваются без вызовов Python
+        self.ids = [pid for _, pid in keys]
+        self.scores = [-products[pid].views_count for pid in self.ids]
+        self.memo = {}
+
+
+class AutocompleteIndex:
+    """Префиксный индекс товаров, общий для всех запросов процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = 0.0
+        self._refreshed_at = 0.0
+        self.app = None
+        self.db = None
+        self.model = None
+
+    def init_app(self, app, db, model):
+        app.config.setdefault('AUTOCOMPLETE_LIMIT', 10)
+        app.config.setdefault('AUTOCOMPLETE_MAX_LIMIT', 50)
+        app.config.setdefault('AUTOCOMPLETE_CHECK_INTERVAL', 1.0)
+        app.config.setdefault('AUTOCOMPLETE_REFRESH_INTERVAL', 60)
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def complete(self, prefix, limit):
+        """До limit товаров, у которых название или артикул начинается с prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        state = self._fresh_state()
+        cached = state.memo.get((prefix, limit))
+        if cached is not None:
+            return cached
+
+        keys, products = state.keys, state.products
+        lo = bisect_left(keys, (prefix,))
+        hi = bisect_left(keys, (prefix + _END,), lo)
+        # У товара может быть несколько ключей с этим префиксом, берем с запасом
+        best = heapq.nsmallest(2 * limit, zip(state.scores[lo:hi], state.ids[lo:hi]))
+        top = list(dict.fromkeys(pid for _, pid in best))
+        if len(top) < limit and len(best) == 2 * limit:
+            unique = set(state.ids[lo:hi])
+            top = [pid for _, pid in heapq.nsmallest(
+                limit, ((-products[pid].views_count, pid) for pid in unique))]
+        result = [products[pid] for pid in top[:limit]]
+        if len(state.memo) < MAX_MEMO_SIZE:
+            state.memo[(prefix, limit)] = result
+        return result
+
+    def _fresh_state(self):
+        config = self.app.config
+        state = self._state
+        if state is not None and time.monotonic() - self._checked_at < config['AUTOCOMPLETE_CHECK_INTERVAL']:
+            return state
+        # Пока один поток обновляет индекс, остальные отвечают по прежнему снимку
+        if not self._lock.acquire(blocking=state is None):
+            return state
+        try:
+            state = self._state
+            if self.db.engine.dialect.name != 'sqlite':
+                self._checked_at = time.monotonic()
+                if (state is None or self._checked_at - self._refreshed_at
+                        >= config['AUTOCOMPLETE_REFRESH_INTERVAL']):
+                    state = self._state = self._build(0)
+                    self._refreshed_at = self._checked_at
+                return state
+            # Два подзапроса: min и max по первичному ключу — по одному поиску в индексе
+            first, last = self.db.session.execute(text(
+                f"SELECT (SELECT min(seq) FROM {CHANGES_TABLE}), (SELECT max(seq) FROM {CHANGES_TABLE})"
+            )).one()
+            last = last or 0
+            self._checked_at = time.monotonic()
+            if state is None or last < state.seq or (first or 0) > state.seq + 1:
+                # Первое обращение, база заменена или журнал уже обрезан
+                state = self._build(last)
+                self._refreshed_at = self._checked_at
+            elif last != state.seq:
+                state = self._apply_changes(state, last)
+            if self._checked_at - self._refreshed_at >= config['AUTOCOMPLETE_REFRESH_INTERVAL']:
+                state = self._refresh_views(state)
+                self._refreshed_at = self._checked_at
+            self._state = state
+            return state
+        finally:
+            self._lock.release()
+
+    def _columns(self):
+        t = self.model.__table__
+        return select(t.c.id, t.c.name, t.c.sku, func.coalesce(t.c.views_count, 0))
+
+    def _build(self, seq):
+        rows = self.db.session.execute(self._columns()).all()
+        products = {row[0]: Suggestion._make(row) for row in rows}
+        return _State(sorted(key for p in products.values() for key in index_keys(p)),
+                      products, seq)
+
+    def _apply_changes(self, state, seq):
+        """Перечитывает товары из записей журнала после state.seq, остальные ключи не трогает"""
+        changed = list(self.db.session.execute(
+            text(f"SELECT DISTINCT product_id FROM {CHANGES_TABLE} WHERE seq > :after AND seq <= :upto"),
+            {'after': state.seq, 'upto': seq}
+        ).scalars())
+        t = self.model.__table__
+        statement = self._columns().where(t.c.id.in_(bindparam('ids', expanding=True)))
+        rows = []
+        for start in range(0, len(changed), LOOKUP_CHUNK):
+            rows.extend(self.db.session.execute(
+                statement, {'ids': changed[start:start + LOOKUP_CHUNK]}).all())
+
+        products = dict(state.products)
+        removed, added = set(), set()
+        for pid in changed:
+            old = products.pop(pid, None)
+            if old is not None:
+                removed |= index_keys(old)
+        for row in rows:
+            new = products[row[0]] = Suggestion._make(row)
+            added |= index_keys(new)
+        removed, added = removed - added, added - removed
+
+        # Отфильтровать и слить два отсортированных отрезка: O(n) вместо вставки по одному
+        keys = [key for key in state.keys if key not in removed] if removed else list(state.keys)
+        keys.extend(sorted(added))
+        keys.sort()
+        return _State(keys, products, seq)
+
+    def _refresh_views(self, state):
+        t = self.model.__table__
+        views = dict(self.db.session.execute(
+            select(t.c.id, func.coalesce(t.c.views_count, 0))
+        ).all())
+        products = {pid: (p if views.get(pid, p.views_count) == p.views_count
+                          else p._replace(views_count=views[pid]))
+                    for pid, p in state.products.items()}
+        return _State(state.keys, products, state.seq)
+
+    def invalidate(self):
+        """Построить индекс заново при следующем обращении"""
+        with self._lock:
+            self._state = None
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,180 @@
+"""
+Пакетное обновление цен и остатков товаров (JSON API для ERP)
+
+Пакет применяется одной транзакцией. Текущие цены, остатки и версии
+читаются несколькими запросами IN (...), каждая позиция проверяется
+отдельно, а изменения записываются по одному UPDATE/INSERT на все
+позиции (executemany). Ошибочная позиция попадает в отчет и не мешает
+остальным.
+
+Остаток в позиции — целевое значение: разница с текущим пишется в
+журнал движения как корректировка (см. stock.py). Изменение цены
+увеличивает версию товара (см. optimistic.py); если позиция передает
+version и она устарела, позиция получает статус conflict.
+"""
+from sqlalchemy import bindparam, func, insert, select, update
+
+from optimistic import parse_version
+
+ITEM_FIELDS = ('id', 'sku', 'price', 'quantity', 'version')
+# Ограничение SQLite на число параметров запроса — с запасом
+LOOKUP_CHUNK = 500
+MOVEMENT_REASON = 'Пакетное обновление'
+
+
+class BatchReport:
+    """Итоги пакета: по одной записи на позицию, в порядке запроса"""
+
+    def __init__(self):
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.results = []
+
+    def add(self, index, status, product=None, error=None, **extra):
+        result = {'index': index, 'status': status}
+        if product is not None:
+            result.update(id=product['id'], sku=product['sku'])
+        if error:
+            result['error'] = error
+        result.update(extra)
+        self.results.append(result)
+        if status == 'updated':
+            self.updated += 1
+        elif status == 'unchanged':
+            self.unchanged += 1
+        else:
+            self.failed += 1
+
+    def as_dict(self):
+        return {
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'results': self.results,
+        }
+
+
+def clean_item(item):
+    """Проверяет позицию пакета; ValueError при ошибке"""
+    if not isinstance(item, dict):
+        raise ValueError('JSON object expected')
+    unknown = sorted(set(item) - set(ITEM_FIELDS))
+    if unknown:
+        raise ValueError(f'unknown field: {unknown[0]}')
+
+    key = item.get('id')
+    if key is not None:
+        if isinstance(key, bool) or not isinstance(key, int):
+            raise ValueError('id must be an integer')
+        key = ('id', key)
+    elif isinstance(item.get('sku'), str) and item['sku'].strip():
+        key = ('sku', item['sku'].strip())
+    else:
+        raise ValueError('id or sku is required')
+
+    price = item.get('price')
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))
+                              or price < 0):
+        raise ValueError('price must be a non-negative number')
+    quantity = item.get('quantity')
+    if quantity is not None and (isinstance(quantity, bool) or not isinstance(quantity, int)
+                                 or quantity < 0):
+        raise ValueError('quantity must be a non-negative integer')
+    if price is None and quantity is None:
+        raise ValueError('nothing to update: price or quantity expected')
+
+    version = parse_version(item['version']) if item.get('version') is not None else None
+    return key, (float(price) if price is not None else None), quantity, version
+
+
+def _load_products(session, product_table, column, keys):
+    t = product_table
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        rows = session.execute(
+            select(t.c.id, t.c.sku, t.c.price, t.c.quantity, t.c.version)
+            .where(t.c[column].in_(keys[start:start + LOOKUP_CHUNK]))
+        ).mappings()
+        found.update((row[column], dict(row)) for row in rows)
+    return found
+
+
+def apply_batch(session, product_table, movement_table, items, user_id=None):
+    """Применяет позиции пакета в текущей транзакции сессии, возвращает BatchReport
+
+    Вызывающий код должен до этого выполнить в транзакции запись (например,
+    увеличить версию каталога): SQLite тогда держит блокировку записи, и
+    прочитанные здесь цены, остатки и версии не изменятся до коммита.
+    """
+    report = BatchReport()
+    cleaned = []
+    for index, item in enumerate(items):
+        try:
+            cleaned.append((index, clean_item(item)))
+        except ValueError as e:
+            cleaned.append((index, e))
+
+    wanted = {'id': set(), 'sku': set()}
+    for _, item in cleaned:
+        if not isinstance(item, Exception):
+            column, value = item[0]
+            wanted[column].add(value)
+    products = {column: _load_products(session, product_table, column, keys)
+                for column, keys in wanted.items() if keys}
+
+    price_params, stock_params, movements = [], [], []
+    seen = set()
+    for index, item in cleaned:
+        if isinstance(item, Exception):
+            report.add(index, 'invalid', error=str(item))
+            continue
+        (column, value), price, quantity, version = item
+        product = products.get(column, {}).get(value)
+        if product is None:
+            report.add(index, 'not_found', error='product not found')
+            continue
+        if product['id'] in seen:
+            report.add(index, 'invalid', product, error='product is already in this batch')
+            continue
+        seen.add(product['id'])
+        if version is not None and version != product['version']:
+            report.add(index, 'conflict', product, error='version conflict',
+                       version=product['version'])
+            continue
+
+        current_quantity = product['quantity'] or 0
+        new_version = product['version']
+        changed = False
+        if price is not None and price != product['price']:
+            new_version += 1
+            price_params.append({'b_id': product['id'], 'b_price': price})
+            changed = True
+        if quantity is not None and quantity != current_quantity:
+            delta = quantity - current_quantity
+            stock_params.append({'b_id': product['id'], 'b_delta': delta})
+            movements.append({'product_id': product['id'], 'kind': 'adjust', 'delta': delta,
+                              'quantity_after': quantity, 'reason': MOVEMENT_REASON,
+                              'user_id': user_id})
+            changed = True
+        report.add(index, 'updated' if changed else 'unchanged', product,
+                   version=new_version,
+                   price=price if price is not None else product['price'],
+                   quantity=quantity if quantity is not None else current_quantity)
+
+    t = product_table
+    if price_params:
+        session.execute(
+            update(t).where(t.c.id == bindparam('b_id'))
+            .values(price=bindparam('b_price'), version=t.c.version + 1),
+            price_params
+        )
+    if stock_params:
+        session.execute(
+            update(t).where(t.c.id == bindparam('b_id'))
+            .values(quantity=func.coalesce(t.c.quantity, 0) + bindparam('b_delta')),
+            stock_params
+        )
+        session.execute(insert(movement_table), movements)
+    return report
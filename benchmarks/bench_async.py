@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конкурентности: синхронный /api/products против асинхронного API
+
+Запускаются два сервера на одной базе: gunicorn с синхронными воркерами
+(Flask, app:app) и uvicorn с одним процессом (async_api:app). Сначала
+оба нагружаются растущим числом одновременных клиентов. Затем
+открываются «медленные» соединения, которые не дописывают запрос, и
+измеряется, сколько быстрых запросов при этом успевает пройти.
+
+    python benchmarks/bench_async.py --db /tmp/bench.db --sync-workers 2 \\
+        --concurrency 2 8 32 --slow-clients 4
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_http import ROOT, percentile, login, prepare_database
+
+SYNC_PORT = 8765
+ASYNC_PORT = 8766
+
+
+def start_servers(db_path, sync_workers):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    servers = [
+        subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(sync_workers), '-k', 'sync',
+                          '-b', f'127.0.0.1:{SYNC_PORT}', '--timeout', '120', 'app:app'],
+                         cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        subprocess.Popen([sys.executable, '-m', 'uvicorn', 'async_api:app', '--port', str(ASYNC_PORT),
+                          '--no-access-log', '--log-level', 'warning'],
+                         cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+    ]
+    for port in (SYNC_PORT, ASYNC_PORT):
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise SystemExit(f'Сервер на порту {port} не запустился')
+                time.sleep(0.2)
+    return servers
+
+
+def load(port, path, cookie, concurrency, seconds, timeout=10):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        local, failed = [], 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'errors': errors[0],
+    }
+
+
+def open_slow_clients(port, count):
+    """Соединения, которые отправили начало запроса и замолчали"""
+    sockets = []
+    for _ in range(count):
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(b'GET /api/products HTTP/1.1\r\nHost: localhost\r\n')
+        sockets.append(s)
+    return sockets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', help='файл базы (переиспользуется между запусками)')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sync-workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--slow-clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_async.db')
+    prepare_database(db_path, args.products, args.seed)
+    servers = start_servers(db_path, args.sync_workers)
+    targets = {
+        f'sync ({args.sync_workers} воркера gunicorn)': (SYNC_PORT, '/api/products'),
+        'async (1 процесс uvicorn)': (ASYNC_PORT, '/api/async/products'),
+    }
+    results = []
+    try:
+        cookie = login('127.0.0.1', SYNC_PORT)
+        for name, (port, path) in targets.items():
+            for concurrency in args.concurrency:
+                result = load(port, path, cookie, concurrency, args.seconds)
+                results.append({'server': name, 'concurrency': concurrency, 'slow_clients': 0, **result})
+
+            slow = open_slow_clients(port, args.slow_clients)
+            try:
+                result = load(port, path, cookie, 2, args.seconds, timeout=args.seconds)
+            finally:
+                for s in slow:
+                    s.close()
+            results.append({'server': name, 'concurrency': 2, 'slow_clients': args.slow_clients, **result})
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    print("=" * 86)
+    print(f"  {'сервер':<30} | {'клиентов':>8} | {'медленных':>9} | {'запр/с':>8} | "
+          f"{'p50, мс':>8} | {'p95, мс':>8} | {'ошибок':>6}")
+    print("-" * 86)
+    for r in results:
+        print(f"  {r['server']:<30} | {r['concurrency']:8} | {r['slow_clients']:9} | {r['rps']:8} | "
+              f"{r['p50_ms']:8} | {r['p95_ms']:8} | {r['errors']:6}")
+    print("=" * 86)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"✓ Результаты сохранены в '{args.json}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк основных маршрутов по HTTP
+
+Приложение запускается локально (многопоточный сервер werkzeug) на
+сгенерированном каталоге (см. synthetic_data.py). Для каждого сценария
+несколько потоков в течение заданного времени шлют запросы. Итог:
+пропускная способность и задержки p50/p95/p99. Результаты сохраняются в
+JSON вместе с коммитом и параметрами запуска. С --compare выводится
+разница с предыдущим файлом.
+
+    python benchmarks/bench_http.py --products 20000 --seconds 5 --concurrency 8 \\
+        --output bench_http.json --compare previous.json
+
+С --url бенчмарк нагружает уже запущенный сервер (например, gunicorn):
+база и учетная запись admin / admin123 должны быть подготовлены заранее.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERNAME = 'admin'
+PASSWORD = 'admin123'
+
+
+def scenarios(product_ids, rng):
+    """Имя сценария -> функция, возвращающая путь очередного запроса"""
+    from pagination import SORT_OPTIONS
+
+    def fixed(path):
+        return lambda: path
+
+    result = {f'search sort={sort}': fixed(f'/search?sort={sort}') for sort in SORT_OPTIONS}
+    result.update({
+        'search category': fixed('/search?category=1'),
+        'search category sort=price_asc': fixed('/search?category=1&sort=price_asc'),
+        'search q (fts)': fixed('/search?' + urlencode({'q': 'Ноутбук'})),
+        'search q (like)': fixed('/search?' + urlencode({'q': 'Ноутбук', 'mode': 'like'})),
+        'search q sku': fixed('/search?q=ELC-001'),
+        'product detail': lambda: f'/product/{rng.choice(product_ids)}',
+        'admin': fixed('/admin'),
+        'api products': fixed('/api/products'),
+        'api products sort=price_desc per_page=200': fixed('/api/products?sort=price_desc&per_page=200'),
+    })
+    return result
+
+
+def percentile(ordered, p):
+    """Перцентиль по ближайшему рангу; ordered отсортирован по возрастанию"""
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def login(host, port):
+    """Входит как администратор и возвращает cookie сессии"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    conn.request('POST', '/login', body=urlencode({'username': USERNAME, 'password': PASSWORD}),
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie', '')
+    if response.status != 302 or 'session=' not in cookie:
+        raise SystemExit(f'Не удалось войти как {USERNAME}: HTTP {response.status}')
+    return cookie.split(';', 1)[0]
+
+
+def run_scenario(host, port, cookie, next_path, concurrency, seconds, warmup=3):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        local, failed = [], 0
+        for _ in range(warmup):
+            conn.request('GET', next_path(), headers={'Cookie': cookie})
+            conn.getresponse().read()
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.request('GET', next_path(), headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def prepare_database(path, products, seed):
+    """Создает базу с синтетическим каталогом, если ее еще нет"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app, db, User, Category, Product, StockMovement, StockSnapshot
+    from synthetic_data import generate_catalog, is_empty
+    import migrations
+    from passwords import password_hasher
+
+    with app.app_context():
+        migrations.migrate(db.engine, db.metadata, log=lambda _: None)
+        tables = (User.__table__, Category.__table__, Product.__table__,
+                  StockMovement.__table__, StockSnapshot.__table__)
+        if is_empty(db.engine, *tables):
+            print(f'Генерация каталога: {products} товаров (seed {seed})...')
+            generate_catalog(db.engine, *tables, products=products, seed=seed,
+                             hash_password=password_hasher.hash)
+    return app
+
+
+def start_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class Handler(WSGIRequestHandler):
+        # HTTP/1.1, чтобы соединения переиспользовались между запросами
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def product_ids_from(path):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM products')]
+
+
+def print_results(results, previous=None):
+    before = {r['scenario']: r for r in (previous or {}).get('results', [])}
+    print("=" * 100)
+    print(f"  {'сценарий':<44} | {'запр/с':>8} | {'p50, мс':>8} | {'p95, мс':>8} | "
+          f"{'p99, мс':>8} | {'ошибок':>6}")
+    print("-" * 100)
+    for r in results:
+        line = (f"  {r['scenario']:<44} | {r['rps']:8} | {r['p50_ms']:8} | {r['p95_ms']:8} | "
+                f"{r['p99_ms']:8} | {r['errors']:6}")
+        old = before.get(r['scenario'])
+        if old and old['rps']:
+            line += f"   {(r['rps'] / old['rps'] - 1) * 100:+.0f}% запр/с"
+        print(line)
+    print("=" * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='адрес запущенного сервера; без него сервер поднимается локально')
+    parser.add_argument('--db', help='файл базы (переиспользуется между запусками)')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--only', nargs='+', help='запустить сценарии, имена которых содержат подстроку')
+    parser.add_argument('--output', default='bench_http.json', help='JSON-файл с результатами')
+    parser.add_argument('--compare', help='JSON-файл предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+        product_ids = list(range(1, args.products + 1))
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_http.db')
+        server = start_server(prepare_database(db_path, args.products, args.seed))
+        host, port = '127.0.0.1', server.server_port
+        product_ids = product_ids_from(db_path)
+
+    rng = random.Random(args.seed)
+    cookie = login(host, port)
+    results = []
+    try:
+        for name, next_path in scenarios(product_ids, rng).items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            result = run_scenario(host, port, cookie, next_path, args.concurrency, args.seconds)
+            results.append({'scenario': name, 'example': next_path(), **result})
+            print(f"  {name}: {result['rps']} запр/с, p95 {result['p95_ms']} мс")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'products': len(product_ids),
+        'seed': args.seed,
+        'concurrency': args.concurrency,
+        'seconds': args.seconds,
+        'results': results,
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_results(results, previous)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✓ Результаты сохранены в '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
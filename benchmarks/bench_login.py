@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк входа в систему под конкурентной нагрузкой
+
+Несколько потоков одновременно выполняют POST /login, параллельно другие
+потоки открывают /search. Для каждого значения PASSWORD_HASH_WORKERS
+выводится пропускная способность входа и задержка поиска.
+
+    python benchmarks/bench_login.py --threads 16 --seconds 5 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from passwords import password_hasher
+
+USERNAME = 'admin'
+PASSWORD = 'admin123'
+
+
+def run(workers, login_threads, search_threads, seconds):
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    password_hasher.shutdown()  # пул пересоздастся с новым размером
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    logins = {'ok': 0, 'busy': 0, 'failed': 0}
+    search_latencies = []
+
+    def login_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            response = client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+            key = {302: 'ok', 503: 'busy'}.get(response.status_code, 'failed')
+            with lock:
+                logins[key] += 1
+
+    def search_loop():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = USERNAME
+            session['is_admin'] = True
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/search?sort=name')
+            with lock:
+                search_latencies.append(time.perf_counter() - started)
+
+    threads = ([threading.Thread(target=login_loop) for _ in range(login_threads)] +
+               [threading.Thread(target=search_loop) for _ in range(search_threads)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies = sorted(search_latencies) or [0.0]
+    return {
+        'hash_workers': workers,
+        'logins_per_sec': round(logins['ok'] / seconds, 1),
+        'logins_busy': logins['busy'],
+        'logins_failed': logins['failed'],
+        'search_p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'search_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16, help='потоков входа')
+    parser.add_argument('--search-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args()
+
+    results = [run(w, args.threads, args.search_threads, args.seconds) for w in args.workers]
+
+    print("=" * 72)
+    print(f"  {'потоков хэша':>12} | {'входов/с':>9} | {'503':>5} | "
+          f"{'поиск p50, мс':>13} | {'поиск p95, мс':>13}")
+    print("-" * 72)
+    for r in results:
+        print(f"  {r['hash_workers']:12} | {r['logins_per_sec']:9} | {r['logins_busy']:5} | "
+              f"{r['search_p50_ms']:13} | {r['search_p95_ms']:13}")
+    print("=" * 72)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Результаты сохранены в '{args.json}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конкурентного чтения и записи SQLite: настройки по умолчанию против WAL
+
+Читатели выполняют выборку, как на странице поиска, писатели увеличивают
+счетчики просмотров. Для каждого профиля считаются операции в секунду
+и ошибки "database is locked".
+
+    python benchmarks/bench_sqlite_concurrency.py --readers 8 --writers 4 --seconds 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import db_tuning
+from config import Config
+
+# Поведение до настройки: журнал отката, полная синхронизация, без ожидания блокировки
+DEFAULT_PROFILE = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT': 0,
+    'SQLITE_CACHE_SIZE': -2000,
+    'SQLITE_MMAP_SIZE': 0,
+    'SQLITE_POOL_SIZE': 5,
+    'SQLITE_MAX_OVERFLOW': 10,
+    'SQLITE_POOL_TIMEOUT': 30,
+}
+TUNED_PROFILE = {key: getattr(Config, key) for key in db_tuning.SETTINGS}
+
+READ_QUERY = text(
+    "SELECT id, name, sku, price, views_count FROM products "
+    "WHERE name LIKE :q ORDER BY views_count DESC LIMIT 50"
+)
+WRITE_QUERY = text("UPDATE products SET views_count = views_count + 1 WHERE id = :id")
+
+
+def make_engine(path, profile):
+    url = f'sqlite:///{path}'
+    engine = create_engine(url, **db_tuning.sqlite_engine_options(url, profile))
+    db_tuning.install_sqlite_pragmas(engine, profile)
+    return engine
+
+
+def seed(path, rows):
+    """Создает таблицу товаров с заданным числом строк"""
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, sku TEXT, "
+            "price REAL, views_count INTEGER DEFAULT 0)"
+        ))
+        conn.execute(
+            text("INSERT INTO products (name, sku, price) VALUES (:name, :sku, :price)"),
+            [{'name': f'Товар {i}', 'sku': f'SKU{i:06d}', 'price': i % 1000 + 0.99}
+             for i in range(rows)]
+        )
+    engine.dispose()
+
+
+def run_profile(path, profile, rows, readers, writers, seconds):
+    engine = make_engine(path, profile)
+    stop = threading.Event()
+    stats = {'reads': 0, 'writes': 0, 'locked_errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(READ_QUERY, {'q': f'%{random.randint(0, 99)}%'}).all()
+                key = 'reads'
+            except OperationalError:
+                key = 'locked_errors'
+            with lock:
+                stats[key] += 1
+
+    def writer():
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(WRITE_QUERY, {'id': random.randint(1, rows)})
+                key = 'writes'
+            except OperationalError:
+                key = 'locked_errors'
+            with lock:
+                stats[key] += 1
+
+    threads = ([threading.Thread(target=reader) for _ in range(readers)] +
+               [threading.Thread(target=writer) for _ in range(writers)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    stats['reads_per_sec'] = round(stats['reads'] / seconds, 1)
+    stats['writes_per_sec'] = round(stats['writes'] / seconds, 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, profile in (('default', DEFAULT_PROFILE), ('tuned', TUNED_PROFILE)):
+            path = os.path.join(tmp, f'{name}.db')
+            seed(path, args.rows)
+            print(f"▶ Профиль {name}...")
+            results[name] = run_profile(path, profile, args.rows,
+                                        args.readers, args.writers, args.seconds)
+
+    print("=" * 60)
+    print(f"  {'Профиль':10} | {'чтений/с':>10} | {'записей/с':>10} | {'locked':>8}")
+    print("-" * 60)
+    for name, stats in results.items():
+        print(f"  {name:10} | {stats['reads_per_sec']:10} | "
+              f"{stats['writes_per_sec']:10} | {stats['locked_errors']:8}")
+    print("=" * 60)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Результаты сохранены в '{args.json}'")
+
+
+if __name__ == '__main__':
+    main()
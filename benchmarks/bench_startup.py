@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк времени старта приложения
+
+Каждый замер запускается в отдельном процессе, поэтому кэши импорта не
+влияют на результат. Измеряются: импорт модуля app (с созданием
+приложения), повторный create_app() и `flask migrate` на актуальной базе.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    'import app': [sys.executable, '-c', 'import app'],
+    'create_app()': [sys.executable, '-c',
+                     'import time, app; t = time.perf_counter(); app.create_app(); '
+                     'print(time.perf_counter() - t)'],
+    'flask migrate': [sys.executable, '-m', 'flask', '--app', 'app', 'migrate'],
+}
+
+
+def measure(command, runs, env, inner=False):
+    """Медиана и максимум по runs запускам, в миллисекундах"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - started
+        if inner:
+            # Время, которое процесс измерил сам, без запуска интерпретатора
+            elapsed = float(result.stdout.strip().splitlines()[-1])
+        timings.append(elapsed * 1000)
+    return round(statistics.median(timings), 1), round(max(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', help='файл для сохранения результатов')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        # База создается один раз: меряем старт на уже актуальной схеме
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db', '--seed'],
+                       cwd=ROOT, env=env, capture_output=True, check=True)
+
+        results = []
+        for name, command in CASES.items():
+            median, worst = measure(command, args.runs, env, inner=name == 'create_app()')
+            results.append({'case': name, 'median_ms': median, 'max_ms': worst})
+
+    print("=" * 52)
+    print(f"  {'замер':<16} | {'медиана, мс':>12} | {'максимум, мс':>12}")
+    print("-" * 52)
+    for r in results:
+        print(f"  {r['case']:<16} | {r['median_ms']:12} | {r['max_ms']:12}")
+    print("=" * 52)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Результаты сохранены в '{args.json}'")
+
+
+if __name__ == '__main__':
+    main()
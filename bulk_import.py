@@ -0,0 +1,275 @@
+"""
+Массовый импорт товаров из CSV / NDJSON
+
+Файл читается построчно, строки проверяются и записываются пачками:
+одна транзакция на пачку, INSERT ... ON CONFLICT(sku) DO UPDATE.
+Остаток из файла — целевое значение, как в batch_update.py: upsert его
+не трогает, а разница с текущим пишется в журнал движения корректировкой
+(см. stock.py). Ошибочные строки попадают в отчет и не прерывают импорт. Файл, который
+не читается как UTF-8 или CSV, прерывает импорт с UnreadableFile.
+"""
+import csv
+import json
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+FORMATS = ('csv', 'ndjson')
+UPDATABLE_COLUMNS = ('name', 'description', 'detailed_specs', 'price', 'category_id')
+MAX_REPORTED_ERRORS = 1000
+MOVEMENT_REASON = 'Импорт товаров'
+
+
+class UnreadableFile(ValueError):
+    """Файл не читается: не UTF-8 или поврежденный CSV
+
+    Пачки до места ошибки уже записаны, их итоги — в report.
+    """
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+class ImportReport:
+    """Итоги импорта"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, sku, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'sku': sku, 'error': message})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def detect_format(filename, default='csv'):
+    ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if ext in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if ext == 'csv':
+        return 'csv'
+    return default
+
+
+def iter_records(lines, fmt):
+    """Выдает (номер строки, запись или исключение) без чтения файла целиком"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('ожидался JSON-объект')
+        except ValueError as e:
+            yield number, e
+            continue
+        yield number, record
+
+
+def _text(record, key):
+    value = record.get(key)
+    return str(value).strip() if value is not None else ''
+
+
+def clean_record(record, category_ids_by_name):
+    """Проверяет запись и приводит ее к значениям колонок products"""
+    name = _text(record, 'name')
+    sku = _text(record, 'sku')
+    if not name:
+        raise ValueError('не указано название')
+    if not sku:
+        raise ValueError('не указан артикул')
+
+    # Пустые необязательные поля — None: у нового товара будет значение
+    # по умолчанию, у существующего поле останется прежним
+    quantity = _text(record, 'quantity')
+    try:
+        quantity = int(quantity) if quantity else None
+    except ValueError:
+        raise ValueError(f'некорректное количество: {quantity!r}')
+    if quantity is not None and quantity < 0:
+        raise ValueError('количество не может быть отрицательным')
+
+    price = _text(record, 'price')
+    try:
+        price = float(price) if price else None
+    except ValueError:
+        raise ValueError(f'некорректная цена: {price!r}')
+    if price is not None and price < 0:
+        raise ValueError('цена не может быть отрицательной')
+
+    category_id = None
+    if _text(record, 'category_id'):
+        try:
+            category_id = int(_text(record, 'category_id'))
+        except ValueError:
+            raise ValueError(f"некорректная категория: {record['category_id']!r}")
+        if category_id not in category_ids_by_name.values():
+            raise ValueError(f'категория {category_id} не найдена')
+    elif _text(record, 'category'):
+        category_name = _text(record, 'category')
+        if category_name not in category_ids_by_name:
+            raise ValueError(f'категория "{category_name}" не найдена')
+        category_id = category_ids_by_name[category_name]
+
+    return {
+        'name': name,
+        'sku': sku,
+        'description': _text(record, 'description') or None,
+        'detailed_specs': _text(record, 'detailed_specs') or None,
+        'quantity': quantity,
+        'price': price,
+        'category_id': category_id,
+    }
+
+
+def _upsert_statement(product_table):
+    """INSERT ... ON CONFLICT(sku) DO UPDATE; отсутствующие в файле поля не затираются
+
+    Новый товар создается с нулевым остатком, остаток меняет _set_quantities.
+    """
+    t = product_table
+    param = {column: bindparam(f'v_{column}') for column in ('sku',) + UPDATABLE_COLUMNS}
+    stmt = sqlite_insert(t).values(
+        sku=param['sku'],
+        name=param['name'],
+        description=param['description'],
+        detailed_specs=func.coalesce(param['detailed_specs'], ''),
+        quantity=0,
+        price=param['price'],
+        category_id=param['category_id'],
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['sku'],
+        set_={**{column: func.coalesce(param[column], t.c[column]) for column in UPDATABLE_COLUMNS},
+              # Открытые формы и API-клиенты со старой версией получат конфликт
+              'version': t.c.version + 1}
+    )
+
+
+def _params(values):
+    return {f'v_{column}': value for column, value in values.items() if column != 'quantity'}
+
+
+def _set_quantities(conn, product_table, movement_table, quantities, user_id):
+    """Доводит остатки {sku: количество} до заданных, записывая корректировки в журнал
+
+    Вызывается после upsert той же транзакции: блокировка записи уже
+    взята, прочитанные остатки не изменятся до коммита.
+    """
+    t = product_table
+    wanted = {sku: quantity for sku, quantity in quantities.items() if quantity is not None}
+    if not wanted:
+        return
+    rows = conn.execute(
+        select(t.c.id, t.c.sku, t.c.quantity).where(t.c.sku.in_(list(wanted)))
+    ).all()
+    stock_params, movements = [], []
+    for row in rows:
+        delta = wanted[row.sku] - (row.quantity or 0)
+        if delta:
+            stock_params.append({'b_id': row.id, 'b_delta': delta})
+            movements.append({'product_id': row.id, 'kind': 'adjust', 'delta': delta,
+                              'quantity_after': wanted[row.sku], 'reason': MOVEMENT_REASON,
+                              'user_id': user_id})
+    if stock_params:
+        conn.execute(
+            update(t).where(t.c.id == bindparam('b_id'))
+            .values(quantity=func.coalesce(t.c.quantity, 0) + bindparam('b_delta')),
+            stock_params
+        )
+        conn.execute(insert(movement_table), movements)
+
+
+def _write_batch(engine, product_table, movement_table, batch, report, user_id=None):
+    """Записывает пачку {sku: (строка, значения)} одной транзакцией"""
+    statement = _upsert_statement(product_table)
+    skus = list(batch)
+    try:
+        with engine.begin() as conn:
+            existing = set(conn.execute(
+                select(product_table.c.sku).where(product_table.c.sku.in_(skus))
+            ).scalars())
+            conn.execute(statement, [_params(values) for _, values in batch.values()])
+            _set_quantities(conn, product_table, movement_table,
+                            {sku: values['quantity'] for sku, (_, values) in batch.items()}, user_id)
+    except SQLAlchemyError:
+        # Пачка не прошла целиком — пишем по одной строке, чтобы найти виновных
+        for sku, (line, values) in batch.items():
+            try:
+                with engine.begin() as conn:
+                    found = conn.execute(
+                        select(product_table.c.id).where(product_table.c.sku == sku)
+                    ).first()
+                    conn.execute(statement, [_params(values)])
+                    _set_quantities(conn, product_table, movement_table,
+                                    {sku: values['quantity']}, user_id)
+            except SQLAlchemyError as e:
+                report.add_error(line, sku, str(e.orig if hasattr(e, 'orig') else e))
+                continue
+            if found:
+                report.updated += 1
+            else:
+                report.created += 1
+        return
+
+    report.updated += len(existing)
+    report.created += len(skus) - len(existing)
+
+
+def import_products(engine, product_table, category_table, movement_table, lines, fmt='csv',
+                    batch_size=1000, user_id=None):
+    """Импортирует товары из итерируемого набора строк, возвращает ImportReport"""
+    report = ImportReport()
+    with engine.connect() as conn:
+        category_ids_by_name = dict(conn.execute(
+            select(category_table.c.name, category_table.c.id)
+        ).all())
+
+    batch = {}
+    try:
+        for line, record in iter_records(lines, fmt):
+            if isinstance(record, Exception):
+                report.add_error(line, None, str(record))
+                continue
+            try:
+                values = clean_record(record, category_ids_by_name)
+            except ValueError as e:
+                report.add_error(line, _text(record, 'sku') or None, str(e))
+                continue
+
+            sku = values['sku']
+            if sku in batch:
+                # Повтор артикула в пачке: побеждает последняя строка
+                report.updated += 1
+            batch[sku] = (line, values)
+            if len(batch) >= batch_size:
+                _write_batch(engine, product_table, movement_table, batch, report, user_id)
+                batch = {}
+    except UnicodeDecodeError:
+        raise UnreadableFile('file must be UTF-8 encoded', report)
+    except csv.Error as e:
+        raise UnreadableFile(f'invalid CSV: {e}', report)
+
+    if batch:
+        _write_batch(engine, product_table, movement_table, batch, report, user_id)
+    return report
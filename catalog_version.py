@@ -0,0 +1,51 @@
+"""
+Версия каталога товаров для условных запросов (ETag / Last-Modified)
+"""
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+
+STAMP_ID = 1
+# Сброс счетчиков просмотров увеличивает отдельную версию: от нее зависят
+# только ответы, которые показывают просмотры или сортируют по ним
+VIEWS_STAMP_ID = 2
+
+
+def current_version(session, stamp_model):
+    """Возвращает (версия, время изменения); 0 и None, если каталог не менялся"""
+    row = session.execute(
+        select(stamp_model.version, stamp_model.updated_at).where(stamp_model.id == STAMP_ID)
+    ).first()
+    if row is None:
+        return 0, None
+    return row.version, row.updated_at
+
+
+def current_versions(session, stamp_model, stamp_ids):
+    """Версии строк stamp_ids по порядку и самое позднее время изменения, одним запросом"""
+    rows = {row.id: row for row in session.execute(
+        select(stamp_model.id, stamp_model.version, stamp_model.updated_at)
+        .where(stamp_model.id.in_(stamp_ids))
+    )}
+    versions = tuple(rows[i].version if i in rows else 0 for i in stamp_ids)
+    updated = [rows[i].updated_at for i in stamp_ids if i in rows and rows[i].updated_at]
+    return versions, max(updated, default=None)
+
+
+def bump_version(session, stamp_model, stamp_id=STAMP_ID):
+    """Увеличивает версию в текущей транзакции; session — сессия или соединение"""
+    now = datetime.utcnow()
+    result = session.execute(
+        update(stamp_model)
+        .where(stamp_model.id == stamp_id)
+        .values(version=stamp_model.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(stamp_model).values(id=stamp_id, version=1, updated_at=now))
+
+
+def make_etag(version, *parts):
+    """ETag зависит от версии каталога, адреса запроса и прав пользователя"""
+    key = '|'.join(str(p) for p in (version,) + parts)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
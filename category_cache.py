@@ -0,0 +1,124 @@
+"""
+Кэш списка категорий в памяти процесса
+
+Категории меняются редко, а нужны почти каждой странице. Список
+загружается один раз и сбрасывается после коммита, изменившего категории
+через ORM. Запись запросами Core (генератор данных, импорт, другие
+процессы) заметна по версии каталога: она сверяется не чаще раза в
+CATEGORY_CACHE_CHECK_INTERVAL секунд. Кроме того, список перечитывается
+по истечении CATEGORY_CACHE_TTL.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from catalog_version import current_version
+from metrics import record_cache_lookup
+
+CachedCategory = namedtuple('CachedCategory', ['id', 'name', 'description'])
+
+_CHANGED_KEY = 'categories_changed'
+
+
+class CategoryCache:
+    """Список категорий, общий для всех запросов процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._version = None
+        self._generation = 0
+        self.app = None
+        self.db = None
+        self.model = None
+        self.stamp_model = None
+        self._installed = False
+
+    def init_app(self, app, db, model, stamp_model):
+        app.config.setdefault('CATEGORY_CACHE_TTL', 300)
+        app.config.setdefault('CATEGORY_CACHE_CHECK_INTERVAL', 1.0)
+        self.app = app
+        self.db = db
+        self.model = model
+        self.stamp_model = stamp_model
+
+        # События подключаются один раз, даже если приложений несколько
+        if self._installed:
+            return
+        self._installed = True
+
+        def mark_changed(mapper, connection, target):
+            Session.object_session(target).info[_CHANGED_KEY] = True
+
+        def mark_updated(mapper, connection, target):
+            # Добавление товара в категорию тоже вызывает after_update
+            session = Session.object_session(target)
+            if session.is_modified(target, include_collections=False):
+                session.info[_CHANGED_KEY] = True
+
+        event.listen(model, 'after_insert', mark_changed)
+        event.listen(model, 'after_update', mark_updated)
+        event.listen(model, 'after_delete', mark_changed)
+
+        def mark_bulk_changed(context):
+            if context.mapper.class_ is model:
+                context.session.info[_CHANGED_KEY] = True
+
+        event.listen(Session, 'after_bulk_update', mark_bulk_changed)
+        event.listen(Session, 'after_bulk_delete', mark_bulk_changed)
+
+        @event.listens_for(Session, 'after_commit')
+        def invalidate_after_commit(session):
+            if session.info.pop(_CHANGED_KEY, False):
+                self.invalidate()
+
+        @event.listens_for(Session, 'after_rollback')
+        def forget_after_rollback(session):
+            session.info.pop(_CHANGED_KEY, None)
+
+    def all(self):
+        """Категории в порядке id; из БД читаются только при пустом кэше"""
+        items = self._items
+        if items is not None and self._is_fresh():
+            record_cache_lookup('category', True)
+            return items
+        record_cache_lookup('category', False)
+
+        generation = self._generation
+        version, _ = current_version(self.db.session, self.stamp_model)
+        m = self.model
+        rows = self.db.session.execute(
+            select(m.id, m.name, m.description).order_by(m.id)
+        ).all()
+        items = [CachedCategory(*row) for row in rows]
+        with self._lock:
+            # Не сохраняем список, если его сбросили, пока шел запрос
+            if generation == self._generation:
+                self._items = items
+                self._version = version
+                self._loaded_at = self._checked_at = time.monotonic()
+        return items
+
+    def _is_fresh(self):
+        config = self.app.config
+        now = time.monotonic()
+        if now - self._loaded_at >= config['CATEGORY_CACHE_TTL']:
+            return False
+        if now - self._checked_at < config['CATEGORY_CACHE_CHECK_INTERVAL']:
+            return True
+        version, _ = current_version(self.db.session, self.stamp_model)
+        self._checked_at = now
+        return version == self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._items = None
+            self._generation += 1
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,73 @@
+"""
+Настройка движка SQLite для работы под нагрузкой: WAL, PRAGMA и пул соединений
+"""
+from sqlalchemy import event
+
+SETTINGS = [
+    'SQLITE_JOURNAL_MODE',
+    'SQLITE_SYNCHRONOUS',
+    'SQLITE_BUSY_TIMEOUT',
+    'SQLITE_CACHE_SIZE',
+    'SQLITE_MMAP_SIZE',
+    'SQLITE_POOL_SIZE',
+    'SQLITE_MAX_OVERFLOW',
+    'SQLITE_POOL_TIMEOUT',
+]
+
+
+def is_memory_uri(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def sqlite_engine_options(uri, config):
+    """Параметры create_engine() для файловой базы SQLite"""
+    if not uri.startswith('sqlite') or is_memory_uri(uri):
+        return {}
+    return {
+        # Таймаут драйвера задается в секундах и дублирует PRAGMA busy_timeout
+        'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000},
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': config['SQLITE_MAX_OVERFLOW'],
+        'pool_timeout': config['SQLITE_POOL_TIMEOUT'],
+    }
+
+
+def sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+
+
+def install_sqlite_pragmas(engine, config):
+    """Выполняет PRAGMA на каждом новом соединении движка"""
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # sqlite3 или асинхронный адаптер aiosqlite: у обоих синхронный cursor()
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def configure(app, config_object):
+    """Переносит настройки SQLite в app.config (до создания SQLAlchemy)"""
+    for key in SETTINGS:
+        app.config.setdefault(key, getattr(config_object, key))
+    options = sqlite_engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+
+def init_app(app, db):
+    """Подключает PRAGMA ко всем движкам SQLite приложения"""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                install_sqlite_pragmas(engine, app.config)
@@ -0,0 +1,59 @@
+"""
+Потоковая выгрузка каталога товаров в NDJSON и CSV
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+EXPORT_FIELDS = ['id', 'name', 'sku', 'quantity', 'price', 'category']
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+NO_CATEGORY = 'Без категории'
+
+
+def iter_product_batches(session, product_model, category_model, batch_size=1000):
+    """Читает товары пачками по id, не создавая ORM-объекты"""
+    p, c = product_model, category_model
+    base = (select(p.id, p.name, p.sku, p.quantity, p.price, c.name)
+            .outerjoin(c, p.category_id == c.id)
+            .order_by(p.id)
+            .limit(batch_size))
+    last_id = 0
+    while True:
+        rows = session.execute(base.where(p.id > last_id)).all()
+        if not rows:
+            return
+        yield [dict(zip(EXPORT_FIELDS, row[:5] + (row[5] or NO_CATEGORY,))) for row in rows]
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in batch)
+
+
+def csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок пустой выгрузки
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_chunks(fmt, batches):
+    """Генератор фрагментов выгрузки в нужном формате"""
+    if fmt == 'csv':
+        return csv_chunks(batches)
+    return ndjson_chunks(batches)
@@ -1,5 +1,5 @@
 # generate_erd_simple.py
-from app import db
+from app import app, db
 from sqlalchemy import inspect
 import json
 
@@ -227,10 +227,11 @@ if __name__ == "__main__":
     print("Генерация документации базы данных...")
     print("=" * 60)
 
-    generate_erd_description()
-    generate_plantuml_code()
-    generate_json_schema()
-    create_html_report()
+    with app.app_context():
+        generate_erd_description()
+        generate_plantuml_code()
+        generate_json_schema()
+        create_html_report()
 
     print("\n" + "=" * 60)
     print("✅ Вся документация успешно сгенерирована!")
@@ -0,0 +1,58 @@
+"""
+Настройки gunicorn (подхватываются автоматически из рабочего каталога)
+
+Воркеры пишут метрики Prometheus в общий каталог, /metrics суммирует их.
+
+Схема БД проверяется в мастер-процессе перед запуском воркеров, а не
+отдельной командой flask перед gunicorn: при холодном старте
+интерпретатор и приложение загружаются один раз. Если номер версии в
+schema_version актуален, это одно чтение. SEED_TEST_DATA=1 добавляет
+тестовые данные в пустую базу (как `flask init-db --seed`).
+
+Снимок для чтения (DATABASE_REPLICA_URL) обновляет один процесс
+`flask refresh-replica --every`, запущенный мастером, а не каждый воркер.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'warehouse-metrics'))
+
+
+def on_starting(server):
+    # Значения от предыдущего запуска не должны попасть в новые метрики
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+    from app import app, db, prepare_database
+    from read_replica import REPLICA_BIND, refresh_replica
+    with app.app_context():
+        prepare_database(seed=os.environ.get('SEED_TEST_DATA') == '1', log=server.log.info)
+        db.session.remove()
+        if REPLICA_BIND in db.engines:
+            # Воркеры не должны начинать с пустого или устаревшего снимка
+            refresh_replica(db.engines[None], db.engines[REPLICA_BIND])
+        # Воркеры получат копию мастера после fork — без его открытых соединений
+        for engine in db.engines.values():
+            engine.dispose()
+
+    interval = app.config['REPLICA_REFRESH_INTERVAL']
+    if app.config['DATABASE_REPLICA_URL'] and interval > 0:
+        server.replica_refresher = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'refresh-replica', '--every', str(interval)])
+
+
+def on_exit(server):
+    refresher = getattr(server, 'replica_refresher', None)
+    if refresher is not None:
+        refresher.terminate()
+        refresher.wait()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
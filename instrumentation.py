@@ -0,0 +1,144 @@
+"""
+Учет SQL-запросов и времени обработки в рамках одного HTTP-запроса
+
+Число SQL-запросов считается всегда (заголовок X-Query-Count). Замер
+времени (общее, SQL, шаблоны) включается настройками SERVER_TIMING_HEADER
+и REQUEST_TIMING_LOG. Пока обе выключены, обработчики событий замера не
+подключены и запрос не тратит на них время.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+logger = logging.getLogger('warehouse.requests')
+
+_listening = False
+_timing_installed = False
+_install_lock = threading.Lock()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+
+
+def _start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'sql_time' in g:
+        context._timing_started = time.perf_counter()
+
+
+def _stop_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_timing_started', None)
+    if started is not None and has_request_context() and 'sql_time' in g:
+        g.sql_time += time.perf_counter() - started
+
+
+def _start_template_timer(sender, template, context, **extra):
+    if has_request_context() and 'template_time' in g:
+        g.template_started = time.perf_counter()
+
+
+def _stop_template_timer(sender, template, context, **extra):
+    if has_request_context() and 'template_time' in g:
+        started = g.pop('template_started', None)
+        if started is not None:
+            g.template_time += time.perf_counter() - started
+
+
+def _install_timing():
+    """Подключает обработчики замера при первом включении"""
+    global _timing_installed
+    if _timing_installed:
+        return
+    with _install_lock:
+        if not _timing_installed:
+            event.listen(Engine, 'before_cursor_execute', _start_sql_timer)
+            event.listen(Engine, 'after_cursor_execute', _stop_sql_timer)
+            before_render_template.connect(_start_template_timer)
+            template_rendered.connect(_stop_template_timer)
+            _timing_installed = True
+
+
+def query_count():
+    """Число SQL-запросов, выполненных в текущем HTTP-запросе"""
+    return g.get('sql_statements', 0)
+
+
+def request_timings():
+    """Замеры текущего запроса в миллисекундах; None, если замер выключен"""
+    if 'request_started' not in g:
+        return None
+    return {
+        'total_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+        'sql_count': query_count(),
+        'sql_ms': round(g.sql_time * 1000, 2),
+        'template_ms': round(g.template_time * 1000, 2),
+    }
+
+
+def server_timing(timings):
+    """Значение заголовка Server-Timing"""
+    metrics = [
+        f"app;dur={timings['total_ms']}",
+        f"db;dur={timings['sql_ms']};desc=\"{timings['sql_count']} queries\"",
+    ]
+    if timings['template_ms']:
+        metrics.append(f"tpl;dur={timings['template_ms']}")
+    return ', '.join(metrics)
+
+
+def init_app(app):
+    """Подключает счетчик запросов и замер времени к приложению"""
+    global _listening
+    app.config.setdefault('QUERY_COUNT_HEADER', False)
+    app.config.setdefault('SERVER_TIMING_HEADER', os.environ.get('SERVER_TIMING_HEADER') == '1')
+    app.config.setdefault('REQUEST_TIMING_LOG', os.environ.get('REQUEST_TIMING_LOG') == '1')
+
+    if app.config['REQUEST_TIMING_LOG'] and not logger.handlers:
+        # Одна JSON-строка на запрос в stderr (gunicorn собирает ее в свой лог)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+        _listening = True
+
+    @app.before_request
+    def start_query_count():
+        g.sql_statements = 0
+        if app.config['SERVER_TIMING_HEADER'] or app.config['REQUEST_TIMING_LOG']:
+            _install_timing()
+            g.sql_time = 0.0
+            g.template_time = 0.0
+            g.request_started = time.perf_counter()
+
+    @app.after_request
+    def add_query_count_header(response):
+        if app.config['QUERY_COUNT_HEADER']:
+            response.headers[QUERY_COUNT_HEADER] = str(query_count())
+
+        timings = request_timings()
+        if timings is not None:
+            if app.config['SERVER_TIMING_HEADER']:
+                response.headers[SERVER_TIMING_HEADER] = server_timing(timings)
+            if app.config['REQUEST_TIMING_LOG']:
+                record = {
+                    'method': request.method,
+                    'path': request.path,
+                    'endpoint': request.endpoint,
+                    'status': response.status_code,
+                    **timings,
+                }
+                logger.info(json.dumps(record, ensure_ascii=False), extra={'timing': record})
+        return response
@@ -0,0 +1,90 @@
+"""
+Метрики приложения в формате Prometheus (GET /metrics)
+
+Экспортируются счетчики и гистограмма длительности запросов по маршрутам,
+число SQL-запросов на запрос, попадания в кэши и число запросов в работе.
+Под gunicorn каждый воркер пишет значения в файлы каталога
+PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py), а /metrics суммирует их,
+поэтому ответ не зависит от того, какой воркер его отдал.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+import instrumentation
+
+REQUESTS = Counter(
+    'warehouse_http_requests_total', 'Обработанные HTTP-запросы',
+    ['method', 'endpoint', 'status'])
+LATENCY = Histogram(
+    'warehouse_http_request_duration_seconds', 'Длительность обработки HTTP-запроса',
+    ['method', 'endpoint'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0))
+IN_PROGRESS = Gauge(
+    'warehouse_http_requests_in_progress', 'HTTP-запросы в работе',
+    multiprocess_mode='livesum')
+DB_QUERIES = Histogram(
+    'warehouse_db_queries_per_request', 'Число SQL-запросов на один HTTP-запрос',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 4, 5, 10, 20, 50, 100))
+CACHE_LOOKUPS = Counter(
+    'warehouse_cache_lookups_total', 'Обращения к кэшам процесса',
+    ['cache', 'result'])
+
+METRICS_ENDPOINT = 'metrics'
+
+
+def record_cache_lookup(cache, hit):
+    """Учитывает обращение к кэшу; доля попаданий считается в Prometheus"""
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def registry():
+    """Реестр для выдачи: общий по всем воркерам, если задан каталог метрик"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def metrics_view():
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Подключает сбор метрик и маршрут /metrics"""
+    app.config.setdefault('METRICS_ENABLED', True)
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    app.add_url_rule('/metrics', METRICS_ENDPOINT, metrics_view)
+
+    @app.before_request
+    def start_request_metrics():
+        if request.endpoint == METRICS_ENDPOINT:
+            return
+        IN_PROGRESS.inc()
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        # teardown выполняется и после необработанного исключения,
+        # поэтому счетчик запросов в работе не «залипает»
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        IN_PROGRESS.dec()
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', 500)
+        REQUESTS.labels(request.method, endpoint, status).inc()
+        LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - started)
+        DB_QUERIES.labels(endpoint).observe(instrumentation.query_count())
@@ -0,0 +1,121 @@
+"""
+Версия схемы БД и миграции
+
+Номер версии хранится в таблице schema_version. При старте он не
+проверяется: схему обновляет явная команда `flask migrate` (или
+`flask init-db` для новой базы). Новая база создается сразу по текущим
+моделям и получает последнюю версию. Существующая база проходит только
+недостающие миграции. Каждая миграция идемпотентна.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+from autocomplete import create_change_log
+from principal_cache import create_auth_stamp
+from search_index import create_search_index
+from stock import record_opening_balances
+
+STAMP_TABLE = 'schema_version'
+
+CREATE_STAMP_TABLE = (
+    f"CREATE TABLE IF NOT EXISTS {STAMP_TABLE} ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), "
+    "version INTEGER NOT NULL, "
+    "applied_at TIMESTAMP)"
+)
+
+
+def _initial_schema(conn, metadata):
+    """Недостающие таблицы и полнотекстовый индекс для баз, созданных до миграций"""
+    metadata.create_all(conn, checkfirst=True)
+    if conn.dialect.name == 'sqlite':
+        create_search_index(conn)
+
+
+def _product_sort_indexes(conn, metadata):
+    """Индексы сортировок и фильтра по категории (см. Product.__table_args__)"""
+    for index in metadata.tables['products'].indexes:
+        index.create(conn, checkfirst=True)
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql('ANALYZE products')
+
+
+def _stock_ledger(conn, metadata):
+    """Журнал движения товаров и снимки остатков, начальные остатки в журнале"""
+    for name in ('stock_movements', 'stock_snapshots'):
+        metadata.tables[name].create(conn, checkfirst=True)
+    # Иначе остаток по журналу не сойдется с products.quantity
+    record_opening_balances(conn, metadata.tables['products'], metadata.tables['stock_movements'])
+
+
+def _product_version(conn, metadata):
+    """Колонка версии товара для оптимистичной блокировки"""
+    columns = {column['name'] for column in inspect(conn).get_columns('products')}
+    if 'version' not in columns:
+        conn.exec_driver_sql('ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+
+def _auth_version(conn, metadata):
+    """Версия учетных записей для кэша principal и триггеры, которые ее увеличивают"""
+    if conn.dialect.name == 'sqlite':
+        create_auth_stamp(conn)
+
+
+def _product_changes(conn, metadata):
+    """Журнал изменений названий и артикулов для индекса подсказок"""
+    if conn.dialect.name == 'sqlite':
+        create_change_log(conn)
+
+
+# (версия, описание, функция(conn, metadata)) — только добавлять в конец
+MIGRATIONS = [
+    (1, 'Начальная схема, каталог версий, полнотекстовый индекс', _initial_schema),
+    (2, 'Индексы сортировок и фильтра по категории', _product_sort_indexes),
+    (3, 'Журнал движения товаров и снимки остатков', _stock_ledger),
+    (4, 'Версия товара для оптимистичной блокировки', _product_version),
+    (5, 'Версия учетных записей для кэша прав', _auth_version),
+    (6, 'Журнал изменений товаров для подсказок поиска', _product_changes),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Версия схемы из stamp-таблицы; None, если таблицы нет"""
+    if not inspect(conn).has_table(STAMP_TABLE):
+        return None
+    return conn.exec_driver_sql(f"SELECT version FROM {STAMP_TABLE} WHERE id = 1").scalar()
+
+
+def _stamp(conn, version):
+    conn.exec_driver_sql(CREATE_STAMP_TABLE)
+    conn.exec_driver_sql(
+        f"INSERT INTO {STAMP_TABLE} (id, version, applied_at) VALUES (1, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET version = excluded.version, applied_at = excluded.applied_at",
+        (version, datetime.utcnow().isoformat(' '))
+    )
+
+
+def migrate(engine, metadata, log=print):
+    """Приводит схему к последней версии, возвращает (было, стало)"""
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+        if version is None and not inspect(conn).has_table('products'):
+            # Пустая база: создаем схему целиком по моделям
+            metadata.create_all(conn)
+            _stamp(conn, HEAD)
+            log(f"✓ Схема создана (версия {HEAD})")
+            return None, HEAD
+
+        start = version or 0
+        for number, description, upgrade in MIGRATIONS:
+            if number > start:
+                upgrade(conn, metadata)
+                log(f"✓ Миграция {number}: {description}")
+        if start != HEAD:
+            _stamp(conn, HEAD)
+        else:
+            log(f"✓ Схема актуальна (версия {HEAD})")
+    return version, HEAD
@@ -0,0 +1,52 @@
+"""
+Оптимистичная блокировка: номер версии записи и compare-and-swap
+
+Клиент получает запись вместе с ее версией и возвращает эту версию при
+сохранении. Обновление выполняется одним запросом UPDATE ... SET ...,
+version = version + 1 WHERE id = ? AND version = ?: если запись за это
+время изменили, запрос не затронет ни одной строки и клиент получит
+конфликт. Блокировки строк не нужны, транзакция записи остается короткой.
+"""
+from sqlalchemy import select, update
+
+
+class VersionConflict(Exception):
+    """Запись изменили после того, как клиент ее прочитал"""
+
+    def __init__(self, current):
+        super().__init__(f'version conflict: current version is {current}')
+        self.current = current
+
+
+def parse_version(value):
+    """Номер версии из формы или JSON; ValueError, если он некорректен"""
+    if isinstance(value, bool):
+        raise ValueError('version must be a positive integer')
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('version must be a positive integer')
+    if version < 1 or (isinstance(value, float) and value != version):
+        raise ValueError('version must be a positive integer')
+    return version
+
+
+def update_versioned(session, model, object_id, expected_version, values):
+    """Обновляет запись, если ее версия равна expected_version
+
+    Возвращает новую версию или None, если записи нет; при несовпадении
+    версии бросает VersionConflict с текущей версией.
+    """
+    new_version = session.execute(
+        update(model)
+        .where(model.id == object_id, model.version == expected_version)
+        .values(version=model.version + 1, **values)
+        .returning(model.version)
+    ).scalar()
+    if new_version is not None:
+        return new_version
+
+    current = session.execute(select(model.version).where(model.id == object_id)).scalar()
+    if current is None:
+        return None
+    raise VersionConflict(current)
@@ -0,0 +1,163 @@
+"""
+Курсорная (keyset) пагинация списков товаров
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, tuple_
+
+# Варианты сортировки: поле модели и направление (True — по убыванию)
+SORT_OPTIONS = {
+    'name': ('name', False),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'date': ('created_at', True),
+    'views_count': ('views_count', True),
+}
+DEFAULT_SORT = 'views_count'
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или относится к другой сортировке"""
+
+
+class Page:
+    """Страница результатов с курсорами соседних страниц"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def normalize_sort(sort_by):
+    return sort_by if sort_by in SORT_OPTIONS else DEFAULT_SORT
+
+
+def page_size(value, default, maximum):
+    """Размер страницы из параметра запроса, ограниченный сверху"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort_by, item, direction):
+    field, _ = SORT_OPTIONS[sort_by]
+    payload = {
+        's': sort_by,
+        'v': _dump_value(getattr(item, field)),
+        'id': item.id,
+        'd': direction,
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_by):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value = _load_value(payload['v'])
+        last_id = int(payload['id'])
+        direction = payload['d']
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if payload.get('s') != sort_by or direction not in ('next', 'prev'):
+        raise InvalidCursor('cursor does not match sort order')
+    return value, last_id, direction
+
+
+def _beyond(column, id_column, value, last_id, greater):
+    """Условия для строк строго после (value, last_id), по одному на отрезок
+
+    В порядке SQLite NULL меньше всех значений, поэтому строки с NULL —
+    отдельный отрезок: первый при движении по возрастанию и последний при
+    движении по убыванию. Внутри отрезка условие — сравнение пар
+    (значение, id) или IS NULL, которое SQLite ищет по индексу, а не
+    перебирает его целиком, как OR из нескольких веток.
+    """
+    if greater:
+        if value is None:
+            return [and_(column.is_(None), id_column > last_id), column.isnot(None)]
+        return [tuple_(column, id_column) > (value, last_id)]
+    if value is None:
+        return [and_(column.is_(None), id_column < last_id)]
+    return [tuple_(column, id_column) < (value, last_id), column.is_(None)]
+
+
+def keyset_query(query, model, sort_by, cursor=None, limit=50):
+    """Добавляет к запросу условие курсора и порядок
+
+    Подходит и для Query, и для select(): возвращает (запросы, состояние).
+    Запросы — отрезки по порядку: каждый выполняется с лимитом limit + 1
+    за вычетом уже полученных строк, пока их не наберется limit + 1;
+    строки передаются в build_page вместе с состоянием.
+    """
+    sort_by = normalize_sort(sort_by)
+    field, descending = SORT_OPTIONS[sort_by]
+    column = getattr(model, field)
+
+    direction = 'next'
+    conditions = [None]
+    if cursor:
+        value, last_id, direction = decode_cursor(cursor, sort_by)
+        # При движении назад идем в обратном порядке и потом разворачиваем
+        forward = direction == 'next'
+        greater = (not descending) if forward else descending
+        conditions = _beyond(column, model.id, value, last_id, greater)
+
+    reverse = direction == 'prev'
+    if descending != reverse:
+        order = (column.desc(), model.id.desc())
+    else:
+        order = (column.asc(), model.id.asc())
+
+    queries = [(query.filter(condition) if condition is not None else query).order_by(*order)
+               for condition in conditions]
+    return queries, (sort_by, bool(cursor), reverse, limit)
+
+
+def build_page(rows, state):
+    """Страница из строк запросов keyset_query"""
+    sort_by, has_cursor, reverse, limit = state
+    has_more = len(rows) > limit
+    items = list(rows[:limit])
+    if reverse:
+        items.reverse()
+
+    if not items:
+        return Page(items)
+
+    has_next = has_more if not reverse else True
+    has_prev = has_cursor if not reverse else has_more
+    return Page(
+        items,
+        next_cursor=encode_cursor(sort_by, items[-1], 'next') if has_next else None,
+        prev_cursor=encode_cursor(sort_by, items[0], 'prev') if has_prev else None,
+    )
+
+
+def paginate(query, model, sort_by, cursor=None, limit=50):
+    """Возвращает страницу запроса; порядок всегда доуточняется по id"""
+    queries, state = keyset_query(query, model, sort_by, cursor=cursor, limit=limit)
+    rows = []
+    for segment in queries:
+        rows.extend(segment.limit(limit + 1 - len(rows)).all())
+        if len(rows) > limit:
+            break
+    return build_page(rows, state)
@@ -0,0 +1,91 @@
+"""
+Хэширование паролей с настраиваемыми параметрами и ограничением параллельности
+
+Хэширование (scrypt / pbkdf2) нагружает процессор. Оно выполняется в пуле
+из PASSWORD_HASH_WORKERS потоков, поэтому всплеск входов не занимает все
+потоки воркера. Если очередь занята дольше PASSWORD_HASH_QUEUE_TIMEOUT
+секунд, выбрасывается HashingBusy.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import (generate_password_hash, check_password_hash,
+                               DEFAULT_PBKDF2_ITERATIONS)
+
+
+class HashingBusy(RuntimeError):
+    """Все слоты хэширования заняты"""
+
+
+def normalize_method(method):
+    """Полная запись метода, как ее сохраняет werkzeug (scrypt -> scrypt:32768:8:1)"""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    """Пул потоков для хэширования паролей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        # Сколько запросов может ждать свободный поток сверх числа потоков
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 8)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_TIMEOUT', 10.0)
+        self.app = app
+
+    @property
+    def method(self):
+        return normalize_method(self.app.config['PASSWORD_HASH_METHOD'])
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                workers = self.app.config['PASSWORD_HASH_WORKERS']
+                self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                    thread_name_prefix='password-hash')
+                self._slots = threading.BoundedSemaphore(
+                    workers + self.app.config['PASSWORD_HASH_QUEUE'])
+            executor, slots = self._executor, self._slots
+
+        if not slots.acquire(timeout=self.app.config['PASSWORD_HASH_QUEUE_TIMEOUT']):
+            raise HashingBusy('password hashing queue is full')
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, self.method,
+                            self.app.config['PASSWORD_HASH_SALT_LENGTH'])
+
+    def verify(self, stored_hash, password):
+        return self._submit(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True, если хэш создан с другими параметрами, чем в настройках"""
+        stored_method = stored_hash.split('$', 1)[0]
+        return normalize_method(stored_method) != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+            self._slots = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,151 @@
+"""
+Кэш сведений о пользователе (principal) для проверки прав
+
+admin_required не читает строку пользователя на каждый запрос. Вместо
+этого сверяется общий номер версии учетных записей (таблица
+auth_version, одна строка): триггеры SQLite увеличивают его при
+добавлении и удалении пользователя, смене имени, роли или пароля — из
+любого процесса, CLI или sqlite3. Если номер изменился, кэш очищается
+целиком: такие изменения редки.
+
+Номер читается не чаще раза в PRINCIPAL_CACHE_CHECK_INTERVAL секунд,
+остальные проверки прав обходятся без запросов к базе. Изменения
+пользователей через ORM этого процесса заставляют перечитать номер на
+следующей проверке. В базах кроме SQLite таблицы версии нет, и
+пользователь читается на каждую проверку без кэша.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import DDL, event, select, text
+
+from metrics import record_cache_lookup
+
+Principal = namedtuple('Principal', ['id', 'username', 'is_admin'])
+
+STAMP_TABLE = 'auth_version'
+
+CREATE_STATEMENTS = [
+    f"CREATE TABLE IF NOT EXISTS {STAMP_TABLE} ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), "
+    "version INTEGER NOT NULL)",
+
+    f"INSERT OR IGNORE INTO {STAMP_TABLE} (id, version) VALUES (1, 1)",
+
+    f"CREATE TRIGGER IF NOT EXISTS users_auth_version_ai AFTER INSERT ON users BEGIN "
+    f"UPDATE {STAMP_TABLE} SET version = version + 1 WHERE id = 1; "
+    f"END",
+
+    f"CREATE TRIGGER IF NOT EXISTS users_auth_version_ad AFTER DELETE ON users BEGIN "
+    f"UPDATE {STAMP_TABLE} SET version = version + 1 WHERE id = 1; "
+    f"END",
+
+    f"CREATE TRIGGER IF NOT EXISTS users_auth_version_au "
+    f"AFTER UPDATE OF username, is_admin, password_hash ON users BEGIN "
+    f"UPDATE {STAMP_TABLE} SET version = version + 1 WHERE id = 1; "
+    f"END",
+]
+
+DROP_STATEMENT = f"DROP TABLE IF EXISTS {STAMP_TABLE}"
+
+
+def register_auth_stamp(users_table):
+    """Создает таблицу версии и триггеры вместе с таблицей пользователей (только SQLite)"""
+    for statement in CREATE_STATEMENTS:
+        event.listen(users_table, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(users_table, 'before_drop',
+                 DDL(DROP_STATEMENT).execute_if(dialect='sqlite'))
+
+
+def create_auth_stamp(conn):
+    """Создает таблицу версии и триггеры в существующей базе"""
+    for statement in CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+class PrincipalCache:
+    """LRU-кэш principal по id пользователя, сверяемый с версией учетных записей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> principal
+        self._stamp = None  # версия auth_version, при которой загружены записи
+        self._generation = 0  # растет при полной очистке
+        self._checked_at = None  # время последнего чтения версии; None — перечитать
+        self.app = None
+        self.db = None
+        self.model = None
+
+    def init_app(self, app, db, model):
+        app.config.setdefault('PRINCIPAL_CACHE_SIZE', 10000)
+        app.config.setdefault('PRINCIPAL_CACHE_CHECK_INTERVAL', 1.0)
+        self.app = app
+        self.db = db
+        self.model = model
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, self._expire_stamp)
+
+    def _expire_stamp(self, mapper, connection, target):
+        self._checked_at = None
+
+    def _check_stamp(self):
+        """Очищает кэш, если версия учетных записей изменилась; не чаще раза в интервал"""
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if (checked_at is not None
+                and now - checked_at < self.app.config['PRINCIPAL_CACHE_CHECK_INTERVAL']):
+            return
+        stamp = self.db.session.execute(
+            text(f"SELECT version FROM {STAMP_TABLE} WHERE id = 1")
+        ).scalar()
+        with self._lock:
+            if stamp != self._stamp:
+                self._generation += 1
+                self._entries.clear()
+                self._stamp = stamp
+            # Запись через ORM во время чтения версии оставляет отметку «перечитать»
+            if self._checked_at is checked_at:
+                self._checked_at = now
+
+    def _load(self, user_id):
+        m = self.model
+        row = self.db.session.execute(
+            select(m.id, m.username, m.is_admin).where(m.id == user_id)
+        ).first()
+        return Principal(row.id, row.username, bool(row.is_admin)) if row else None
+
+    def get(self, user_id):
+        """Principal пользователя или None, если пользователя нет"""
+        if self.db.engine.dialect.name != 'sqlite':
+            return self._load(user_id)
+        self._check_stamp()
+        with self._lock:
+            generation = self._generation
+            principal = self._entries.get(user_id)
+            if principal is not None:
+                self._entries.move_to_end(user_id)
+                record_cache_lookup('principal', True)
+                return principal
+        record_cache_lookup('principal', False)
+
+        principal = self._load(user_id)
+
+        with self._lock:
+            # Пока шел запрос, кэш могли очистить — такой результат не сохраняем
+            if generation == self._generation and principal is not None:
+                self._entries[user_id] = principal
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.app.config['PRINCIPAL_CACHE_SIZE']:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._checked_at = None
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,122 @@
+"""
+Чтение из реплики: маршрутизация сессии между основной базой и копией
+
+Если задан DATABASE_REPLICA_URL, у Flask-SQLAlchemy появляется второй
+движок (bind 'replica'). Представления, помеченные @replica_reads,
+читают из него; запись, flush и все остальные представления идут в
+основную базу. Для SQLite реплика — снимок основной базы, который
+обновляется через backup API командой `flask refresh-replica` (по cron
+или с --every). Воркеры снимок не обновляют: при
+REPLICA_REFRESH_INTERVAL > 0 gunicorn.conf.py запускает один процесс
+`refresh-replica --every` на весь сервер.
+
+Снимок отстает от основной базы. Чтобы пользователь сразу видел свои
+изменения, после запроса, записавшего данные, его чтения
+READ_YOUR_WRITES_SECONDS секунд идут в основную базу.
+"""
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, session as user_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+_WROTE_KEY = 'wrote'
+_PRIMARY_UNTIL_KEY = 'read_primary_until'
+
+
+class RoutingSession(Session):
+    """Сессия, которая отдает чтения реплике, если представление это разрешило"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not self.info.get(_WROTE_KEY)
+                and not getattr(clause, 'is_dml', False) and _replica_allowed()):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_allowed():
+    return has_request_context() and g.get('read_replica', False)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    # После записи сессия до конца транзакции читает только основную базу
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_written(orm_execute_state):
+    # session.execute(update(...)) и другие DML-запросы идут мимо flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    if session.info.pop(_WROTE_KEY, False) and has_request_context():
+        g.wrote_data = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop(_WROTE_KEY, None)
+
+
+def replica_reads(f):
+    """Разрешает представлению читать из реплики (кроме окна read-your-writes)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = time.time() >= user_session.get(_PRIMARY_UNTIL_KEY, 0)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def configure(app):
+    """Добавляет движок реплики в SQLALCHEMY_BINDS (до создания SQLAlchemy)"""
+    app.config.setdefault('DATABASE_REPLICA_URL', os.environ.get('DATABASE_REPLICA_URL'))
+    app.config.setdefault('REPLICA_REFRESH_INTERVAL', float(os.environ.get('REPLICA_REFRESH_INTERVAL', 0)))
+    app.config.setdefault('READ_YOUR_WRITES_SECONDS', 10)
+    if app.config['DATABASE_REPLICA_URL']:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, app.config['DATABASE_REPLICA_URL'])
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def refresh_replica(primary, replica):
+    """Копирует основную базу SQLite в реплику (backup API), возвращает время в секундах"""
+    started = time.perf_counter()
+    with primary.connect() as source, replica.connect() as target:
+        # Читатели реплики на время копирования ждут (busy_timeout), но не видят
+        # наполовину скопированную базу
+        source.connection.driver_connection.backup(target.connection.driver_connection)
+    return time.perf_counter() - started
+
+
+def refresh_periodically(primary, replica, interval, stop=None):
+    """Обновляет снимок каждые interval секунд, пока не выставлен stop"""
+    stop = stop or threading.Event()
+    while not stop.wait(interval):
+        try:
+            refresh_replica(primary, replica)
+        except Exception:
+            logger.exception('replica refresh failed')
+
+
+def init_app(app, db):
+    """Окно read-your-writes"""
+
+    @app.after_request
+    def read_own_writes(response):
+        if g.get('wrote_data'):
+            user_session[_PRIMARY_UNTIL_KEY] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+        return response
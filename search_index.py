@@ -0,0 +1,113 @@
+"""
+Полнотекстовый индекс товаров на базе SQLite FTS5
+"""
+import time
+
+from sqlalchemy import DDL, event, literal_column, select, table, text
+
+FTS_TABLE = 'products_fts'
+INDEXED_COLUMNS = ('name', 'description', 'sku', 'detailed_specs')
+
+# Триграммный токенизатор ищет по подстроке, как и LIKE '%q%',
+# поэтому для запросов короче трех символов остается обычный поиск
+MIN_QUERY_LENGTH = 3
+
+_columns = ', '.join(INDEXED_COLUMNS)
+_new_values = ', '.join(f'new.{c}' for c in INDEXED_COLUMNS)
+_old_values = ', '.join(f'old.{c}' for c in INDEXED_COLUMNS)
+
+CREATE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_columns}, content='products', content_rowid='id', tokenize='trigram')",
+
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+    f"END",
+
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) "
+    f"VALUES ('delete', old.id, {_old_values}); "
+    f"END",
+
+    # Счетчик просмотров меняется постоянно, переиндексируем только текстовые поля
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON products BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) "
+    f"VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); "
+    f"END",
+]
+
+DROP_STATEMENT = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# Индекс могут создать позже (rebuild-search-index в другом процессе),
+# поэтому его отсутствие перепроверяется не реже чем раз в столько секунд
+RECHECK_INTERVAL = 30
+
+# engine -> True или время проверки, не нашедшей индекс
+_available = {}
+
+
+def register_search_index(products_table):
+    """Создает индекс и триггеры вместе с таблицей товаров (только SQLite)"""
+    for statement in CREATE_STATEMENTS:
+        event.listen(products_table, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(products_table, 'before_drop',
+                 DDL(DROP_STATEMENT).execute_if(dialect='sqlite'))
+
+
+def search_index_available(engine):
+    """Проверяет, есть ли в базе полнотекстовый индекс"""
+    if engine.dialect.name != 'sqlite':
+        return False
+    checked = _available.get(engine)
+    if checked is True:
+        return True
+    if checked is not None and time.monotonic() - checked < RECHECK_INTERVAL:
+        return False
+    with engine.connect() as conn:
+        found = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first()
+    _available[engine] = True if found is not None else time.monotonic()
+    return found is not None
+
+
+def create_search_index(conn):
+    """Создает индекс и триггеры (если их нет) и заполняет индекс из products"""
+    for statement in CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return conn.exec_driver_sql(f"SELECT count(*) FROM {FTS_TABLE}").scalar()
+
+
+def drop_search_triggers(conn):
+    """Отключает индексацию по строкам перед массовой загрузкой
+
+    Индекс возвращает create_search_index: триггеры создаются заново,
+    индекс перестраивается за один проход.
+    """
+    for suffix in ('ai', 'ad', 'au'):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+
+
+def rebuild_search_index(engine):
+    """Создает индекс в существующей базе и заново заполняет его из products"""
+    with engine.begin() as conn:
+        count = create_search_index(conn)
+    _available[engine] = True
+    return count
+
+
+def match_expression(query):
+    """Превращает строку поиска в фразу FTS5 (кавычки экранируются удвоением)"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def fts_filter(id_column, query):
+    """Условие id IN (rowid из индекса, совпавшие с запросом)"""
+    matched_ids = select(literal_column('rowid')).select_from(table(FTS_TABLE)).where(
+        text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=match_expression(query))
+    )
+    return id_column.in_(matched_ids)
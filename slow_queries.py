@@ -0,0 +1,140 @@
+"""
+Журнал медленных SQL-запросов с планом выполнения
+
+Запрос дольше SLOW_QUERY_THRESHOLD_MS миллисекунд записывается в лог
+'warehouse.slow_queries' вместе с параметрами, маршрутом и выводом
+EXPLAIN QUERY PLAN. Записи хранятся в памяти процесса и, если задан
+SLOW_QUERY_LOG_FILE, дописываются в файл NDJSON (общий для воркеров).
+По записям строится отчет о полных просмотрах таблиц по маршрутам.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('warehouse.slow_queries')
+
+# «SCAN products» — полный просмотр; «SCAN products USING INDEX ...» и
+# виртуальные таблицы (FTS) полным просмотром не считаются
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def full_scans(plan):
+    """Таблицы, которые план читает целиком"""
+    return [match.group(1) for match in map(FULL_SCAN.match, plan) if match]
+
+
+def full_scan_report(records):
+    """Полные просмотры по маршрутам: список, самые частые в начале"""
+    found = {}
+    for record in records:
+        for table in full_scans(record['plan']):
+            key = (record['route'], table)
+            entry = found.setdefault(key, {'route': record['route'], 'table': table, 'count': 0,
+                                           'max_ms': 0.0, 'statement': record['statement']})
+            entry['count'] += 1
+            if record['duration_ms'] > entry['max_ms']:
+                entry['max_ms'] = record['duration_ms']
+                entry['statement'] = record['statement']
+    return sorted(found.values(), key=lambda e: (-e['count'], -e['max_ms']))
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class SlowQueryLog:
+    """Замер длительности запросов и сбор медленных"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._installed = False
+        self.records = deque()
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS',
+                              float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 0)))  # 0 — выключено
+        app.config.setdefault('SLOW_QUERY_LOG_FILE', os.environ.get('SLOW_QUERY_LOG_FILE'))
+        app.config.setdefault('SLOW_QUERY_MAX_RECORDS', 1000)
+        self.app = app
+
+        if app.config['SLOW_QUERY_THRESHOLD_MS']:
+            self._install()
+
+        @app.before_request
+        def enable_slow_query_log():
+            # Порог могли включить после старта
+            if app.config['SLOW_QUERY_THRESHOLD_MS'] and not self._installed:
+                self._install()
+
+    def _install(self):
+        with self._lock:
+            if self._installed:
+                return
+            event.listen(Engine, 'before_cursor_execute', self._start)
+            event.listen(Engine, 'after_cursor_execute', self._stop)
+            self._installed = True
+
+    def _start(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _stop(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        threshold = self.app.config['SLOW_QUERY_THRESHOLD_MS'] if self.app else 0
+        if started is None or not threshold:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < threshold or statement.lstrip().upper().startswith('EXPLAIN'):
+            return
+
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        self.record({
+            'route': request.endpoint if has_request_context() else None,
+            'duration_ms': round(duration_ms, 2),
+            'statement': statement,
+            'parameters': parameters,
+            'plan': self._explain(conn, statement, parameters),
+        })
+
+    def _explain(self, conn, statement, parameters):
+        """Строки detail из EXPLAIN QUERY PLAN (только SQLite)"""
+        if conn.dialect.name != 'sqlite':
+            return []
+        # Отдельный курсор: результаты исходного запроса еще не прочитаны
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            return [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+        except Exception as e:
+            return [f'EXPLAIN failed: {e}']
+        finally:
+            cursor.close()
+
+    def record(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        logger.warning(line, extra={'slow_query': entry})
+        with self._lock:
+            self.records.append(json.loads(line))
+            while len(self.records) > self.app.config['SLOW_QUERY_MAX_RECORDS']:
+                self.records.popleft()
+            path = self.app.config['SLOW_QUERY_LOG_FILE']
+            if path:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,24 @@
+"""
+Статистика каталога для административной панели
+"""
+from sqlalchemy import func, select
+
+
+def catalog_stats(session, product_model):
+    """Считает итоги по товарам одним агрегатным запросом в БД"""
+    p = product_model
+    row = session.execute(
+        select(
+            func.count(p.id),
+            func.coalesce(func.sum(p.quantity), 0),
+            func.coalesce(func.sum(func.coalesce(p.price, 0) * func.coalesce(p.quantity, 0)), 0),
+            func.coalesce(func.sum(p.views_count), 0),
+        )
+    ).one()
+
+    return {
+        'total_products': row[0],
+        'total_quantity': row[1],
+        'total_value': float(row[2]),
+        'total_views': row[3]
+    }
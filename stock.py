@@ -0,0 +1,146 @@
+"""
+Движение товаров на складе: приход, отгрузка, корректировка
+
+Остаток в products.quantity меняется одним запросом UPDATE ... SET
+quantity = quantity + delta, без чтения старого значения в приложение,
+поэтому одновременные изменения не затирают друг друга. В той же
+транзакции в журнал stock_movements пишется движение с остатком после
+него. Остаток не может стать отрицательным: такое движение отклоняется.
+
+Текущий остаток читается из products.quantity за O(1). Снимки остатков
+(stock_snapshots, команда `flask stock-snapshot`, например по cron)
+ограничивают, сколько журнала нужно просмотреть, чтобы получить остаток
+на прошлую дату: последний снимок плюс движения после него.
+
+Журнал начинается с остатка: товар, созданный с ненулевым количеством,
+и товары, которые были в базе до появления журнала, получают
+корректировку «Начальный остаток». Поэтому сумма журнала всегда равна
+products.quantity.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, exists, func, insert, literal, select, update
+
+KINDS = ('receive', 'ship', 'adjust')
+OPENING_REASON = 'Начальный остаток'
+
+
+class InsufficientStock(Exception):
+    """Движение увело бы остаток в минус"""
+
+    def __init__(self, available):
+        super().__init__(f'insufficient stock: {available} available')
+        self.available = available
+
+
+def signed_delta(kind, quantity):
+    """Изменение остатка для движения; ValueError при неверных данных"""
+    if kind not in KINDS:
+        raise ValueError('unknown movement kind')
+    if isinstance(quantity, bool) or not isinstance(quantity, int):
+        raise ValueError('quantity must be an integer')
+    if kind == 'adjust':
+        if quantity == 0:
+            raise ValueError('quantity must not be zero')
+        return quantity
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+    return quantity if kind == 'receive' else -quantity
+
+
+def move_stock(session, product_model, movement_model, product_id, kind, delta,
+               reason=None, user_id=None):
+    """Меняет остаток товара на delta и пишет движение в журнал
+
+    Работает в текущей транзакции сессии, фиксирует ее вызывающий код.
+    Возвращает запись журнала или None, если товара нет.
+    """
+    quantity = func.coalesce(product_model.quantity, 0)
+    # Проверка остатка и изменение — одна атомарная операция в базе
+    quantity_after = session.execute(
+        update(product_model)
+        .where(product_model.id == product_id, quantity + delta >= 0)
+        .values(quantity=quantity + delta)
+        .returning(product_model.quantity)
+    ).scalar()
+
+    if quantity_after is None:
+        row = session.execute(
+            select(product_model.quantity).where(product_model.id == product_id)
+        ).first()
+        if row is None:
+            return None
+        raise InsufficientStock(row.quantity or 0)
+
+    movement = movement_model(product_id=product_id, kind=kind, delta=delta,
+                              quantity_after=quantity_after, reason=reason, user_id=user_id)
+    session.add(movement)
+    session.flush()
+    return movement
+
+
+def record_opening_balances(conn, product_table, movement_table):
+    """Пишет начальный остаток товарам, у которых он есть, а журнала еще нет
+
+    Один INSERT ... SELECT; возвращает число записанных движений.
+    """
+    p, m = product_table, movement_table
+    quantity = func.coalesce(p.c.quantity, 0)
+    result = conn.execute(
+        insert(m).from_select(
+            ['product_id', 'kind', 'delta', 'quantity_after', 'reason', 'created_at'],
+            select(p.c.id, literal('adjust'), quantity, quantity, literal(OPENING_REASON),
+                   literal(datetime.utcnow()))
+            .where(quantity != 0, ~exists().where(m.c.product_id == p.c.id))
+        )
+    )
+    return result.rowcount
+
+
+def register_opening_balance(product_model, movement_table):
+    """Товар, добавленный через ORM с ненулевым остатком, получает начальное движение"""
+    @event.listens_for(product_model, 'after_insert')
+    def _record_opening_balance(mapper, connection, target):
+        if target.quantity:
+            connection.execute(insert(movement_table).values(
+                product_id=target.id, kind='adjust', delta=target.quantity,
+                quantity_after=target.quantity, reason=OPENING_REASON))
+
+
+def take_snapshot(session, product_model, movement_model, snapshot_model):
+    """Записывает остатки всех товаров, возвращает число товаров в снимке
+
+    Остатки и номер последнего учтенного движения читаются одним
+    INSERT ... SELECT, поэтому снимок согласован с журналом.
+    """
+    last_movement = select(func.coalesce(func.max(movement_model.id), 0)).scalar_subquery()
+    result = session.execute(
+        insert(snapshot_model).from_select(
+            ['product_id', 'quantity', 'movement_id', 'taken_at'],
+            select(product_model.id, func.coalesce(product_model.quantity, 0),
+                   last_movement, literal(datetime.utcnow()))
+        )
+    )
+    return result.rowcount
+
+
+def stock_level(session, movement_model, snapshot_model, product_id, at=None):
+    """Остаток товара по журналу на момент at (по умолчанию — сейчас)
+
+    Начинает с последнего снимка до at и досчитывает движения после него.
+    Для товара без снимков суммирует весь журнал.
+    """
+    snapshots = select(snapshot_model.quantity, snapshot_model.movement_id).where(
+        snapshot_model.product_id == product_id)
+    if at is not None:
+        snapshots = snapshots.where(snapshot_model.taken_at <= at)
+    snapshot = session.execute(
+        snapshots.order_by(snapshot_model.movement_id.desc(), snapshot_model.id.desc()).limit(1)
+    ).first()
+    base, after_id = (snapshot.quantity, snapshot.movement_id) if snapshot else (0, 0)
+
+    movements = select(func.coalesce(func.sum(movement_model.delta), 0)).where(
+        movement_model.product_id == product_id, movement_model.id > after_id)
+    if at is not None:
+        movements = movements.where(movement_model.created_at <= at)
+    return base + session.execute(movements).scalar()
@@ -0,0 +1,231 @@
+"""
+Генератор синтетического каталога для нагрузочных тестов
+
+Заполняет users, categories и products заданным числом строк, остатки
+товаров записываются в журнал движения как начальные. Данные похожи
+на настоящие: русские названия, артикулы по шаблону, длинные
+характеристики, неравномерные просмотры (немного популярных товаров и
+длинный хвост). Строки вставляются пачками в одной транзакции. При
+одинаковом seed результат одинаковый, поэтому замеры разных запусков
+можно сравнивать.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, inspect, select
+
+from search_index import FTS_TABLE, create_search_index, drop_search_triggers
+from stock import record_opening_balances
+
+# Даты создания отсчитываются от фиксированной точки, а не от текущего времени
+BASE_DATE = datetime(2024, 1, 1)
+DATE_SPAN_DAYS = 730
+
+# Учетные записи как в add_test_data(), чтобы нагрузочные тесты могли войти
+FIXED_USERS = (
+    ('admin', 'admin@warehouse.com', 'admin123', True),
+    ('user', 'user@warehouse.com', 'user123', False),
+)
+GENERATED_PASSWORD = 'user123'
+
+# группа: (префикс артикула, типы товаров, бренды, диапазон цен, характеристики)
+GROUPS = {
+    'Электроника': ('ELC', ['Ноутбук', 'Смартфон', 'Планшет', 'Монитор', 'Наушники', 'Телевизор', 'Роутер'],
+                    ['Lenovo', 'Samsung', 'Xiaomi', 'ASUS', 'Acer', 'Huawei', 'Sony', 'LG'], (1500, 250000),
+                    {'Экран': ['6.1"', '13.3"', '15.6"', '27"', '55"'], 'Память': ['4 ГБ', '8 ГБ', '16 ГБ', '32 ГБ'],
+                     'Накопитель': ['128 ГБ', '256 ГБ', '512 ГБ', '1 ТБ'], 'Аккумулятор': ['3000 мАч', '4500 мАч', '5000 мАч'],
+                     'Беспроводная связь': ['Wi-Fi 5, Bluetooth 5.0', 'Wi-Fi 6, Bluetooth 5.2', 'Wi-Fi 6E, Bluetooth 5.3']}),
+    'Одежда': ('CLT', ['Футболка', 'Куртка', 'Джинсы', 'Свитер', 'Платье', 'Рубашка', 'Кроссовки'],
+               ['Gloria Jeans', 'Zarina', 'Befree', 'O\'STIN', 'Sela', 'Baon'], (500, 25000),
+               {'Материал': ['100% хлопок', 'полиэстер', 'шерсть 50%, акрил 50%', 'деним', 'натуральная кожа'],
+                'Размеры': ['XS-XL', 'S-XXL', '42-52', '36-45'], 'Цвет': ['черный', 'белый', 'синий', 'бежевый', 'хаки'],
+                'Сезон': ['лето', 'демисезон', 'зима', 'всесезон'], 'Уход': ['стирка при 30°', 'ручная стирка', 'химчистка']}),
+    'Книги': ('BOK', ['Книга', 'Учебник', 'Справочник', 'Роман', 'Сборник рассказов', 'Энциклопедия'],
+              ['АСТ', 'Эксмо', 'Питер', 'Манн, Иванов и Фербер', 'Альпина', 'Азбука'], (200, 5000),
+              {'Автор': ['Иван Иванов', 'Анна Петрова', 'Сергей Смирнов', 'Мария Кузнецова', 'Олег Соколов'],
+               'Страниц': ['160', '288', '400', '512', '736'], 'Переплет': ['твердый', 'мягкий', 'интегральный'],
+               'Год': ['2019', '2020', '2021', '2022', '2023'], 'Язык': ['русский', 'английский', 'русский, английский']}),
+    'Мебель': ('FRN', ['Стол', 'Стул', 'Кресло', 'Шкаф', 'Диван', 'Стеллаж', 'Комод'],
+               ['IKEA', 'Hoff', 'Шатура', 'Лазурит', 'Mr.Doors', 'Столплит'], (1500, 120000),
+               {'Материал': ['ЛДСП', 'массив сосны', 'массив дуба', 'МДФ', 'металл'],
+                'Размеры (ШxГxВ)': ['80x60x75 см', '120x40x200 см', '200x90x85 см', '45x50x95 см'],
+                'Цвет': ['белый', 'венге', 'дуб сонома', 'графит', 'орех'], 'Максимальная нагрузка': ['100 кг', '120 кг', '150 кг'],
+                'Сборка': ['требуется', 'не требуется']}),
+    'Продукты': ('FOD', ['Кофе', 'Чай', 'Шоколад', 'Мед', 'Макароны', 'Оливковое масло', 'Крупа'],
+                 ['Жокей', 'Greenfield', 'Бабаевский', 'Макфа', 'Увелка', 'Lavazza'], (60, 3000),
+                 {'Вес': ['100 г', '250 г', '500 г', '1 кг'], 'Срок годности': ['6 месяцев', '12 месяцев', '24 месяца'],
+                  'Условия хранения': ['при температуре до +25°', 'в сухом месте', 'после вскрытия в холодильнике'],
+                  'Пищевая ценность': ['350 ккал / 100 г', '540 ккал / 100 г', '120 ккал / 100 г'],
+                  'Состав': ['натуральный продукт без добавок', 'сахар, какао-масло, какао тертое', 'твердые сорта пшеницы']}),
+    'Бытовая техника': ('APL', ['Пылесос', 'Холодильник', 'Стиральная машина', 'Чайник', 'Микроволновая печь', 'Утюг'],
+                        ['Bosch', 'Philips', 'Redmond', 'Polaris', 'Indesit', 'Atlant'], (1000, 150000),
+                        {'Мощность': ['800 Вт', '1500 Вт', '2200 Вт'], 'Класс энергопотребления': ['A', 'A+', 'A++'],
+                         'Объем': ['1.7 л', '20 л', '300 л'], 'Уровень шума': ['38 дБ', '52 дБ', '70 дБ'],
+                         'Цвет': ['белый', 'черный', 'серебристый', 'нержавеющая сталь']}),
+    'Инструменты': ('TLS', ['Дрель', 'Шуруповерт', 'Перфоратор', 'Болгарка', 'Набор отверток', 'Лобзик'],
+                    ['Makita', 'Bosch', 'Интерскол', 'Зубр', 'DeWalt', 'Metabo'], (500, 60000),
+                    {'Питание': ['сеть 220 В', 'аккумулятор 18 В', 'аккумулятор 12 В'], 'Мощность': ['500 Вт', '750 Вт', '1200 Вт'],
+                     'Число оборотов': ['0-1500 об/мин', '0-3000 об/мин', '11000 об/мин'], 'Вес': ['1.2 кг', '2.4 кг', '3.1 кг'],
+                     'Комплектация': ['кейс, 2 аккумулятора', 'без аккумулятора', 'набор бит']}),
+    'Спорт': ('SPT', ['Велосипед', 'Гантели', 'Коврик для йоги', 'Мяч футбольный', 'Беговая дорожка', 'Рюкзак'],
+              ['Stern', 'Demix', 'Torneo', 'Adidas', 'Nike', 'Kettler'], (300, 90000),
+              {'Материал': ['алюминий', 'сталь', 'ТПЭ', 'полиуретан', 'нейлон'], 'Вес': ['0.45 кг', '2 кг', '12 кг', '70 кг'],
+               'Уровень подготовки': ['начинающий', 'любитель', 'профессионал'], 'Цвет': ['черный', 'красный', 'синий', 'зеленый'],
+               'Максимальный вес пользователя': ['100 кг', '120 кг', '150 кг']}),
+}
+MODEL_SERIES = ['Pro', 'Lite', 'Max', 'Plus', 'Air', 'Classic', 'Mini', 'Ultra', 'Neo', 'Prime']
+ADJECTIVES = ['новый', 'улучшенный', 'компактный', 'надежный', 'популярный', 'современный', 'универсальный', 'легкий']
+USAGE = ['для дома', 'для офиса', 'для работы и учебы', 'для путешествий', 'в подарок', 'на каждый день']
+REVIEW_WORDS = ['качество', 'сборка', 'упаковка', 'доставка', 'гарантия', 'инструкция', 'комплектация', 'дизайн',
+                'производитель', 'покупатель', 'сертификат', 'эксплуатация', 'обслуживание', 'характеристика']
+COMMON_SPECS = {
+    'Гарантия': ['6 месяцев', '12 месяцев', '24 месяца', '36 месяцев'],
+    'Страна производства': ['Россия', 'Китай', 'Германия', 'Беларусь', 'Турция', 'Вьетнам'],
+    'Вес в упаковке': ['0.3 кг', '1.1 кг', '2.5 кг', '7.8 кг', '24 кг'],
+    'Габариты упаковки': ['20x15x5 см', '40x30x10 см', '60x45x30 см', '120x60x20 см'],
+    'Сертификат': ['ЕАЭС RU Д-CN.РА01', 'ЕАЭС RU С-DE.АЖ40', 'ТР ТС 004/2011'],
+}
+LAST_NAMES = ['ivanov', 'petrova', 'smirnov', 'kuznetsova', 'popov', 'sokolova', 'lebedev', 'kozlova',
+              'novikov', 'morozova', 'volkov', 'egorova', 'pavlov', 'semenova', 'golubev', 'vinogradova']
+
+
+def _category_names(count):
+    """Названия категорий: сначала группы, затем группа + тип товара, затем серии"""
+    names = [(group, group) for group in GROUPS]
+    for group, (_, types, *_) in GROUPS.items():
+        names.extend((group, f'{group}: {kind}') for kind in types)
+    series = 2
+    while len(names) < count:
+        names.extend((group, f'{group}: серия {series}') for group in GROUPS)
+        series += 1
+    return names[:count]
+
+
+def _views(rng):
+    # Распределение Парето: большинство товаров смотрят редко, единицы — очень часто
+    if rng.random() < 0.1:
+        return 0
+    return min(int((rng.paretovariate(1.1) - 1) * 25), 5_000_000)
+
+
+def _price(rng, low, high):
+    # Логнормально внутри диапазона группы, с «магазинными» копейками
+    value = low * (high / low) ** min(rng.lognormvariate(-1.2, 0.6), 1.0)
+    return round(int(value) + rng.choice((0.0, 0.5, 0.9, 0.99)), 2)
+
+
+def _quantity(rng):
+    if rng.random() < 0.05:
+        return 0
+    return int(rng.expovariate(1 / 60)) + 1
+
+
+def _specs(rng, spec_values, kind, brand):
+    """Многострочные характеристики: 10-30 строк «Ключ: значение» и описание"""
+    pairs = list(spec_values.items()) + list(COMMON_SPECS.items())
+    lines = [f'Тип: {kind}', f'Бренд: {brand}']
+    lines += [f'{key}: {rng.choice(values)}' for key, values in rng.sample(pairs, k=len(pairs))]
+    for number in range(rng.randint(0, 18)):
+        lines.append(f'Параметр {number + 1}: {rng.randint(1, 999)} {rng.choice(["мм", "г", "шт", "%", "Вт"])}')
+    sentences = []
+    for _ in range(rng.randint(3, 10)):
+        words = rng.sample(REVIEW_WORDS, k=rng.randint(4, 8))
+        sentences.append(' '.join(words).capitalize() + '.')
+    lines.append('Описание: ' + ' '.join(sentences))
+    return '\n'.join(lines)
+
+
+def _product(rng, number, category_id, group):
+    prefix, types, brands, (low, high), spec_values = GROUPS[group]
+    kind = rng.choice(types)
+    brand = rng.choice(brands)
+    model = f'{rng.choice(MODEL_SERIES)} {rng.randint(10, 999)}'
+    return {
+        'id': number,
+        'name': f'{kind} {brand} {model}',
+        'description': f'{rng.choice(ADJECTIVES).capitalize()} {kind.lower()} {brand} {rng.choice(USAGE)}',
+        'detailed_specs': _specs(rng, spec_values, kind, brand),
+        'sku': f'{prefix}-{category_id:03d}-{number:07d}',
+        'quantity': _quantity(rng),
+        'price': _price(rng, low, high),
+        'category_id': category_id,
+        'created_at': BASE_DATE + timedelta(seconds=rng.randrange(DATE_SPAN_DAYS * 86400)),
+        'views_count': _views(rng),
+    }
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_empty(engine, *tables):
+    with engine.connect() as conn:
+        return all(conn.execute(select(func.count()).select_from(t)).scalar() == 0 for t in tables)
+
+
+def generate_catalog(engine, user_table, category_table, product_table, movement_table,
+                     snapshot_table, *, users=100, categories=20, products=10000, seed=42,
+                     hash_password=None, replace=False, batch_size=5000):
+    """Заполняет таблицы синтетическими данными, возвращает число вставленных строк
+
+    hash_password(password) вызывается по одному разу на пароль: хэшировать
+    каждого пользователя отдельно слишком долго. При replace=True таблицы,
+    включая журнал движения и снимки остатков, предварительно очищаются.
+    Остатки товаров записываются в журнал как начальные (см. stock.py).
+    """
+    rng = random.Random(seed)
+    categories = max(categories, 1)
+    hash_password = hash_password or (lambda password: password)
+    hashes = {password: hash_password(password)
+              for password in {p for _, _, p, _ in FIXED_USERS} | {GENERATED_PASSWORD}}
+
+    with engine.begin() as conn:
+        indexed = conn.dialect.name == 'sqlite' and inspect(conn).has_table(FTS_TABLE)
+        if indexed:
+            # Пересобрать индекс один раз в конце быстрее, чем обновлять его на каждую строку
+            drop_search_triggers(conn)
+        if replace:
+            for t in (snapshot_table, movement_table, product_table, category_table, user_table):
+                conn.execute(delete(t))
+
+        user_rows = [
+            {'id': number, 'username': username, 'email': email,
+             'password_hash': hashes[password], 'is_admin': is_admin, 'created_at': BASE_DATE}
+            for number, (username, email, password, is_admin) in enumerate(FIXED_USERS, start=1)
+        ]
+        for number in range(len(user_rows) + 1, len(user_rows) + users + 1):
+            username = f'{rng.choice(LAST_NAMES)}{number}'
+            user_rows.append({
+                'id': number, 'username': username, 'email': f'{username}@example.ru',
+                'password_hash': hashes[GENERATED_PASSWORD], 'is_admin': False,
+                'created_at': BASE_DATE + timedelta(seconds=rng.randrange(DATE_SPAN_DAYS * 86400)),
+            })
+        for batch in _batches(user_rows, batch_size):
+            conn.execute(user_table.insert(), batch)
+
+        category_groups = _category_names(categories)
+        conn.execute(category_table.insert(), [
+            {'id': number, 'name': name, 'description': f'Товары раздела «{group}»'}
+            for number, (group, name) in enumerate(category_groups, start=1)
+        ])
+
+        # Популярность категорий тоже неравномерна
+        weights = [1 / rank for rank in range(1, categories + 1)]
+        category_ids = rng.choices(range(1, categories + 1), weights=weights, k=products)
+        rows = (_product(rng, number, category_id, category_groups[category_id - 1][0])
+                for number, category_id in enumerate(category_ids, start=1))
+        for batch in _batches(rows, batch_size):
+            conn.execute(product_table.insert(), batch)
+        record_opening_balances(conn, product_table, movement_table)
+
+        if indexed:
+            create_search_index(conn)
+
+    return {'users': len(user_rows), 'categories': categories, 'products': products}
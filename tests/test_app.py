@@ -5,6 +5,7 @@ import os
 import sys
 import json
 from unittest.mock import patch, MagicMock
+from sqlalchemy import event
 
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -274,7 +275,9 @@ class TestSearchFunctionality:
             response = client.get(f'/product/{product.id}')
             assert response.status_code == 200
 
-            # Check that view counter increased
+            # Check that view counter increased (after flushing the buffer)
+            from view_counter import view_counter
+            view_counter.flush()
             db.session.refresh(product)
             assert product.views_count == initial_views + 1
 
@@ -572,6 +575,2041 @@ class TestDatabaseModels:
             assert retrieved_product.category_id == category.id
 
 
+class TestFullTextSearch:
+    """Full-text search index tests"""
+
+    def login(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 2
+            session['username'] = 'user_test'
+            session['is_admin'] = False
+
+    def test_fts_search_matches_specs(self, client, test_app, init_database):
+        """Test that FTS mode searches detailed_specs case-insensitively"""
+        with test_app.app_context():
+            self.login(client)
+
+            response = client.get('/search?q=SPECIFICATIONS&mode=fts')
+            assert response.status_code == 200
+            assert 'Laptop_test' in response.get_data(as_text=True)
+            assert 'Book_test' not in response.get_data(as_text=True)
+
+    def test_fts_index_follows_edits_and_deletes(self, client, test_app, init_database):
+        """Test that the index stays in sync with product writes"""
+        with test_app.app_context():
+            self.login(client)
+
+            product = Product.query.filter_by(sku='TEST002').first()
+            product.name = 'Renamed_volume'
+            db.session.commit()
+
+            response = client.get('/search?q=volume&mode=fts')
+            assert 'Renamed_volume' in response.get_data(as_text=True)
+
+            db.session.delete(product)
+            db.session.commit()
+
+            response = client.get('/search?q=volume&mode=fts')
+            assert 'Renamed_volume' not in response.get_data(as_text=True)
+
+    def test_rebuild_search_index_command(self, test_app, init_database):
+        """Test the rebuild-search-index CLI command"""
+        runner = test_app.test_cli_runner()
+        result = runner.invoke(args=['rebuild-search-index'])
+        assert result.exit_code == 0
+        assert '2' in result.output
+
+    def test_missing_index_is_rechecked(self, test_app, tmp_path):
+        """Test that an index created by another process is picked up after the recheck interval"""
+        import search_index
+        from sqlalchemy import create_engine, text
+        engine = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, '
+                              'description TEXT, sku TEXT, detailed_specs TEXT)'))
+        assert not search_index.search_index_available(engine)
+
+        with engine.begin() as conn:
+            search_index.create_search_index(conn)
+        assert not search_index.search_index_available(engine)
+        with patch.object(search_index, 'RECHECK_INTERVAL', 0):
+            assert search_index.search_index_available(engine)
+        engine.dispose()
+
+
+class TestKeysetPagination:
+    """Cursor pagination tests"""
+
+    def login(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 2
+            session['username'] = 'user_test'
+            session['is_admin'] = False
+
+    def add_products(self):
+        # Equal prices and views to exercise tie-breaking on id
+        for i in range(5):
+            db.session.add(Product(name=f'Paged_{i}', sku=f'PAGE{i:03d}',
+                                   quantity=1, price=100.0, views_count=3))
+        db.session.commit()
+
+    def link(self, response, rel):
+        for part in response.headers.get('Link', '').split(','):
+            if f'rel="{rel}"' in part:
+                return part[part.index('<') + 1:part.index('>')]
+        return None
+
+    def walk(self, client, sort):
+        ids, url = [], f'/api/products?per_page=2&sort={sort}'
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            ids.extend(p['id'] for p in json.loads(response.get_data(as_text=True)))
+            url = self.link(response, 'next')
+        return ids
+
+    def test_api_pages_cover_catalog_for_every_sort(self, client, test_app, init_database):
+        """Test that walking next cursors returns every product exactly once"""
+        with test_app.app_context():
+            self.login(client)
+            self.add_products()
+            total = Product.query.count()
+
+            for sort in ['name', 'price_asc', 'price_desc', 'date', 'views_count']:
+                ids = self.walk(client, sort)
+                assert len(ids) == total
+                assert len(set(ids)) == total
+
+    def test_api_prev_cursor_returns_previous_page(self, client, test_app, init_database):
+        """Test navigating back with the prev cursor"""
+        with test_app.app_context():
+            self.login(client)
+            self.add_products()
+
+            first = client.get('/api/products?per_page=2&sort=price_asc')
+            second = client.get(self.link(first, 'next'))
+            back = client.get(self.link(second, 'prev'))
+
+            assert json.loads(back.get_data(as_text=True)) == json.loads(first.get_data(as_text=True))
+
+    def test_null_values_are_paged_in_both_directions(self, client, test_app, init_database):
+        """Test that cursors cross between NULL and non-NULL sort values"""
+        with test_app.app_context():
+            self.login(client)
+            self.add_products()
+            for i in range(3):
+                db.session.add(Product(name=f'Unpriced_{i}', sku=f'NOPRICE{i}', quantity=1,
+                                       price=None, views_count=None))
+            db.session.commit()
+
+            for sort, column, descending in [('price_asc', Product.price, False),
+                                             ('price_desc', Product.price, True),
+                                             ('views_count', Product.views_count, True)]:
+                order = (column.desc(), Product.id.desc()) if descending else (column, Product.id)
+                expected = [p.id for p in Product.query.order_by(*order)]
+                assert self.walk(client, sort) == expected
+
+                response = client.get(f'/api/products?per_page=2&sort={sort}')
+                while self.link(response, 'next'):
+                    response = client.get(self.link(response, 'next'))
+                backwards = [p['id'] for p in response.get_json()]
+                while self.link(response, 'prev'):
+                    response = client.get(self.link(response, 'prev'))
+                    backwards = [p['id'] for p in response.get_json()] + backwards
+                assert backwards == expected
+
+    def test_page_size_is_capped(self, client, test_app, init_database):
+        """Test that per_page cannot exceed MAX_PAGE_SIZE"""
+        with test_app.app_context():
+            self.login(client)
+            self.add_products()
+            test_app.config['MAX_PAGE_SIZE'] = 3
+            try:
+                response = client.get('/api/products?per_page=1000')
+                assert len(json.loads(response.get_data(as_text=True))) == 3
+            finally:
+                test_app.config['MAX_PAGE_SIZE'] = 200
+
+    def test_invalid_cursor(self, client, test_app, init_database):
+        """Test that a broken cursor is rejected by the API and ignored by the page"""
+        with test_app.app_context():
+            self.login(client)
+
+            assert client.get('/api/products?cursor=garbage').status_code == 400
+            assert client.get('/search?cursor=garbage').status_code == 200
+
+    def test_search_page_has_next_link(self, client, test_app, init_database):
+        """Test that the search page renders pagination links"""
+        with test_app.app_context():
+            self.login(client)
+            self.add_products()
+
+            response = client.get('/search?per_page=2&sort=name')
+            assert 'cursor=' in response.get_data(as_text=True)
+
+
+class TestQueryBudget:
+    """SQL statement budget tests for list views"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def query_count(self, client, url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return int(response.headers['X-Query-Count'])
+
+    def test_list_routes_have_constant_query_count(self, client, test_app, init_database):
+        """Test that query count does not grow with the number of products"""
+        with test_app.app_context():
+            self.login_admin(client)
+            test_app.config['QUERY_COUNT_HEADER'] = True
+            try:
+                urls = ['/search', '/search?q=test', '/admin', '/api/products']
+                # Warm up one-time lookups (e.g. search index availability)
+                for url in urls:
+                    client.get(url)
+                before = {url: self.query_count(client, url) for url in urls}
+
+                categories = Category.query.all()
+                for i in range(20):
+                    db.session.add(Product(name=f'Budget_{i}', sku=f'BUDGET{i:03d}',
+                                           quantity=1, price=10.0,
+                                           category=categories[i % len(categories)]))
+                db.session.commit()
+
+                after = {url: self.query_count(client, url) for url in urls}
+            finally:
+                test_app.config['QUERY_COUNT_HEADER'] = False
+
+            assert after == before
+            assert all(count <= 4 for count in after.values())
+
+
+class TestAdminStats:
+    """Admin dashboard statistics tests"""
+
+    def test_catalog_stats_uses_sql_aggregates(self, test_app, init_database):
+        """Test catalog_stats totals"""
+        from stats import catalog_stats
+        with test_app.app_context():
+            Product.query.filter_by(sku='TEST001').update({'views_count': 7})
+            db.session.add(Product(name='No price', sku='NOPRICE', quantity=3))
+            db.session.commit()
+
+            stats = catalog_stats(db.session, Product)
+            assert stats['total_products'] == 3
+            assert stats['total_quantity'] == 18
+            assert stats['total_value'] == 5 * 50000.0 + 10 * 1500.0
+            assert stats['total_views'] == 7
+
+    def test_admin_page_shows_stats(self, client, test_app, init_database):
+        """Test that the dashboard renders the aggregated totals"""
+        with test_app.app_context():
+            with client.session_transaction() as session:
+                session['user_id'] = 1
+                session['username'] = 'admin_test'
+                session['is_admin'] = True
+
+            response = client.get('/admin')
+            assert response.status_code == 200
+            assert '265000 ₽' in response.get_data(as_text=True)
+
+
+class TestViewCounter:
+    """Buffered view counter tests"""
+
+    def login(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 2
+            session['username'] = 'user_test'
+            session['is_admin'] = False
+
+    def test_views_are_buffered_until_flush(self, client, test_app, init_database):
+        """Test that product views are written in one batch"""
+        from view_counter import view_counter
+        with test_app.app_context():
+            self.login(client)
+            view_counter.flush()
+            product = Product.query.filter_by(sku='TEST001').first()
+
+            for _ in range(3):
+                assert client.get(f'/product/{product.id}').status_code == 200
+
+            db.session.refresh(product)
+            assert product.views_count == 0
+            assert view_counter.pending(product.id) == 3
+
+            assert view_counter.flush() == 1
+            db.session.refresh(product)
+            assert product.views_count == 3
+            assert view_counter.pending(product.id) == 0
+
+    def test_zero_interval_writes_through(self, client, test_app, init_database):
+        """Test that VIEW_COUNTER_FLUSH_INTERVAL = 0 writes every view immediately"""
+        from view_counter import view_counter
+        with test_app.app_context():
+            self.login(client)
+            product = Product.query.filter_by(sku='TEST002').first()
+
+            test_app.config['VIEW_COUNTER_FLUSH_INTERVAL'] = 0
+            try:
+                client.get(f'/product/{product.id}')
+            finally:
+                test_app.config['VIEW_COUNTER_FLUSH_INTERVAL'] = 5.0
+
+            db.session.refresh(product)
+            assert product.views_count == 1
+            assert view_counter.pending(product.id) == 0
+
+    def test_full_buffer_is_flushed_in_background(self, client, test_app, init_database):
+        """Test that a full buffer wakes the flusher thread instead of writing on the request"""
+        import threading
+        import time
+        from view_counter import view_counter
+        with test_app.app_context():
+            self.login(client)
+            view_counter.flush()
+            product = Product.query.filter_by(sku='TEST001').first()
+            writers = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                if statement.startswith('UPDATE products SET views_count'):
+                    writers.append(threading.current_thread().name)
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            test_app.config['VIEW_COUNTER_MAX_PENDING'] = 2
+            try:
+                for _ in range(2):
+                    client.get(f'/product/{product.id}')
+                deadline = time.monotonic() + 5
+                while not writers and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                test_app.config['VIEW_COUNTER_MAX_PENDING'] = 1000
+                event.remove(db.engine, 'before_cursor_execute', record)
+            assert writers == ['view-counter-flush']
+            db.session.refresh(product)
+            assert product.views_count == 2
+
+    def test_exit_flush_without_schema_logs_one_line(self, test_app, init_database, caplog):
+        """Test that the exit flush reports a missing table as a single warning"""
+        from sqlalchemy import Column, Integer, MetaData, Table
+        from view_counter import view_counter
+        missing = Table('missing_products', MetaData(), Column('id', Integer, primary_key=True),
+                        Column('views_count', Integer))
+        table = view_counter.table
+        view_counter.table = missing
+        try:
+            view_counter.increment(1)
+            with caplog.at_level('WARNING', logger='view_counter'):
+                view_counter._flush_at_exit()
+        finally:
+            view_counter.table = table
+            view_counter._pending.clear()
+        records = [r for r in caplog.records if r.name == 'view_counter']
+        assert len(records) == 1
+        assert records[0].levelname == 'WARNING' and records[0].exc_info is None
+        assert 'no such table' in records[0].getMessage()
+
+
+class TestCatalogExport:
+    """Streaming catalog export tests"""
+
+    def login(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 2
+            session['username'] = 'user_test'
+            session['is_admin'] = False
+
+    def test_ndjson_export_streams_all_products(self, client, test_app, init_database):
+        """Test NDJSON export across several batches"""
+        with test_app.app_context():
+            self.login(client)
+            for i in range(5):
+                db.session.add(Product(name=f'Export_{i}', sku=f'EXP{i:03d}', quantity=1, price=1.0))
+            db.session.commit()
+
+            test_app.config['EXPORT_BATCH_SIZE'] = 2
+            try:
+                response = client.get('/api/products/export?format=ndjson')
+                assert response.is_streamed
+                lines = response.get_data(as_text=True).splitlines()
+            finally:
+                test_app.config['EXPORT_BATCH_SIZE'] = 1000
+
+            items = [json.loads(line) for line in lines]
+            assert len(items) == 7
+            assert [item['id'] for item in items] == sorted(item['id'] for item in items)
+            assert items[0]['category'] == 'Electronics_test'
+
+    def test_csv_export(self, client, test_app, init_database):
+        """Test CSV export header and rows"""
+        with test_app.app_context():
+            self.login(client)
+
+            response = client.get('/api/products/export?format=csv')
+            assert response.content_type.startswith('text/csv')
+            lines = response.get_data(as_text=True).splitlines()
+            assert lines[0] == 'id,name,sku,quantity,price,category'
+            assert len(lines) == 3
+
+    def test_export_rejects_unknown_format(self, client, test_app, init_database):
+        """Test unsupported export format"""
+        with test_app.app_context():
+            self.login(client)
+            assert client.get('/api/products/export?format=xml').status_code == 400
+
+    def test_export_command(self, test_app, init_database):
+        """Test the export-products CLI command"""
+        runner = test_app.test_cli_runner()
+        result = runner.invoke(args=['export-products', '--format', 'csv'])
+        assert result.exit_code == 0
+        assert 'TEST002' in result.output
+
+
+class TestConditionalRequests:
+    """ETag / Last-Modified tests for catalog read endpoints"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def test_unchanged_catalog_returns_304(self, client, test_app, init_database):
+        """Test that a matching If-None-Match gets 304 without querying products"""
+        with test_app.app_context():
+            self.login_admin(client)
+
+            for url in ['/api/products', '/search?q=test']:
+                first = client.get(url)
+                assert first.status_code == 200
+                etag = first.headers['ETag']
+
+                test_app.config['QUERY_COUNT_HEADER'] = True
+                try:
+                    second = client.get(url, headers={'If-None-Match': etag})
+                finally:
+                    test_app.config['QUERY_COUNT_HEADER'] = False
+                assert second.status_code == 304
+                assert second.get_data() == b''
+                assert int(second.headers['X-Query-Count']) == 1
+
+    def test_product_write_changes_etag(self, client, test_app, init_database):
+        """Test that add/edit/delete bump the catalog version"""
+        with test_app.app_context():
+            self.login_admin(client)
+            etag = client.get('/api/products').headers['ETag']
+
+            client.post('/admin/product/add', data={
+                'name': 'Versioned', 'description': '', 'sku': 'VER001',
+                'quantity': 1, 'price': 10, 'category_id': 1
+            })
+            client.get('/admin')  # consume the flash message
+            response = client.get('/api/products', headers={'If-None-Match': etag})
+            assert response.status_code == 200
+            etag = response.headers['ETag']
+
+            product = Product.query.filter_by(sku='VER001').first()
+            client.get(f'/admin/product/delete/{product.id}')
+            client.get('/admin')  # consume the flash message
+            response = client.get('/api/products', headers={'If-None-Match': etag})
+            assert response.status_code == 200
+
+    def test_view_flush_changes_views_listings(self, client, test_app, init_database):
+        """Test that flushed views change the ETag of listings that show or sort by views"""
+        from view_counter import view_counter
+        with test_app.app_context():
+            self.login_admin(client)
+            urls = ['/search', '/api/products', '/api/products?sort=name']
+            etags = {url: client.get(url).headers['ETag'] for url in urls}
+
+            product = Product.query.filter_by(sku='TEST002').first()
+            for _ in range(3):
+                client.get(f'/product/{product.id}')
+            assert view_counter.flush() == 1
+
+            statuses = {url: client.get(url, headers={'If-None-Match': etags[url]}).status_code
+                        for url in urls}
+            assert statuses == {'/search': 200, '/api/products': 200, '/api/products?sort=name': 304}
+            # TEST002 now has the most views and leads the default ordering
+            assert client.get('/api/products').get_json()[0]['sku'] == 'TEST002'
+
+    def test_if_modified_since(self, client, test_app, init_database):
+        """Test Last-Modified based revalidation"""
+        with test_app.app_context():
+            self.login_admin(client)
+            product = Product.query.first()
+            client.post(f'/admin/product/edit/{product.id}', data={
+                'name': product.name, 'description': product.description,
+                'sku': product.sku, 'quantity': product.quantity,
+                'price': product.price, 'category_id': product.category_id
+            })
+            client.get('/admin')  # consume the flash message
+
+            response = client.get('/api/products')
+            last_modified = response.headers['Last-Modified']
+            response = client.get('/api/products', headers={'If-Modified-Since': last_modified})
+            assert response.status_code == 304
+
+
+class TestCategoryCache:
+    """In-process category cache tests"""
+
+    def test_categories_served_from_cache(self, test_app, init_database):
+        """Test that repeated reads do not hit the database"""
+        from category_cache import category_cache
+        with test_app.app_context():
+            category_cache.invalidate()
+            first = category_cache.all()
+            assert [c.name for c in first] == ['Electronics_test', 'Books_test']
+            assert category_cache.all() is first
+
+    def test_cache_invalidated_on_category_write(self, test_app, init_database):
+        """Test that committing a category change refreshes the cache"""
+        from category_cache import category_cache
+        with test_app.app_context():
+            category_cache.all()
+
+            db.session.add(Category(name='Furniture_test'))
+            db.session.commit()
+            assert 'Furniture_test' in [c.name for c in category_cache.all()]
+
+            category = Category.query.filter_by(name='Furniture_test').first()
+            category.name = 'Office_test'
+            db.session.commit()
+            assert 'Office_test' in [c.name for c in category_cache.all()]
+
+            Category.query.filter_by(name='Office_test').delete()
+            db.session.commit()
+            assert 'Office_test' not in [c.name for c in category_cache.all()]
+
+    def test_rollback_keeps_cache(self, test_app, init_database):
+        """Test that a rolled back write does not invalidate the cache"""
+        from category_cache import category_cache
+        with test_app.app_context():
+            cached = category_cache.all()
+            db.session.add(Category(name='Rolled_back'))
+            db.session.flush()
+            db.session.rollback()
+            assert category_cache.all() is cached
+
+    def test_cache_follows_catalog_version(self, test_app, init_database):
+        """Test that a Core write in another process is seen once the catalog version changes"""
+        from sqlalchemy import create_engine, text
+        from category_cache import category_cache
+        with test_app.app_context():
+            cached = category_cache.all()
+            other = create_engine(db.engine.url)
+            with other.begin() as conn:
+                conn.execute(text("UPDATE categories SET name = 'Renamed_test' "
+                                  "WHERE name = 'Books_test'"))
+                conn.execute(text("INSERT INTO catalog_version (id, version, updated_at) "
+                                  "VALUES (1, 1, CURRENT_TIMESTAMP) "
+                                  "ON CONFLICT(id) DO UPDATE SET version = version + 1"))
+            other.dispose()
+
+            assert category_cache.all() is cached
+            test_app.config['CATEGORY_CACHE_CHECK_INTERVAL'] = 0
+            try:
+                assert 'Renamed_test' in [c.name for c in category_cache.all()]
+            finally:
+                test_app.config['CATEGORY_CACHE_CHECK_INTERVAL'] = 1.0
+
+
+class TestSQLiteTuning:
+    """SQLite engine tuning tests"""
+
+    def test_pragmas_applied_to_connections(self, test_app):
+        """Test that every pooled connection gets the configured PRAGMAs"""
+        with test_app.app_context():
+            with db.engine.connect() as conn:
+                assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+                assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+                assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == \
+                    test_app.config['SQLITE_BUSY_TIMEOUT']
+
+    def test_engine_options(self):
+        """Test pool options only apply to file databases"""
+        import db_tuning
+        from config import Config
+        config = {key: getattr(Config, key) for key in db_tuning.SETTINGS}
+
+        assert db_tuning.sqlite_engine_options('sqlite:///:memory:', config) == {}
+        options = db_tuning.sqlite_engine_options('sqlite:///warehouse.db', config)
+        assert options['pool_size'] == Config.SQLITE_POOL_SIZE
+        assert options['connect_args']['timeout'] == Config.SQLITE_BUSY_TIMEOUT / 1000
+
+
+class TestBulkImport:
+    """Bulk product import tests"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def test_csv_import_upserts_and_reports_errors(self, client, test_app, init_database):
+        """Test CSV upload with new, existing and invalid rows"""
+        import io
+        with test_app.app_context():
+            self.login_admin(client)
+            csv_data = (
+                'sku,name,quantity,price,category\n'
+                'IMP001,Imported one,3,10.5,Books_test\n'
+                'TEST001,Laptop renamed,,,\n'
+                'IMP002,,1,1,\n'
+                'IMP003,Bad quantity,many,1,\n'
+                'IMP004,Unknown category,1,1,Nowhere\n'
+            )
+            test_app.config['IMPORT_BATCH_SIZE'] = 2
+            try:
+                response = client.post('/admin/products/import', data={
+                    'file': (io.BytesIO(csv_data.encode('utf-8')), 'feed.csv')
+                }, content_type='multipart/form-data')
+            finally:
+                test_app.config['IMPORT_BATCH_SIZE'] = 1000
+
+            assert response.status_code == 200
+            report = json.loads(response.get_data(as_text=True))
+            assert report['created'] == 1
+            assert report['updated'] == 1
+            assert report['failed'] == 3
+            assert [e['line'] for e in report['errors']] == [4, 5, 6]
+
+            imported = Product.query.filter_by(sku='IMP001').first()
+            assert imported.quantity == 3
+            assert imported.category.name == 'Books_test'
+            assert imported.views_count == 0
+
+            # Empty cells keep the existing values
+            laptop = Product.query.filter_by(sku='TEST001').first()
+            assert laptop.name == 'Laptop renamed'
+            assert laptop.quantity == 5
+            assert laptop.price == 50000.0
+
+    def test_import_requires_admin(self, client, test_app, init_database):
+        """Test that regular users cannot import"""
+        with test_app.app_context():
+            with client.session_transaction() as session:
+                session['user_id'] = 2
+                session['username'] = 'user_test'
+                session['is_admin'] = False
+            response = client.post('/admin/products/import')
+            assert response.status_code == 302
+
+    def test_unreadable_file_returns_400(self, client, test_app, init_database):
+        """Test that a non-UTF-8 or malformed CSV file is rejected with a JSON error"""
+        import csv
+        import io
+        with test_app.app_context():
+            self.login_admin(client)
+            for data, error in [('sku,name\nCP001,Ноутбук\n'.encode('cp1251'), 'UTF-8'),
+                                (b'sku,name\nBIG001,' + b'x' * (csv.field_size_limit() + 1), 'invalid CSV')]:
+                response = client.post('/admin/products/import', data={
+                    'file': (io.BytesIO(data), 'feed.csv')
+                }, content_type='multipart/form-data')
+                assert response.status_code == 400
+                assert error in response.get_json()['error']
+            assert Product.query.count() == 2
+
+    def test_product_without_price_renders(self, client, test_app, init_database):
+        """Test that an imported product with no price does not break the pages"""
+        import io
+        with test_app.app_context():
+            self.login_admin(client)
+            response = client.post('/admin/products/import', data={
+                'file': (io.BytesIO(b'sku,name,quantity,price\nNP001,No price,1,\n'), 'feed.csv')
+            }, content_type='multipart/form-data')
+            assert response.get_json()['created'] == 1
+            product_id = Product.query.filter_by(sku='NP001').one().id
+
+            for url in ['/search', '/admin', f'/product/{product_id}',
+                        f'/admin/product/edit/{product_id}']:
+                response = client.get(url)
+                assert response.status_code == 200, url
+            assert 'Цена не указана' in client.get('/search?q=NP001').get_data(as_text=True)
+
+    def test_ndjson_import_command(self, test_app, init_database, tmp_path):
+        """Test the import-products CLI command"""
+        path = tmp_path / 'feed.ndjson'
+        path.write_text(
+            '{"sku": "NDJ001", "name": "From NDJSON", "quantity": 7}\n'
+            'not json\n', encoding='utf-8')
+
+        runner = test_app.test_cli_runner()
+        result = runner.invoke(args=['import-products', str(path)])
+        assert result.exit_code == 0
+        assert 'Создано: 1' in result.output
+        assert 'строка 2' in result.output
+        with test_app.app_context():
+            assert Product.query.filter_by(sku='NDJ001').first().quantity == 7
+
+
+class TestPasswordHashing:
+    """Password hashing tests"""
+
+    def test_login_rehashes_outdated_hash(self, client, test_app, init_database):
+        """Test that a successful login upgrades hashes with old parameters"""
+        from werkzeug.security import generate_password_hash
+        with test_app.app_context():
+            user = User(
+                username='legacy_user',
+                email='legacy@example.com',
+                password_hash=generate_password_hash('legacypass', method='pbkdf2:sha256:1000'),
+                is_admin=False
+            )
+            db.session.add(user)
+            db.session.commit()
+
+            response = client.post('/login', data={
+                'username': 'legacy_user',
+                'password': 'legacypass'
+            })
+            assert response.status_code == 302
+
+            db.session.refresh(user)
+            assert user.password_hash.startswith('scrypt:32768:8:1$')
+
+            # The upgraded hash still verifies
+            client.get('/logout')
+            response = client.post('/login', data={
+                'username': 'legacy_user',
+                'password': 'legacypass'
+            })
+            assert response.status_code == 302
+
+    def test_needs_rehash_follows_config(self, test_app):
+        """Test needs_rehash against the configured method"""
+        from passwords import password_hasher
+        from werkzeug.security import generate_password_hash
+        with test_app.app_context():
+            current = generate_password_hash('x', method='scrypt')
+            assert not password_hasher.needs_rehash(current)
+
+            test_app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+            try:
+                assert password_hasher.needs_rehash(current)
+                assert not password_hasher.needs_rehash(
+                    generate_password_hash('x', method='pbkdf2:sha256:1000'))
+            finally:
+                test_app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+
+    def test_hashing_busy_returns_503(self, client, test_app, init_database):
+        """Test that login fails fast when the hashing queue is saturated"""
+        from passwords import password_hasher, HashingBusy
+        with test_app.app_context():
+            with patch.object(password_hasher, 'verify', side_effect=HashingBusy()):
+                response = client.post('/login', data={
+                    'username': 'admin_test',
+                    'password': 'whatever'
+                })
+            assert response.status_code == 503
+
+
+class TestPrincipalCache:
+    """Cached principal tests for admin_required"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def test_admin_check_is_cached(self, test_app, init_database):
+        """Test that a repeated lookup within the check interval runs no SQL"""
+        from principal_cache import principal_cache
+        with test_app.app_context():
+            principal_cache.clear()
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                assert principal_cache.get(1).is_admin
+                assert principal_cache.get(1).is_admin
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            assert sum('FROM users' in statement for statement in statements) == 1
+            assert len(statements) == 2
+
+    def test_admin_requests_skip_auth_queries(self, client, test_app, init_database):
+        """Test that admin requests within the check interval issue no auth queries"""
+        with test_app.app_context():
+            self.login_admin(client)
+            assert client.get('/admin').status_code == 200
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                for _ in range(3):
+                    assert client.get('/admin').status_code == 200
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            assert not [s for s in statements if 'auth_version' in s or 'FROM users' in s]
+
+    def test_role_change_takes_effect_immediately(self, client, test_app, init_database):
+        """Test that revoking admin rights invalidates the cached principal"""
+        with test_app.app_context():
+            self.login_admin(client)
+            assert client.get('/admin').status_code == 200
+
+            admin = db.session.get(User, 1)
+            admin.is_admin = False
+            db.session.commit()
+
+            assert client.get('/admin').status_code == 302
+
+    def test_deleted_user_loses_access(self, client, test_app, init_database):
+        """Test that deleting a user drops the cached principal"""
+        with test_app.app_context():
+            self.login_admin(client)
+            assert client.get('/admin').status_code == 200
+
+            db.session.delete(db.session.get(User, 1))
+            db.session.commit()
+
+            assert client.get('/admin').status_code == 302
+
+    def test_role_change_from_another_connection(self, client, test_app, init_database):
+        """Test that a role change made outside this process is seen after the check interval"""
+        from sqlalchemy import create_engine, text
+        with test_app.app_context():
+            self.login_admin(client)
+            test_app.config['PRINCIPAL_CACHE_CHECK_INTERVAL'] = 60
+            try:
+                assert client.get('/admin').status_code == 200
+
+                other = create_engine(db.engine.url)
+                with other.begin() as conn:
+                    conn.execute(text('UPDATE users SET is_admin = 0 WHERE id = 1'))
+                other.dispose()
+
+                db.session.remove()
+                assert client.get('/admin').status_code == 200
+                test_app.config['PRINCIPAL_CACHE_CHECK_INTERVAL'] = 0
+                assert client.get('/admin').status_code == 302
+            finally:
+                test_app.config['PRINCIPAL_CACHE_CHECK_INTERVAL'] = 1.0
+
+
+class TestSchemaMigrations:
+    """Explicit schema migration tests"""
+
+    def engine_for(self, tmp_path):
+        from sqlalchemy import create_engine
+        return create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+
+    def test_import_does_not_touch_database(self, tmp_path):
+        """Test that importing the app neither creates nor opens the database"""
+        import subprocess
+        db_file = tmp_path / 'untouched.db'
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_file}')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=root, env=env, check=True)
+        assert not db_file.exists()
+
+    def test_fresh_database_is_stamped(self, tmp_path):
+        """Test that a new database gets the full schema and the latest version"""
+        import migrations
+        from sqlalchemy import inspect
+        engine = self.engine_for(tmp_path)
+        assert migrations.migrate(engine, db.metadata, log=lambda _: None) == (None, migrations.HEAD)
+
+        with engine.connect() as conn:
+            assert migrations.current_version(conn) == migrations.HEAD
+            tables = inspect(conn).get_table_names()
+        assert {'users', 'products', 'catalog_version', 'products_fts', 'stock_movements'} <= set(tables)
+
+    # Schema of the first release: no version column, sort indexes, ledger or triggers
+    BASELINE_DDL = [
+        "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, "
+        "email VARCHAR(120) NOT NULL, password_hash VARCHAR(200) NOT NULL, is_admin BOOLEAN, "
+        "created_at DATETIME, PRIMARY KEY (id), UNIQUE (username), UNIQUE (email))",
+        "CREATE TABLE categories (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, "
+        "description TEXT, PRIMARY KEY (id), UNIQUE (name))",
+        "CREATE TABLE products (id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, "
+        "description TEXT, detailed_specs TEXT, sku VARCHAR(50), quantity INTEGER, price FLOAT, "
+        "category_id INTEGER, created_at DATETIME, views_count INTEGER, PRIMARY KEY (id), "
+        "UNIQUE (sku), FOREIGN KEY(category_id) REFERENCES categories (id))",
+    ]
+
+    def test_legacy_database_is_upgraded(self, tmp_path):
+        """Test that every migration upgrades a database created before migrations"""
+        import migrations
+        from sqlalchemy import inspect
+        engine = self.engine_for(tmp_path)
+        with engine.begin() as conn:
+            for statement in self.BASELINE_DDL:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql("INSERT INTO products (name, sku, quantity) "
+                                 "VALUES ('Old', 'OLD001', 4), ('Empty', 'OLD002', 0)")
+
+        messages = []
+        assert migrations.migrate(engine, db.metadata, log=messages.append) == (None, migrations.HEAD)
+        assert len(messages) == migrations.HEAD
+        with engine.begin() as conn:
+            assert migrations.current_version(conn) == migrations.HEAD
+            schema = inspect(conn)
+            tables = set(schema.get_table_names())
+            indexes = {index['name'] for index in schema.get_indexes('products')}
+            columns = {column['name'] for column in schema.get_columns('products')}
+            triggers = {row[0] for row in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+            # 1: catalog stamp and full-text index
+            assert {'catalog_version', 'products_fts'} <= tables
+            assert {'products_fts_ai', 'products_fts_ad', 'products_fts_au'} <= triggers
+            assert conn.exec_driver_sql(
+                "SELECT rowid FROM products_fts WHERE products_fts MATCH 'Empty'").all() == [(2,)]
+            # 2: sort and category indexes
+            assert {index.name for index in Product.__table__.indexes} <= indexes
+            # 3: ledger with the existing stock as its opening balance
+            assert {'stock_movements', 'stock_snapshots'} <= tables
+            assert conn.exec_driver_sql(
+                'SELECT kind, delta, quantity_after FROM stock_movements').all() == [('adjust', 4, 4)]
+            # 4: product version, existing rows start at 1
+            assert 'version' in columns
+            assert conn.exec_driver_sql('SELECT DISTINCT version FROM products').all() == [(1,)]
+            # 5: auth version bumped by user triggers
+            assert {'users_auth_version_ai', 'users_auth_version_ad',
+                    'users_auth_version_au'} <= triggers
+            stamp = conn.exec_driver_sql('SELECT version FROM auth_version').scalar()
+            conn.exec_driver_sql("INSERT INTO users (username, email, password_hash) "
+                                 "VALUES ('u', 'u@example.com', 'x')")
+            assert conn.exec_driver_sql('SELECT version FROM auth_version').scalar() == stamp + 1
+            # 6: product change log fed by triggers
+            assert {'product_changes_ai', 'product_changes_ad', 'product_changes_au'} <= triggers
+            conn.exec_driver_sql("UPDATE products SET name = 'Renamed' WHERE sku = 'OLD002'")
+            assert conn.exec_driver_sql(
+                'SELECT product_id FROM product_changes').scalars().all() == [2]
+
+    def test_repeated_migrate_is_noop(self, tmp_path):
+        """Test that migrating an up-to-date database runs no migrations"""
+        import migrations
+        engine = self.engine_for(tmp_path)
+        migrations.migrate(engine, db.metadata, log=lambda _: None)
+
+        messages = []
+        assert migrations.migrate(engine, db.metadata, log=messages.append) == \
+            (migrations.HEAD, migrations.HEAD)
+        assert len(messages) == 1 and 'актуальна' in messages[0]
+
+    def test_init_db_command_seeds(self, test_app):
+        """Test the init-db command with test data"""
+        with test_app.app_context():
+            runner = test_app.test_cli_runner()
+            result = runner.invoke(args=['init-db', '--seed'])
+            try:
+                assert result.exit_code == 0, result.output
+                assert User.query.filter_by(username='admin').first() is not None
+            finally:
+                with db.engine.begin() as conn:
+                    conn.exec_driver_sql('DROP TABLE IF EXISTS schema_version')
+
+
+class TestSyntheticData:
+    """Synthetic catalog generator tests"""
+
+    def generate(self, tmp_path, name, **kwargs):
+        import migrations
+        from sqlalchemy import create_engine
+        from app import StockMovement, StockSnapshot
+        from synthetic_data import generate_catalog
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        migrations.migrate(engine, db.metadata, log=lambda _: None)
+        generate_catalog(engine, User.__table__, Category.__table__, Product.__table__,
+                         StockMovement.__table__, StockSnapshot.__table__,
+                         users=5, categories=12, products=300, **kwargs)
+        with engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(Product.__table__.select().order_by('id'))]
+
+    def test_same_seed_same_data(self, tmp_path):
+        """Test that a run is reproducible from its seed"""
+        first = self.generate(tmp_path, 'a.db', seed=1)
+        assert first == self.generate(tmp_path, 'b.db', seed=1)
+        assert first != self.generate(tmp_path, 'c.db', seed=2)
+
+    def test_generated_catalog_is_realistic(self, tmp_path):
+        """Test SKU uniqueness, long specs and skewed view counts"""
+        products = self.generate(tmp_path, 'catalog.db', seed=3)
+        columns = Product.__table__.columns.keys()
+        rows = [dict(zip(columns, row)) for row in products]
+
+        assert len({row['sku'] for row in rows}) == len(rows)
+        assert min(len(row['detailed_specs']) for row in rows) > 200
+        views = sorted((row['views_count'] for row in rows), reverse=True)
+        # The top tenth of products collects more than half of all views
+        assert sum(views[:len(views) // 10]) > sum(views) / 2
+
+    def test_command_refuses_non_empty_database(self, test_app, init_database):
+        """Test that generate-data keeps existing data unless --replace is given"""
+        from sqlalchemy import func, select
+        from app import StockMovement
+        with test_app.app_context():
+            runner = test_app.test_cli_runner()
+            result = runner.invoke(args=['generate-data', '--products', '50'])
+            assert result.exit_code != 0
+            assert Product.query.count() == 2
+
+            result = runner.invoke(args=['generate-data', '--products', '50', '--users', '3',
+                                         '--categories', '6', '--replace'])
+            assert result.exit_code == 0, result.output
+            assert Product.query.count() == 50
+            # The old ledger is cleared, the new stock is its opening balance
+            ledger = dict(db.session.execute(
+                select(StockMovement.product_id, func.sum(StockMovement.delta))
+                .group_by(StockMovement.product_id)
+            ).all())
+            assert ledger == {p.id: p.quantity for p in Product.query if p.quantity}
+            assert User.query.filter_by(username='admin', is_admin=True).count() == 1
+
+
+class TestRequestTiming:
+    """Server-Timing header and structured request log tests"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def metrics(self, response):
+        result = {}
+        for item in response.headers['Server-Timing'].split(', '):
+            name, *params = item.split(';')
+            result[name] = dict(param.split('=', 1) for param in params)
+        return result
+
+    def test_server_timing_header(self, client, test_app, init_database):
+        """Test that wall, SQL and template time are reported"""
+        with test_app.app_context():
+            self.login_admin(client)
+            test_app.config.update(SERVER_TIMING_HEADER=True, QUERY_COUNT_HEADER=True)
+            try:
+                page = client.get('/search')
+                api = client.get('/api/products')
+            finally:
+                test_app.config.update(SERVER_TIMING_HEADER=False, QUERY_COUNT_HEADER=False)
+
+            metrics = self.metrics(page)
+            assert set(metrics) == {'app', 'db', 'tpl'}
+            assert float(metrics['app']['dur']) >= float(metrics['db']['dur'])
+            assert metrics['db']['desc'] == f'"{page.headers["X-Query-Count"]} queries"'
+            # JSON responses render no templates
+            assert 'tpl' not in self.metrics(api)
+
+    def test_structured_log(self, client, test_app, init_database, caplog):
+        """Test that each request is logged as one JSON record"""
+        import logging
+        with test_app.app_context():
+            self.login_admin(client)
+            test_app.config['REQUEST_TIMING_LOG'] = True
+            try:
+                with caplog.at_level(logging.INFO, logger='warehouse.requests'):
+                    client.get('/api/products')
+            finally:
+                test_app.config['REQUEST_TIMING_LOG'] = False
+
+            record = json.loads(caplog.records[-1].getMessage())
+            assert record['endpoint'] == 'main.api_products'
+            assert record['status'] == 200
+            assert record['sql_count'] >= 1
+            assert {'total_ms', 'sql_ms', 'template_ms'} <= set(record)
+
+    def test_disabled_by_default(self, client, test_app, init_database):
+        """Test that no timing header is added when instrumentation is off"""
+        with test_app.app_context():
+            self.login_admin(client)
+            assert 'Server-Timing' not in client.get('/api/products').headers
+
+
+class TestPrometheusMetrics:
+    """Prometheus /metrics endpoint tests"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def sample(self, name, labels=None):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    def test_request_metrics(self, client, test_app, init_database):
+        """Test per-route counters, latency histogram and query counts"""
+        labels = {'method': 'GET', 'endpoint': 'main.api_products'}
+        with test_app.app_context():
+            self.login_admin(client)
+            requests_before = self.sample('warehouse_http_requests_total', {**labels, 'status': '200'})
+            latency_before = self.sample('warehouse_http_request_duration_seconds_count', labels)
+            queries_before = self.sample('warehouse_db_queries_per_request_sum',
+                                         {'endpoint': 'main.api_products'})
+
+            for _ in range(3):
+                assert client.get('/api/products').status_code == 200
+
+            assert self.sample('warehouse_http_requests_total', {**labels, 'status': '200'}) == \
+                requests_before + 3
+            assert self.sample('warehouse_http_request_duration_seconds_count', labels) == \
+                latency_before + 3
+            assert self.sample('warehouse_db_queries_per_request_sum',
+                               {'endpoint': 'main.api_products'}) > queries_before
+            assert self.sample('warehouse_http_requests_in_progress') == 0
+
+    def test_cache_lookups(self, client, test_app, init_database):
+        """Test that principal cache hits and misses are counted"""
+        from principal_cache import principal_cache
+        hit = {'cache': 'principal', 'result': 'hit'}
+        miss = {'cache': 'principal', 'result': 'miss'}
+        with test_app.app_context():
+            principal_cache.clear()
+            hits, misses = self.sample('warehouse_cache_lookups_total', hit), \
+                self.sample('warehouse_cache_lookups_total', miss)
+            principal_cache.get(1)
+            principal_cache.get(1)
+            assert self.sample('warehouse_cache_lookups_total', miss) == misses + 1
+            assert self.sample('warehouse_cache_lookups_total', hit) == hits + 1
+
+    def test_metrics_endpoint(self, client):
+        """Test the exposition format"""
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        assert b'# TYPE warehouse_http_request_duration_seconds histogram' in response.data
+
+    def test_multiprocess_aggregation(self, tmp_path):
+        """Test that /metrics sums values written by several worker processes"""
+        import subprocess
+        metrics_dir = tmp_path / 'metrics'
+        metrics_dir.mkdir()
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(metrics_dir),
+                   DATABASE_URL=f"sqlite:///{tmp_path / 'metrics.db'}")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        worker = ('from app import app\n'
+                  'client = app.test_client()\n'
+                  'for _ in range(3): client.get("/login")\n'
+                  'print(client.get("/metrics").get_data(as_text=True))')
+
+        outputs = [subprocess.run([sys.executable, '-c', worker], cwd=root, env=env, check=True,
+                                  capture_output=True, text=True).stdout for _ in range(2)]
+
+        line = 'warehouse_http_requests_total{endpoint="main.login",method="GET",status="200"}'
+        values = [float(next(l for l in out.splitlines() if l.startswith(line)).split()[-1])
+                  for out in outputs]
+        assert values == [3.0, 6.0]
+
+
+class TestSlowQueryLog:
+    """Slow query log and full scan report tests"""
+
+    def test_full_scan_detection(self):
+        """Test that only plain table scans count as full scans"""
+        from slow_queries import full_scans
+        plan = ['SCAN products', 'SEARCH categories_1 USING INTEGER PRIMARY KEY (rowid=?)',
+                'SCAN products USING INDEX ix_products_views', 'SCAN products_fts VIRTUAL TABLE INDEX 0:M1',
+                'USE TEMP B-TREE FOR ORDER BY']
+        assert full_scans(plan) == ['products']
+
+    def test_slow_queries_are_logged_with_plan(self, client, test_app, init_database, tmp_path):
+        """Test that queries over the threshold are recorded with route, params and plan"""
+        from slow_queries import slow_query_log, full_scan_report, read_records
+        log_file = tmp_path / 'slow.ndjson'
+        with test_app.app_context():
+            with client.session_transaction() as session:
+                session['user_id'] = 1
+                session['username'] = 'admin_test'
+                session['is_admin'] = True
+            slow_query_log.clear()
+            test_app.config.update(SLOW_QUERY_THRESHOLD_MS=1e-6, SLOW_QUERY_LOG_FILE=str(log_file))
+            try:
+                # The admin dashboard summary reads the whole products table
+                client.get('/admin')
+            finally:
+                test_app.config.update(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_FILE=None)
+
+            records = [r for r in slow_query_log.records if r['route'] == 'main.admin']
+            listing = next(r for r in records if 'ORDER BY' in r['statement'])
+            assert listing['plan'] and listing['parameters']
+            assert read_records(log_file) == list(slow_query_log.records)
+            assert any(entry['route'] == 'main.admin' and entry['table'] == 'products'
+                       for entry in full_scan_report(records))
+            slow_query_log.clear()
+
+
+class TestSortIndexes:
+    """Query plan tests for product list sort and filter combinations"""
+
+    def listing_plans(self, client, test_app, url):
+        return self.fetch_with_plans(client, test_app, url)[1]
+
+    def fetch_with_plans(self, client, test_app, url):
+        from slow_queries import slow_query_log
+        slow_query_log.clear()
+        test_app.config['SLOW_QUERY_THRESHOLD_MS'] = 1e-6
+        try:
+            response = client.get(url)
+            assert response.status_code == 200
+        finally:
+            test_app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        plans = [r['plan'] for r in slow_query_log.records
+                 if 'FROM products' in r['statement'] and 'ORDER BY' in r['statement']]
+        slow_query_log.clear()
+        assert plans
+        return response.get_data(as_text=True), plans
+
+    def next_url(self, html):
+        import html as html_module
+        import re
+        match = re.search(r'href="([^"]*cursor=[^"]*)">\s*Вперед', html)
+        return html_module.unescape(match.group(1)) if match else None
+
+    def add_products(self):
+        # Several pages per category, including NULL sort values (their own keyset segment)
+        for i in range(6):
+            db.session.add(Product(name=f'Indexed_{i}', sku=f'IDX{i:03d}', quantity=1,
+                                   category_id=1 + i % 2, views_count=None if i < 2 else i,
+                                   price=10.0 * i))
+        db.session.commit()
+
+    @pytest.mark.parametrize('sort', ['name', 'price_asc', 'price_desc', 'date', 'views_count'])
+    @pytest.mark.parametrize('category', ['', '1'])
+    def test_search_uses_index(self, client, test_app, init_database, sort, category):
+        """Test that every sort, with and without a category filter, reads an index in order"""
+        from slow_queries import full_scans
+        with test_app.app_context():
+            with client.session_transaction() as session:
+                session['user_id'] = 1
+                session['username'] = 'admin_test'
+            for plan in self.listing_plans(client, test_app, f'/search?sort={sort}&category={category}'):
+                product_step = next(step for step in plan if step.startswith(('SCAN products',
+                                                                              'SEARCH products')))
+                assert 'USING INDEX ix_products_' in product_step, plan
+                if category:
+                    assert '(category_id=?)' in product_step, plan
+                assert not full_scans(plan)
+                assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+
+    @pytest.mark.parametrize('sort', ['name', 'price_asc', 'price_desc', 'date', 'views_count'])
+    @pytest.mark.parametrize('category', ['', '1'])
+    def test_cursor_pages_seek_the_index(self, client, test_app, init_database, sort, category):
+        """Test that pages after the first seek the index by the cursor, not only by category"""
+        with test_app.app_context():
+            with client.session_transaction() as session:
+                session['user_id'] = 1
+                session['username'] = 'admin_test'
+            self.add_products()
+
+            html, _ = self.fetch_with_plans(client, test_app,
+                                            f'/search?sort={sort}&category={category}&per_page=1')
+            url, pages = self.next_url(html), 0
+            while url:
+                html, plans = self.fetch_with_plans(client, test_app, url)
+                for plan in plans:
+                    product_step = next(step for step in plan if step.startswith(('SCAN products',
+                                                                                  'SEARCH products')))
+                    assert product_step.startswith('SEARCH products USING'), plan
+                    assert 'INDEX ix_products_' in product_step, plan
+                    assert '(category_id=?)' not in product_step, plan
+                    if category:
+                        assert '(category_id=? AND ' in product_step, plan
+                    assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+                url, pages = self.next_url(html), pages + 1
+            assert pages >= 3
+
+
+class TestAsyncAPI:
+    """Async JSON API (ASGI) tests"""
+
+    def get(self, client, path, **headers):
+        import asyncio
+        import httpx
+        from async_api import app as asgi_app
+        cookie = client.get_cookie('session')
+        if cookie:
+            headers['Cookie'] = f'session={cookie.value}'
+
+        async def request():
+            transport = httpx.ASGITransport(app=asgi_app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as http:
+                response = await http.get(path, headers=headers)
+            # Pooled connections are bound to the event loop, which is new on every call
+            await asgi_app.state.api.engine.dispose()
+            return response
+        return asyncio.run(request())
+
+    def login(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def test_products_mirror_sync_api(self, client, test_app, init_database):
+        """Test that the async list returns the same data as /api/products"""
+        with test_app.app_context():
+            self.login(client)
+            for sort in ('name', 'price_desc', 'views_count'):
+                expected = client.get(f'/api/products?sort={sort}').get_json()
+                response = self.get(client, f'/api/async/products?sort={sort}')
+                assert response.status_code == 200
+                assert response.json() == expected
+
+    def test_products_pagination_and_etag(self, client, test_app, init_database):
+        """Test Link cursors and conditional responses"""
+        with test_app.app_context():
+            self.login(client)
+            first = self.get(client, '/api/async/products?sort=name&per_page=1')
+            assert first.links['next']['rel'] == 'next'
+            second = self.get(client, first.links['next']['url'].replace('http://testserver', ''))
+            assert [p['name'] for p in first.json() + second.json()] == ['Book_test', 'Laptop_test']
+
+            again = self.get(client, '/api/async/products?sort=name&per_page=1',
+                             **{'If-None-Match': first.headers['ETag']})
+            assert again.status_code == 304
+
+    def test_product_and_categories(self, client, test_app, init_database):
+        """Test the detail and category endpoints"""
+        with test_app.app_context():
+            self.login(client)
+            product = Product.query.filter_by(sku='TEST001').first()
+            detail = self.get(client, f'/api/async/products/{product.id}').json()
+            assert detail['sku'] == 'TEST001' and detail['category'] == 'Electronics_test'
+            assert self.get(client, '/api/async/products/999999').status_code == 404
+
+            categories = self.get(client, '/api/async/categories').json()
+            assert {c['name']: c['product_count'] for c in categories} == \
+                {'Electronics_test': 1, 'Books_test': 1}
+
+    def test_requires_login(self, client, test_app, init_database):
+        """Test that the async API rejects requests without a Flask session"""
+        assert self.get(client, '/api/async/products').status_code == 401
+        assert self.get(client, '/api/async/categories').status_code == 401
+
+
+@pytest.fixture
+def replica(test_app, init_database, tmp_path):
+    """Second database file registered as the read replica bind"""
+    from sqlalchemy import create_engine
+    from read_replica import REPLICA_BIND, refresh_replica
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    # The app under test is created without DATABASE_REPLICA_URL, so the bind is added directly
+    engines = db._app_engines[test_app]
+    engines[REPLICA_BIND] = engine
+    refresh_replica(db.engine, engine)
+    yield engine
+    del engines[REPLICA_BIND]
+    engine.dispose()
+
+
+class TestReadReplica:
+    """Read/write routing tests with a primary and a replica database file"""
+
+    def login_admin(self, client):
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+
+    def names(self, client):
+        # Requests share the test's app context; start each one with a clean session as in production
+        db.session.remove()
+        return sorted(p['name'] for p in client.get('/api/products').get_json())
+
+    def test_get_views_read_from_replica(self, client, test_app, replica):
+        """Test that list views see the snapshot until it is refreshed"""
+        from read_replica import refresh_replica
+        with test_app.app_context():
+            self.login_admin(client)
+            db.session.add(Product(name='Primary_only', sku='PRIMARY1', quantity=1, price=1.0))
+            db.session.commit()
+
+            assert 'Primary_only' not in self.names(client)
+            refresh_replica(db.engine, replica)
+            assert 'Primary_only' in self.names(client)
+
+    def test_writes_go_to_primary(self, client, test_app, replica):
+        """Test that a mutating view writes to the primary, not the replica"""
+        from sqlalchemy import text
+        with test_app.app_context():
+            self.login_admin(client)
+            response = client.post('/admin/product/add', data={
+                'name': 'Added_product', 'description': 'd', 'sku': 'ADDED1',
+                'quantity': '1', 'price': '1.0', 'category_id': ''})
+            assert response.status_code == 302
+
+            with db.engine.connect() as conn:
+                assert conn.execute(text("SELECT count(*) FROM products WHERE sku = 'ADDED1'")).scalar() == 1
+            with replica.connect() as conn:
+                assert conn.execute(text("SELECT count(*) FROM products WHERE sku = 'ADDED1'")).scalar() == 0
+
+    def test_read_your_writes(self, client, test_app, replica):
+        """Test that the editor sees their change at once while other users read the snapshot"""
+        with test_app.app_context():
+            self.login_admin(client)
+            product = Product.query.filter_by(sku='TEST001').first()
+            form = {'name': 'Laptop_renamed', 'description': product.description, 'sku': 'TEST001',
+                    'quantity': '5', 'price': '50000.0', 'category_id': product.category_id}
+            product_id = product.id
+            response = client.post(f'/admin/product/edit/{product_id}', data=form)
+            assert response.status_code == 302
+            assert 'Laptop_renamed' in self.names(client)
+
+            other = test_app.test_client()
+            with other.session_transaction() as session:
+                session['user_id'] = 2
+                session['username'] = 'user_test'
+            assert 'Laptop_renamed' not in self.names(other)
+
+            # Once the window is over the editor reads the replica again
+            test_app.config['READ_YOUR_WRITES_SECONDS'] = 0
+            try:
+                client.post(f'/admin/product/edit/{product_id}', data=form)
+                assert 'Laptop_renamed' not in self.names(client)
+            finally:
+                test_app.config['READ_YOUR_WRITES_SECONDS'] = 10
+
+    def test_statement_writes_open_the_window(self, client, test_app, replica):
+        """Test that UPDATE statements without a flush also count as writes"""
+        import io
+        from app import CatalogVersion
+        from catalog_version import bump_version
+        with test_app.app_context():
+            self.login_admin(client)
+            # With the version row in place the import view never flushes the session
+            bump_version(db.session, CatalogVersion)
+            db.session.commit()
+            db.session.remove()
+
+            response = client.post('/admin/products/import', data={
+                'file': (io.BytesIO(b'sku,name,quantity,price\nIMP001,Imported_one,1,1\n'), 'feed.csv')
+            }, content_type='multipart/form-data')
+            assert response.status_code == 200
+            assert 'Imported_one' in self.names(client)
+
+    def test_periodic_refresh(self, client, test_app, replica):
+        """Test the refresh loop used by refresh-replica --every"""
+        import threading
+        from read_replica import refresh_periodically
+        with test_app.app_context():
+            self.login_admin(client)
+            db.session.add(Product(name='Refreshed', sku='REFRESH1', quantity=1, price=1.0))
+            db.session.commit()
+
+            stop = threading.Event()
+            thread = threading.Thread(target=refresh_periodically,
+                                      args=(db.engine, replica, 0.01, stop))
+            thread.start()
+            try:
+                for _ in range(200):
+                    if 'Refreshed' in self.names(client):
+                        break
+                    stop.wait(0.01)
+            finally:
+                stop.set()
+                thread.join()
+            assert 'Refreshed' in self.names(client)
+
+
+class TestStockLedger:
+    """Stock movement ledger tests"""
+
+    def admin_client(self, test_app):
+        client = test_app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+        return client
+
+    def laptop_id(self):
+        return Product.query.filter_by(sku='TEST001').first().id
+
+    def quantity(self, product_id):
+        db.session.remove()
+        return db.session.get(Product, product_id).quantity
+
+    def test_movements_update_stock_and_ledger(self, test_app, init_database):
+        """Test receive/ship/adjust and the ledger they leave"""
+        from app import StockMovement
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product_id = self.laptop_id()
+            url = f'/api/products/{product_id}/stock'
+
+            response = client.post(f'{url}/receive', json={'quantity': 7, 'reason': 'Delivery 17'})
+            assert response.status_code == 201
+            assert response.get_json()['quantity_after'] == 12
+            assert client.post(f'{url}/ship', json={'quantity': 4}).get_json()['delta'] == -4
+            assert client.post(f'{url}/adjust', json={'quantity': -1}).get_json()['quantity_after'] == 7
+
+            assert self.quantity(product_id) == 7
+            ledger = StockMovement.query.filter_by(product_id=product_id).order_by(StockMovement.id).all()
+            # The fixture's stock of 5 is the opening balance
+            assert [(m.kind, m.delta, m.quantity_after) for m in ledger] == \
+                [('adjust', 5, 5), ('receive', 7, 12), ('ship', -4, 8), ('adjust', -1, 7)]
+            assert ledger[1].reason == 'Delivery 17' and ledger[1].user_id == 1
+
+            data = client.get(url).get_json()
+            assert data['quantity'] == 7
+            assert [m['delta'] for m in data['movements']] == [-1, -4, 7, 5]
+
+    def test_invalid_movements_are_rejected(self, test_app, init_database):
+        """Test overshipping, bad quantities, unknown products and permissions"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product_id = self.laptop_id()
+            url = f'/api/products/{product_id}/stock'
+
+            response = client.post(f'{url}/ship', json={'quantity': 6})
+            assert response.status_code == 409
+            assert response.get_json() == {'error': 'insufficient stock', 'available': 5}
+            assert client.post(f'{url}/ship', json={'quantity': 0}).status_code == 400
+            assert client.post(f'{url}/receive', json={'quantity': '3'}).status_code == 400
+            assert client.post(f'{url}/adjust', json={'quantity': 0}).status_code == 400
+            assert client.post(f'{url}/steal', json={'quantity': 1}).status_code == 404
+            assert client.post('/api/products/9999/stock/receive', json={'quantity': 1}).status_code == 404
+            assert self.quantity(product_id) == 5
+
+            with client.session_transaction() as session:
+                session['user_id'] = 2
+                session['is_admin'] = False
+            assert client.post(f'{url}/receive', json={'quantity': 1}).status_code == 302
+
+    def test_concurrent_movements_are_not_lost(self, test_app, init_database):
+        """Test that many threads moving stock at once lose no updates"""
+        import threading
+        from app import StockMovement
+        with test_app.app_context():
+            product_id = self.laptop_id()
+        url = f'/api/products/{product_id}/stock'
+        threads_count, rounds = 16, 5
+        statuses = []
+        lock = threading.Lock()
+        start = threading.Barrier(threads_count)
+
+        def clerk():
+            client = self.admin_client(test_app)
+            start.wait()
+            for _ in range(rounds):
+                for kind in ('receive', 'ship'):
+                    status = client.post(f'{url}/{kind}', json={'quantity': 1}).status_code
+                    with lock:
+                        statuses.append(status)
+
+        threads = [threading.Thread(target=clerk) for _ in range(threads_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert statuses == [201] * (threads_count * rounds * 2)
+        with test_app.app_context():
+            assert self.quantity(product_id) == 5
+            ledger = (StockMovement.query.filter_by(product_id=product_id)
+                      .order_by(StockMovement.id).all())
+            assert len(ledger) == threads_count * rounds * 2 + 1
+            # Each movement starts from the stock left by the previous one
+            level = 0
+            for movement in ledger:
+                level += movement.delta
+                assert movement.quantity_after == level
+
+    def test_concurrent_shipments_never_oversell(self, test_app, init_database):
+        """Test that racing shipments cannot take stock below zero"""
+        import threading
+        with test_app.app_context():
+            product_id = self.laptop_id()
+        statuses = []
+        lock = threading.Lock()
+        start = threading.Barrier(12)
+
+        def clerk():
+            client = self.admin_client(test_app)
+            start.wait()
+            status = client.post(f'/api/products/{product_id}/stock/ship',
+                                 json={'quantity': 1}).status_code
+            with lock:
+                statuses.append(status)
+
+        threads = [threading.Thread(target=clerk) for _ in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(statuses) == [201] * 5 + [409] * 7
+        with test_app.app_context():
+            assert self.quantity(product_id) == 0
+
+    def test_snapshot_and_stock_at_date(self, test_app, init_database):
+        """Test the stock-snapshot command and the stock level at a past date"""
+        from datetime import datetime
+        from app import StockMovement, StockSnapshot
+        from stock import stock_level
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product_id = self.laptop_id()
+            url = f'/api/products/{product_id}/stock'
+
+            result = test_app.test_cli_runner().invoke(args=['stock-snapshot'])
+            assert result.exit_code == 0, result.output
+            assert StockSnapshot.query.count() == 2
+
+            client.post(f'{url}/receive', json={'quantity': 10})
+            between = datetime.utcnow()
+            client.post(f'{url}/ship', json={'quantity': 3})
+
+            assert stock_level(db.session, StockMovement, StockSnapshot, product_id) == 12
+            assert client.get(f'{url}?at={between.isoformat()}').get_json()['quantity'] == 15
+            assert client.get(f'{url}?at=yesterday').status_code == 400
+
+    def test_edit_form_keeps_concurrent_movements(self, test_app, init_database):
+        """Test that saving the edit form applies a delta instead of overwriting stock"""
+        from app import StockMovement
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product = Product.query.filter_by(sku='TEST001').first()
+            form = {
+                'name': product.name,
+                'description': product.description,
+                'detailed_specs': product.detailed_specs,
+                'sku': product.sku,
+                'quantity': 15,
+                'shown_quantity': 5,
+                'price': product.price,
+                'category_id': product.category_id,
+            }
+            product_id = product.id
+            assert b'name="shown_quantity" value="5"' in client.get(f'/admin/product/edit/{product_id}').data
+
+            # Another clerk ships 2 while the form is open
+            client.post(f'/api/products/{product_id}/stock/ship', json={'quantity': 2})
+            client.post(f'/admin/product/edit/{product_id}', data=form)
+
+            assert self.quantity(product_id) == 13
+            last = StockMovement.query.order_by(StockMovement.id.desc()).first()
+            assert (last.kind, last.delta) == ('adjust', 10)
+
+    def test_new_product_rejects_negative_stock(self, test_app, init_database):
+        """Test that a negative opening quantity adds nothing and leaves the session usable"""
+        from app import StockMovement
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            form = {'name': 'Cable', 'description': '', 'sku': 'CAB001', 'quantity': -3,
+                    'price': 10, 'category_id': 1}
+            response = client.post('/admin/product/add', data=form, follow_redirects=True)
+            assert 'Количество не может быть отрицательным' in response.get_data(as_text=True)
+            # Same session as the request: nothing half-added may be left in it
+            assert Product.query.filter_by(sku='CAB001').first() is None
+
+            client.post('/admin/product/add', data=dict(form, quantity=3))
+            product = Product.query.filter_by(sku='CAB001').one()
+            assert product.quantity == 3
+            assert [m.delta for m in StockMovement.query.filter_by(product_id=product.id)] == [3]
+
+    def test_ledger_matches_stock_after_import_and_ship(self, test_app, init_database):
+        """Test that the stock from the ledger equals products.quantity"""
+        import io
+        from datetime import datetime
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+
+            def assert_ledger_matches():
+                now = datetime.utcnow().isoformat()
+                db.session.remove()
+                for product in Product.query.all():
+                    data = client.get(f'/api/products/{product.id}/stock?at={now}').get_json()
+                    assert data['quantity'] == product.quantity, product.sku
+
+            assert_ledger_matches()
+            feed = 'sku,name,quantity,price\nTEST001,Laptop,99,\nTEST002,Mouse,,1\nNEW001,Cable,7,\n'
+            response = client.post('/admin/products/import', data={
+                'file': (io.BytesIO(feed.encode()), 'feed.csv')
+            }, content_type='multipart/form-data')
+            assert response.get_json()['failed'] == 0
+            assert_ledger_matches()
+
+            product_id = self.laptop_id()
+            client.post(f'/api/products/{product_id}/stock/ship', json={'quantity': 5})
+            assert self.quantity(product_id) == 94
+            assert_ledger_matches()
+
+
+class TestOptimisticConcurrency:
+    """Product version and compare-and-swap tests"""
+
+    def admin_client(self, test_app):
+        client = test_app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+        return client
+
+    def laptop(self):
+        db.session.remove()
+        return Product.query.filter_by(sku='TEST001').first()
+
+    def form(self, product, **changes):
+        form = {
+            'name': product.name,
+            'description': product.description,
+            'detailed_specs': product.detailed_specs,
+            'sku': product.sku,
+            'quantity': product.quantity,
+            'shown_quantity': product.quantity,
+            'price': product.price,
+            'category_id': product.category_id,
+            'version': product.version,
+        }
+        form.update(changes)
+        return form
+
+    def test_stale_form_gets_conflict(self, test_app, init_database):
+        """Test that the second of two editors holding the same version is rejected"""
+        with test_app.app_context():
+            first, second = self.admin_client(test_app), self.admin_client(test_app)
+            product = self.laptop()
+            assert product.version == 1
+            assert b'name="version" value="1"' in first.get(f'/admin/product/edit/{product.id}').data
+            form_first = self.form(product, name='Renamed by first')
+            form_second = self.form(product, price=1.0)
+
+            assert first.post(f'/admin/product/edit/{product.id}', data=form_first).status_code == 302
+            response = second.post(f'/admin/product/edit/{product.id}', data=form_second)
+            assert response.status_code == 409
+            assert 'другой пользователь' in response.get_data(as_text=True)
+            # The conflict page shows the current data and version
+            assert b'name="version" value="2"' in response.data
+
+            product = self.laptop()
+            assert (product.name, product.price, product.version) == ('Renamed by first', 50000.0, 2)
+
+    def test_api_update_checks_version(self, test_app, init_database):
+        """Test PATCH /api/products/<id> with current, stale and missing versions"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product_id = self.laptop().id
+            url = f'/api/products/{product_id}'
+
+            response = client.patch(url, json={'version': 1, 'price': 45000})
+            assert response.status_code == 200
+            assert (response.get_json()['price'], response.get_json()['version']) == (45000.0, 2)
+
+            response = client.patch(url, json={'version': 1, 'name': 'Stale'})
+            assert response.status_code == 409
+            assert response.get_json() == {'error': 'version conflict', 'version': 2}
+            assert client.patch(url, json={'price': 1}).status_code == 428
+            assert client.patch(url, json={'version': 2, 'quantity': 1}).status_code == 400
+            assert client.patch(url, json={'version': 2, 'price': -1}).status_code == 400
+            assert client.patch(url, json={'version': 2, 'category_id': 999}).status_code == 400
+            assert client.patch(url, json={'version': 2, 'sku': 'TEST002'}).status_code == 400
+            assert client.patch('/api/products/9999', json={'version': 1}).status_code == 404
+
+            product = self.laptop()
+            assert (product.name, product.price, product.version) == ('Laptop_test', 45000.0, 2)
+
+    def test_other_writers_and_version(self, test_app, init_database):
+        """Test that imports bump the version and stock movements do not"""
+        import io
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            product_id = self.laptop().id
+            client.post(f'/api/products/{product_id}/stock/receive', json={'quantity': 3})
+            assert self.laptop().version == 1
+
+            client.post('/admin/products/import', data={
+                'file': (io.BytesIO(b'sku,name\nTEST001,Imported laptop\n'), 'feed.csv')
+            }, content_type='multipart/form-data')
+            product = self.laptop()
+            assert (product.name, product.quantity, product.version) == ('Imported laptop', 8, 2)
+            assert client.patch(f'/api/products/{product_id}',
+                                json={'version': 1, 'price': 1}).status_code == 409
+
+    def test_migration_adds_version_column(self, tmp_path):
+        """Test that migrating a database without the column backfills version 1"""
+        import migrations
+        from sqlalchemy import create_engine
+        from sqlalchemy.schema import CreateTable
+        engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+        with engine.begin() as conn:
+            conn.execute(CreateTable(Product.__table__))
+            conn.exec_driver_sql('ALTER TABLE products DROP COLUMN version')
+            conn.exec_driver_sql("INSERT INTO products (id, name, sku) VALUES (1, 'Old', 'OLD1')")
+
+        migrations.migrate(engine, db.metadata, log=lambda _: None)
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql('SELECT version FROM products').scalar() == 1
+
+
+class TestBatchUpdate:
+    """Batch price/quantity update API tests"""
+
+    def admin_client(self, test_app):
+        client = test_app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+        return client
+
+    def products(self):
+        db.session.remove()
+        return {p.sku: p for p in Product.query.all()}
+
+    def test_batch_reports_each_item(self, test_app, init_database):
+        """Test a mixed batch: updates, no-ops, conflicts, unknown and invalid items"""
+        from app import StockMovement
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            laptop_id = self.products()['TEST001'].id
+            response = client.post('/api/products/batch', json={'items': [
+                {'id': laptop_id, 'price': 45000, 'quantity': 8, 'version': 1},
+                {'sku': 'TEST002', 'price': 1500.0, 'quantity': 10},
+                {'sku': 'NOPE'},
+                {'sku': 'NOPE', 'price': 1},
+                {'sku': 'TEST001', 'quantity': 1},
+                {'id': laptop_id, 'price': -5},
+                'not an object',
+            ]})
+            assert response.status_code == 200
+            report = response.get_json()
+            assert [r['status'] for r in report['results']] == [
+                'updated', 'unchanged', 'invalid', 'not_found', 'invalid', 'invalid', 'invalid']
+            assert (report['updated'], report['unchanged'], report['failed']) == (1, 1, 5)
+            assert report['results'][0] == {'index': 0, 'status': 'updated', 'id': laptop_id,
+                                            'sku': 'TEST001', 'version': 2, 'price': 45000.0,
+                                            'quantity': 8}
+            assert 'already in this batch' in report['results'][4]['error']
+
+            products = self.products()
+            assert (products['TEST001'].price, products['TEST001'].quantity,
+                    products['TEST001'].version) == (45000.0, 8, 2)
+            assert (products['TEST002'].price, products['TEST002'].version) == (1500.0, 1)
+            movement = StockMovement.query.filter_by(reason='Пакетное обновление').one()
+            assert (movement.product_id, movement.kind, movement.delta,
+                    movement.quantity_after) == (laptop_id, 'adjust', 3, 8)
+
+            # A stale version is reported per item and leaves the product untouched
+            response = client.post('/api/products/batch', json=[
+                {'sku': 'TEST001', 'price': 1, 'version': 1},
+                {'sku': 'TEST002', 'quantity': 0},
+            ])
+            results = response.get_json()['results']
+            assert results[0] == {'index': 0, 'status': 'conflict', 'id': laptop_id, 'sku': 'TEST001',
+                                  'error': 'version conflict', 'version': 2}
+            assert results[1]['status'] == 'updated'
+            products = self.products()
+            assert products['TEST001'].price == 45000.0 and products['TEST002'].quantity == 0
+
+    def test_batch_uses_constant_number_of_statements(self, test_app, init_database):
+        """Test that statement count does not grow with the batch size"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            db.session.add_all([Product(name=f'Batch_{i}', sku=f'BATCH{i:04d}', quantity=1, price=1.0)
+                                for i in range(300)])
+            db.session.commit()
+
+            def statements(count):
+                items = [{'sku': f'BATCH{i:04d}', 'price': 2.0 + count, 'quantity': 2 + count}
+                         for i in range(count)]
+                response = client.post('/api/products/batch', json=items)
+                assert response.get_json()['updated'] == count
+                return int(response.headers['X-Query-Count'])
+
+            test_app.config['QUERY_COUNT_HEADER'] = True
+            try:
+                statements(5)  # warm up the principal cache and the catalog version row
+                assert statements(10) == statements(300) <= 6
+            finally:
+                test_app.config['QUERY_COUNT_HEADER'] = False
+            assert {p.price for p in Product.query.filter(Product.sku.like('BATCH%'))} == {302.0}
+
+    def test_batch_request_errors(self, test_app, init_database):
+        """Test malformed bodies, the size limit and permissions"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            assert client.post('/api/products/batch', json={'items': 'x'}).status_code == 400
+            assert client.post('/api/products/batch', data='not json').status_code == 400
+            test_app.config['BATCH_UPDATE_MAX_ITEMS'] = 2
+            try:
+                response = client.post('/api/products/batch', json=[{'sku': 'TEST001', 'price': 1}] * 3)
+                assert response.status_code == 413
+            finally:
+                test_app.config['BATCH_UPDATE_MAX_ITEMS'] = 10000
+
+            with client.session_transaction() as session:
+                session['user_id'] = 2
+                session['is_admin'] = False
+            assert client.post('/api/products/batch', json=[]).status_code == 302
+
+
+class TestAutocomplete:
+    """In-memory prefix index tests"""
+
+    def admin_client(self, test_app):
+        from autocomplete import autocomplete_index
+        # The index outlives the per-test database, start from scratch
+        autocomplete_index.invalidate()
+        client = test_app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin_test'
+            session['is_admin'] = True
+        return client
+
+    def suggest(self, client, q, **params):
+        response = client.get('/api/products/autocomplete', query_string={'q': q, **params})
+        assert response.status_code == 200
+        return [item['sku'] for item in response.get_json()]
+
+    def test_prefixes_ranked_by_views(self, test_app, init_database):
+        """Test name word and SKU prefixes, ranking and limits"""
+        with test_app.app_context():
+            categories = Category.query.all()
+            db.session.add_all([
+                Product(name='Laptop stand', sku='STAND1', price=1.0, views_count=50,
+                        category=categories[0]),
+                Product(name='Gaming laptop', sku='GAME1', price=1.0, views_count=7),
+                Product(name='Notebook', sku='NB-1', price=1.0, views_count=100),
+            ])
+            db.session.commit()
+            client = self.admin_client(test_app)
+
+            assert self.suggest(client, 'LAP') == ['STAND1', 'GAME1', 'TEST001']
+            assert self.suggest(client, 'lap', limit=1) == ['STAND1']
+            assert self.suggest(client, 'test00') == ['TEST001', 'TEST002']
+            assert self.suggest(client, 'nb-') == ['NB-1']
+            assert self.suggest(client, 'ook') == []
+            assert self.suggest(client, '   ') == []
+            item = client.get('/api/products/autocomplete?q=note').get_json()[0]
+            assert item == {'id': item['id'], 'name': 'Notebook', 'sku': 'NB-1', 'views_count': 100}
+
+            with client.session_transaction() as session:
+                session.clear()
+            assert client.get('/api/products/autocomplete?q=lap').status_code == 302
+
+    def test_index_follows_product_writes(self, test_app, init_database):
+        """Test that adds, renames and deletes reach the index"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 0
+            try:
+                assert self.suggest(client, 'lapt') == ['TEST001']
+                product_id = Product.query.filter_by(sku='TEST001').first().id
+
+                client.patch(f'/api/products/{product_id}', json={'version': 1, 'name': 'Ultrabook'})
+                assert self.suggest(client, 'lapt') == []
+                assert self.suggest(client, 'ultra') == ['TEST001']
+
+                client.post('/admin/product/add', data={
+                    'name': 'Ultra monitor', 'description': 'd', 'sku': 'MON1',
+                    'quantity': '1', 'price': '1.0', 'category_id': ''})
+                assert sorted(self.suggest(client, 'ultra')) == ['MON1', 'TEST001']
+
+                client.get(f'/admin/product/delete/{product_id}')
+                assert self.suggest(client, 'ultra') == ['MON1']
+            finally:
+                test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 1.0
+
+    def test_refresh_reads_only_renamed_products(self, test_app, init_database):
+        """Test that stock, price and view writes leave the index alone and renames are read by id"""
+        from sqlalchemy import create_engine, text
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 0
+            product_reads = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                if 'FROM products' in statement:
+                    product_reads.append(statement)
+
+            # Another process writes through its own connection
+            other = create_engine(db.engine.url)
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                assert self.suggest(client, 'lapt') == ['TEST001']
+                product_id = Product.query.filter_by(sku='TEST001').first().id
+                client.post(f'/api/products/{product_id}/stock/ship', json={'quantity': 1})
+                with other.begin() as conn:
+                    conn.execute(text('UPDATE products SET price = 1, views_count = 9'))
+                db.session.remove()
+                product_reads.clear()
+                assert self.suggest(client, 'lapt') == ['TEST001']
+                assert product_reads == []
+
+                with other.begin() as conn:
+                    conn.execute(text("UPDATE products SET name = 'Ultrabook' WHERE sku = 'TEST001'"))
+                assert self.suggest(client, 'ultra') == ['TEST001']
+                assert len(product_reads) == 1 and 'products.id IN' in product_reads[0]
+
+                # A worker that fell behind the trimmed log rebuilds the whole index
+                with other.begin() as conn:
+                    conn.execute(text("UPDATE products SET name = 'Netbook' WHERE sku = 'TEST001'"))
+                    conn.execute(text("UPDATE products SET name = 'Desk mouse' WHERE sku = 'TEST002'"))
+                    conn.execute(text('DELETE FROM product_changes WHERE seq < (SELECT max(seq) FROM product_changes)'))
+                product_reads.clear()
+                assert self.suggest(client, 'net') == ['TEST001']
+                assert self.suggest(client, 'desk') == ['TEST002']
+                assert len(product_reads) == 1 and 'IN' not in product_reads[0]
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+                other.dispose()
+                test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 1.0
+
+    def test_index_without_change_log(self, test_app, init_database):
+        """Test that other dialects rebuild the index on the refresh interval"""
+        with test_app.app_context():
+            client = self.admin_client(test_app)
+            # Other dialects get neither the change log nor its triggers
+            with db.engine.begin() as conn:
+                for suffix in ('ai', 'ad', 'au'):
+                    conn.exec_driver_sql(f'DROP TRIGGER product_changes_{suffix}')
+                conn.exec_driver_sql('DROP TABLE product_changes')
+            with patch.object(db.engine.dialect, 'name', 'postgresql'):
+                assert self.suggest(client, 'lapt') == ['TEST001']
+                product = Product.query.filter_by(sku='TEST001').first()
+                product.name = 'Ultrabook'
+                db.session.commit()
+                assert self.suggest(client, 'ultra') == []
+
+                test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 0
+                test_app.config['AUTOCOMPLETE_REFRESH_INTERVAL'] = 0
+                try:
+                    assert self.suggest(client, 'ultra') == ['TEST001']
+                finally:
+                    test_app.config['AUTOCOMPLETE_CHECK_INTERVAL'] = 1.0
+                    test_app.config['AUTOCOMPLETE_REFRESH_INTERVAL'] = 60
+
+    def test_lookups_skip_the_database(self, test_app, init_database):
+        """Test that warm lookups run no SQL and take well under a millisecond"""
+        import time
+        from autocomplete import autocomplete_index
+        with test_app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(Product.__table__.insert(), [
+                    {'name': f'Item {i % 97} model {i}', 'sku': f'SKU{i:05d}', 'price': 1.0,
+                     'views_count': i % 1000} for i in range(5000)])
+            client = self.admin_client(test_app)
+            test_app.config['QUERY_COUNT_HEADER'] = True
+            try:
+                client.get('/api/products/autocomplete?q=item')  # builds the index
+                response = client.get('/api/products/autocomplete?q=model 12')
+                assert response.headers['X-Query-Count'] == '0'
+            finally:
+                test_app.config['QUERY_COUNT_HEADER'] = False
+
+            prefixes = [f'sku{i:03d}' for i in range(500)] + [f'model {i}' for i in range(500)]
+            started = time.perf_counter()
+            for prefix in prefixes:
+                autocomplete_index.complete(prefix, 10)
+            assert (time.perf_counter() - started) / len(prefixes) < 0.001
+
 if __name__ == '__main__':
     # Run tests
     pytest.main(['-v', '--tb=short', 'test_app.py'])
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Отложенная запись счетчиков просмотров товаров
+
+Просмотры копятся в памяти процесса и периодически записываются в БД
+одной транзакцией вида UPDATE ... SET views_count = views_count + n.
+Запись делает фоновый поток: раз в интервал или раньше, если буфер
+переполнился, — поток запроса базу не ждет. Остаток буфера пишется при
+завершении процесса.
+В той же транзакции увеличивается версия просмотров (catalog_version,
+VIEWS_STAMP_ID), по которой меняется ETag списков с просмотрами.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from catalog_version import VIEWS_STAMP_ID, bump_version
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Буфер просмотров с фоновым сбросом в базу"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._pid = None
+        self._thread = None
+        self._wake = threading.Event()  # буфер переполнился, пора писать
+        self._last_flush = time.monotonic()
+        self.app = None
+        self.db = None
+        self.table = None
+        self.stamp_model = None
+
+    def init_app(self, app, db, table, stamp_model):
+        # 0 — писать каждый просмотр сразу (максимальная надежность)
+        app.config.setdefault('VIEW_COUNTER_FLUSH_INTERVAL', 5.0)
+        # Сбрасывать раньше срока, если накопилось столько просмотров
+        app.config.setdefault('VIEW_COUNTER_MAX_PENDING', 1000)
+        if self.app is None:
+            atexit.register(self._flush_at_exit)
+        self.app = app
+        self.db = db
+        self.table = table
+        self.stamp_model = stamp_model
+
+    @property
+    def interval(self):
+        return float(self.app.config['VIEW_COUNTER_FLUSH_INTERVAL'])
+
+    def increment(self, product_id, n=1):
+        """Учитывает просмотр товара"""
+        self._check_fork()
+        with self._lock:
+            self._pending[product_id] += n
+            total = sum(self._pending.values())
+
+        if self.interval <= 0:
+            self.flush()
+            return
+        self._ensure_thread()
+        if total >= self.app.config['VIEW_COUNTER_MAX_PENDING']:
+            self._wake.set()
+
+    def pending(self, product_id):
+        """Просмотры товара, еще не записанные в базу"""
+        with self._lock:
+            return self._pending.get(product_id, 0)
+
+    def flush(self):
+        """Записывает накопленные просмотры; возвращает число обновленных товаров"""
+        try:
+            return self._write()
+        except Exception:
+            logger.exception('Не удалось записать счетчики просмотров')
+            return 0
+
+    def _flush_at_exit(self):
+        # Схему могли уже удалить (тесты, пересоздание базы): трассировка тут не нужна
+        try:
+            self._write()
+        except SQLAlchemyError as e:
+            logger.warning('Просмотры не записаны при завершении процесса: %s',
+                           getattr(e, 'orig', None) or e)
+
+    def _write(self):
+        """Записывает буфер одной транзакцией; при ошибке возвращает просмотры в буфер"""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not batch or self.app is None:
+            return 0
+
+        t = self.table
+        statement = (update(t)
+                     .where(t.c.id == bindparam('product_id'))
+                     .values(views_count=func.coalesce(t.c.views_count, 0) + bindparam('n')))
+        params = [{'product_id': pid, 'n': n} for pid, n in batch.items()]
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    conn.execute(statement, params)
+                    bump_version(conn, self.stamp_model, VIEWS_STAMP_ID)
+        except Exception:
+            # Возвращаем просмотры в буфер, чтобы записать их при следующем сбросе
+            with self._lock:
+                self._pending.update(batch)
+            raise
+        return len(params)
+
+    def _check_fork(self):
+        # После fork (gunicorn) поток и буфер родителя в дочернем процессе не нужны
+        if self._pid != os.getpid():
+            with self._lock:
+                self._pid = os.getpid()
+                self._pending = Counter()
+                self._thread = None
+                self._wake = threading.Event()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='view-counter-flush',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            woken = self._wake.wait(max(self.interval, 0.1))
+            self._wake.clear()
+            if woken or (self.interval > 0 and time.monotonic() - self._last_flush >= self.interval):
+                self.flush()
+
+
+view_counter = ViewCounter()